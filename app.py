@@ -1,22 +1,29 @@
 import streamlit as st
 import os
-import subprocess
 import fitz
-from llm_api import get_summary, ask_question, setup_llm_api, setup_vlm_api
+from llm_api import get_summary_stream, ask_question_stream, setup_llm_api, setup_vlm_api
+from real_llm_api import llm_cache_stats
+from image_dedup import description_cache_stats
 import re
 import gc
-from text_util import text_chunking
+import shutil
+import threading
 from langchain_text_splitters import MarkdownHeaderTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-from pdf_parser import  describe_image_with_qwen
-from pdf_parser_ocr import PDFParser
+from embedding_registry import warm_up, memory_report
+from vector_index import is_indexed, delete_document, document_size
+from parse_worker import ParseWorkerPool, count_pages
+from ingest import PAGES_PER_JOB, PIPELINE_CONFIG, get_ingest, start_ingest
+from parse_cache import ParseCache, hash_pdf, make_cache_key, DEFAULT_MAX_BYTES
+import tracing
 
 os.environ['HTTP_PROXY'] = 'http://127.0.0.1:7890'
 os.environ['HTTPS_PROXY'] = 'http://127.0.0.1:7890'
 
 st.set_page_config(page_title="PDF智能解读", layout="wide")
 
+# 每个入库任务在自己的工作目录（按缓存键）下写 pages/ 和 imgs/，多份文档、多个会话互不干扰
+WORK_ROOT = os.environ.get('INGEST_WORK_ROOT', './ingest_work')
+
 
 
 def highlight_text(text, keywords):
@@ -27,6 +34,112 @@ def highlight_text(text, keywords):
             highlighted = highlighted.replace(keyword, f"**{keyword}**")
     return highlighted
 
+@st.cache_resource
+def get_parse_cache():
+    """进程内共享的解析缓存"""
+    max_bytes = int(os.environ.get('PARSE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+    return ParseCache(max_bytes=max_bytes, on_evict=delete_document, external_size=document_size)
+
+@st.cache_resource
+def get_parse_pool():
+    """常驻的PPStructureV3解析进程池，所有会话共享，避免每次上传都重新加载模型"""
+    return ParseWorkerPool(num_workers=int(os.environ.get('PARSE_WORKERS', 1)))
+
+@st.cache_resource
+def start_embedding_warm_up():
+    """服务启动时在后台预加载向量模型，提问时不再包含模型加载时间"""
+    thread = threading.Thread(target=warm_up, daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_resource
+def start_metrics_server():
+    """设置了 METRICS_PORT 时在后台提供 Prometheus 文本格式的 /metrics"""
+    port = os.environ.get('METRICS_PORT')
+    return tracing.start_metrics_server(int(port)) if port else None
+
+def show_timing_panel(limit=5):
+    """侧边栏折叠面板：最近几条调用链中各阶段的耗时"""
+    with st.expander("⏱️ 耗时明细"):
+        if not tracing.enabled():
+            st.caption("设置环境变量 TRACING=1 后记录各阶段耗时")
+            return
+        traces = tracing.recent_traces(limit)
+        if not traces:
+            st.caption("暂无记录")
+            return
+        for spans in reversed(traces):
+            lines = []
+            for entry in spans:
+                attrs = ", ".join(f"{key}={value}" for key, value in entry['attrs'].items())
+                lines.append(f"{'  ' * entry['depth']}{entry['name']}  {entry['duration_ms']:.0f} ms"
+                             + (f"  ({attrs})" if attrs else ""))
+            st.code("\n".join(lines), language=None)
+
+def start_document_ingest(pdf_path, parse_cache, cache_key):
+    """
+    流式入库：OCR、图片描述、分块和向量化按页流水线进行，在后台线程中运行，
+    首批页面入库后即可提问；全部完成后写入解析缓存
+    """
+    workdir = os.path.join(WORK_ROOT, cache_key[:16])
+    pages_dir, imgs_dir = os.path.join(workdir, 'pages'), os.path.join(workdir, 'imgs')
+    # 上次中断或失败留下的残余文件
+    shutil.rmtree(workdir, ignore_errors=True)
+    parse_cache.prepare(cache_key)
+
+    def on_complete():
+        parse_cache.store(cache_key, pages_dir, imgs_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    pages = get_parse_pool().iter_pages(pdf_path, PAGES_PER_JOB)
+    return start_ingest(cache_key, pages, total_pages=count_pages(pdf_path),
+                        pages_dir=pages_dir, imgs_dir=imgs_dir,
+                        vlm_concurrency=int(os.environ.get('VLM_CONCURRENCY', 4)),
+                        on_complete=on_complete)
+
+def document_dirs(cache_key):
+    """
+    文档的 (pages目录, imgs目录)：入库进行中（或失败）时为该任务的工作目录，
+    成功完成后工作目录已写入解析缓存并删除，改读缓存条目
+    """
+    job = get_ingest(cache_key)
+    if job is not None and not (job.done() and not job.error) and os.path.isdir(job.pages_dir):
+        return job.pages_dir, job.imgs_dir
+    entry = get_parse_cache().entry_dir(cache_key)
+    return str(entry), str(entry / 'imgs')
+
+def read_document_text(cache_key):
+    """正文和图片描述（入库过程中为已处理的部分）"""
+    pages_dir, _ = document_dirs(cache_key)
+    markdown_text = ""
+    for name in ('content.md', 'img_descriptions.md'):
+        path = os.path.join(pages_dir, name)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                markdown_text += f.read()
+    return markdown_text
+
+@st.fragment(run_every=1.0)
+def show_ingest_progress(cache_key):
+    """入库进度，每秒刷新"""
+    job = get_ingest(cache_key)
+    if job is None:
+        # 任务已完成并被之后开始的入库任务替换
+        st.session_state['pdf_ready'] = True
+        st.rerun()
+    stats = job.stats()
+    total = stats['pages_total'] or 0
+    st.progress(
+        stats['pages_indexed'] / total if total else 0.0,
+        text=f"已解析 {stats['pages_parsed']}/{total} 页，已入库 {stats['pages_indexed']} 页"
+             f"（{stats['chunks_indexed']} 个分块），图片描述 {stats['images_described']}/{stats['images_total']}"
+             f"（VLM调用 {stats['vlm_calls']} 次，重复/缓存节省 {stats['vlm_duplicates'] + stats['vlm_cache_hits']} 次）",
+    )
+    if stats['done'] or (stats['chunks_indexed'] and not st.session_state.get('pdf_ready')):
+        # 首批分块可检索或全部完成时重新运行整个页面，解锁问答或加载完整内容
+        st.session_state['pdf_ready'] = True
+        st.rerun()
+
 def main():
     
     # VLM API密钥配置
@@ -34,6 +147,8 @@ def main():
     if os.environ.get('VLM_API_KEY') is None:
         setup_vlm_api("qwen_apikey")  # 请替换为你的实际API密钥
         setup_llm_api("deepseek", "deepseek_apikey")
+    start_embedding_warm_up()
+    start_metrics_server()
     st.title("📚 PDF文档智能解读系统")
     
     # 侧边栏：PDF上传
@@ -43,6 +158,32 @@ def main():
         
         if uploaded_file:
             st.success(f"已上传: {uploaded_file.name}")
+
+        pool_stats = get_parse_pool().stats()
+        load_time = pool_stats['model_load_time']
+        st.caption(
+            f"解析进程: {pool_stats['ready_workers']}/{pool_stats['workers']} 就绪，"
+            f"排队任务: {pool_stats['queue_depth']}，"
+            f"模型加载: {'加载中' if load_time is None else f'{load_time:.1f}s'}"
+        )
+        memory = memory_report()
+        st.caption(
+            f"进程内存: {memory['rss_mb']:.0f} MB，"
+            f"向量模型: {', '.join(memory['models']) or '加载中'}"
+        )
+        for cache_stats in memory['embedding_caches'].values():
+            st.caption(f"分块向量缓存: 命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']}")
+        response_stats = llm_cache_stats()
+        st.caption(
+            f"大模型响应缓存: 内存命中 {response_stats['memory_hits']}，磁盘命中 {response_stats['disk_hits']}，"
+            f"未命中 {response_stats['misses']}"
+        )
+        description_stats = description_cache_stats()
+        st.caption(
+            f"图片描述缓存: 命中 {description_stats['hits']} / 未命中 {description_stats['misses']}，"
+            f"共 {description_stats['entries']} 条"
+        )
+        show_timing_panel()
     
     
     # 主界面
@@ -53,65 +194,39 @@ def main():
             f.write(uploaded_file.getbuffer())
         
         
-        # 解析PDF
-        if st.session_state.get('pdf_file_name') != uploaded_file.name:
+        # 解析PDF（按内容哈希+流水线配置命中缓存）
+        cache_key = make_cache_key(hash_pdf(pdf_path), PIPELINE_CONFIG)
+        if st.session_state.get('pdf_cache_key') != cache_key:
             # 清理 session_state
             st.session_state['pdf_text'] = None
             st.session_state['figures'] = None
+            st.session_state['pdf_complete'] = False
+            st.session_state['pdf_ready'] = False
+
+            parse_cache = get_parse_cache()
+            job = get_ingest(cache_key)
+            if job is not None and not job.done():
+                # 其他会话正在入库同一份文档，直接跟随其进度
+                pass
+            elif parse_cache.lookup(cache_key) and is_indexed(cache_key):
+                # 命中解析缓存：直接读缓存条目中的正文、描述和图片，不再复制到工作目录
+                pass
+            else:
+                start_document_ingest(pdf_path, parse_cache, cache_key)
+            st.session_state['pdf_file_name'] = uploaded_file.name
+            st.session_state['pdf_cache_key'] = cache_key
 
-            with st.spinner("正在提取PDF内容"):
-
-                
-                # 提取文本和图片描述
-                # 保存完整内容
-                # extract_text_and_images_from_pdf(pdf_path)
-
-
-                subprocess.run(['python', 'pdf_parser_ocr.py', pdf_path])
-                # 打开imgs并读取所有文件
-                # 让vlm对图片进行解读
-                imgs = []
-                for file in os.listdir('imgs'):
-                    imgs.append(f'imgs/{file}')
-                for img in imgs:
-                    describe_image_with_qwen(img, 1)
-
-                
-                os.makedirs('pages', exist_ok=True)
-                with open(f'pages/content.md', 'r', encoding='utf-8') as f:
-                    text_only = f.read()
-                # 保存到session_state
-                st.session_state['pdf_text'] = text_only
-                st.session_state['pdf_file_name'] = uploaded_file.name
-                
-                
-                # # 文本向量化
-                st.session_state['chunks'] = text_chunking(st.session_state['pdf_text'])
-                embeddings = HuggingFaceEmbeddings(model_name="shibing624/text2vec-base-multilingual")
-                vectorstore = Chroma.from_documents(documents=st.session_state['chunks'], embedding=embeddings, persist_directory="./chroma_db")
-                print("vectordb:", vectorstore._collection.count())    
-               
-               
-               
-                # 显示提取的内容
-                # st.header("📝 提取的内容（包含图片描述）")
-                # with st.expander("查看提取的内容", expanded=False):
-                #     st.text_area("PDF内容", combined_content, height=300)
-                
-                # 显示图片统计
-                # from pdf_parser import get_all_image_descriptions
-                # images = get_all_image_descriptions(combined_content)
-                # if images:
-                #     st.info(f"📸 检测到 {len(images)} 张图片")
-                #     for img in images:
-                #         st.write(f"图片 {img['number']}: {img['description'][:100]}...")
-                
-                markdown_text = st.session_state['pdf_text']
-                with open('./pages/img_descriptions.md', 'r', encoding='utf-8') as f:
-                    img_descriptions = f.read()
-                markdown_text += img_descriptions
-                st.session_state['pdf_text'] = markdown_text
-                st.session_state['pdf_file_name'] = uploaded_file.name
+        # 入库进行中：显示进度，已入库的页面可以先提问
+        job = get_ingest(cache_key)
+        ingesting = job is not None and not job.done()
+        if ingesting:
+            show_ingest_progress(cache_key)
+        elif job is not None and job.error:
+            st.error(f"PDF处理失败: {job.error}")
+        if not st.session_state.get('pdf_complete'):
+            # 保存到session_state
+            st.session_state['pdf_text'] = read_document_text(cache_key)
+            st.session_state['pdf_complete'] = not ingesting
 
 
         if st.session_state.get('pdf_text'):
@@ -134,14 +249,17 @@ def main():
 
             # 显示文献总结
             st.header("📋 文献总结")
-            if st.button("生成总结"):
-                with st.spinner("正在生成总结..."):
-                    summary = get_summary(st.session_state['pdf_text'])
-                    st.write(summary)
+            if st.button("生成总结", disabled=ingesting, help="全文入库完成后可生成总结" if ingesting else None):
+                # 边生成边显示
+                with tracing.span("summary"):
+                    st.write_stream(get_summary_stream(st.session_state['pdf_text']))
         
 
             # 问答界面
             st.header("💬 智能问答")
+            if ingesting and job.stats()['chunks_indexed'] == 0:
+                st.info("正在解析，首批页面入库后即可提问")
+                return
             
             # 示例问题
             st.subheader("💡 示例问题")
@@ -165,27 +283,29 @@ def main():
             
             if question:
                 if st.button("提交问题"):
-                    with st.spinner("正在思考..."):
-                        markdown_text = st.session_state['pdf_text']
-                        answer, evidence, is_image_question = ask_question(markdown_text, question)
+                    # 检索和流式回答记在同一条调用链中
+                    with tracing.span("question"):
+                        with st.spinner("正在检索..."):
+                            markdown_text = st.session_state['pdf_text']
+                            pages_dir, imgs_dir = document_dirs(cache_key)
+                            answer, evidence, is_image_question = ask_question_stream(
+                                markdown_text, question, cache_key, imgs_dir=imgs_dir,
+                                descriptions_path=os.path.join(pages_dir, 'img_descriptions.md'))
+                        col1, col2 = st.columns([1, 1])
+                        # 先展示依据，再流式渲染答案
                         if is_image_question:
-                            col1, col2 = st.columns([1, 1])
-                            with col1:
-                                st.subheader("🤖 答案")
-                                st.write(answer)
                             with col2:
                                 st.subheader("🖼️ 图片")
                                 st.image(evidence)
                         else:
-                            col1, col2 = st.columns([1, 1])
-                            with col1:
-                                st.subheader("🤖 答案")
-                                st.write(answer)
                             with col2:
                                 st.subheader("📖 原文依据")
                                 st.markdown(evidence)
                                 # 显示原文长度信息
                                 st.info(f"原文片段长度: {len(evidence)} 字符")
+                        with col1:
+                            st.subheader("🤖 答案")
+                            st.write_stream(answer)
 
 if __name__ == "__main__":
     main()
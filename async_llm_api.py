@@ -0,0 +1,319 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+import real_llm_api
+import tracing
+from http_transport import (CONNECT_TIMEOUT, MAX_BACKOFF, MAX_RETRIES, POOL_SIZE, READ_TIMEOUT, RETRY_STATUS,
+                            retry_after_exceeds, retry_after_seconds)
+from llm_cache import get_response_cache
+from real_llm_api import LLMAPI, record_tokens
+from text_util import estimate_tokens
+
+# 各服务商默认配额 (每分钟请求数, 每分钟token数, 并发数)，按账号实际配额通过环境变量调整：
+# LLM_RPM / LLM_TPM / LLM_CONCURRENCY 对所有服务商生效，LLM_RPM_DEEPSEEK 等只对单个服务商生效
+PROVIDER_LIMITS: Dict[str, Tuple[int, int, int]] = {
+    "qwen": (300, 300000, 8),
+    "doubao": (300, 300000, 8),
+    "deepseek": (60, 120000, 8),
+}
+DEFAULT_LIMITS = (60, 100000, 4)
+
+
+def _limit(name: str, provider: str, default: int) -> int:
+    value = os.environ.get(f"{name}_{provider.upper()}", os.environ.get(name))
+    return int(value) if value else default
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟配额，按配额/60 的速率连续补充，启动时是满的"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float, now: float) -> float:
+        """够用则扣除并返回0，否则返回还需等待的秒数（不扣除）"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            self.level -= amount
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def give_back(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    单个服务商的请求调度：同时满足每分钟请求数（RPM）和每分钟token数（TPM），在途请求数不超过 concurrency。
+    令牌桶状态按时间计算、由线程锁保护，同一进程内所有事件循环和线程共享同一份配额和并发名额；
+    收到 429 时整体暂停到 Retry-After 之后，避免其余请求继续撞限流。
+    """
+
+    def __init__(self, rpm: int, tpm: int, concurrency: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        # 等待并发名额的协程：(所在事件循环, Future)，名额释放时按顺序唤醒
+        self._waiters: deque = deque()
+
+    async def acquire(self, tokens: int):
+        """等待直到请求数和token数配额都够用，两者同时扣除"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self.paused_until - now
+                if wait <= 0:
+                    wait = self.requests.take(1, now)
+                    if wait == 0:
+                        wait = self.tokens.take(tokens, now)
+                        if wait > 0:
+                            self.requests.give_back(1)
+                if wait <= 0:
+                    return
+            await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def slot(self):
+        """占用一个并发名额直到退出；名额用完时排队等待，不同事件循环（线程）中的请求共用名额"""
+        while True:
+            with self._lock:
+                if self.in_flight < self.concurrency:
+                    self.in_flight += 1
+                    break
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append((asyncio.get_running_loop(), waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    if (asyncio.get_running_loop(), waiter) in self._waiters:
+                        self._waiters.remove((asyncio.get_running_loop(), waiter))
+                    elif waiter.done() and not waiter.cancelled():
+                        # 已被唤醒却不再需要名额，转给下一个等待者
+                        self._wake_next()
+                raise
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self._wake_next()
+
+    def _wake_next(self):
+        while self._waiters:
+            loop, waiter = self._waiters.popleft()
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_set_waiter, waiter)
+                return
+
+    def refund(self, tokens: int):
+        """请求完成后按实际用量退还多预留的token"""
+        if tokens > 0:
+            with self._lock:
+                self.tokens.give_back(tokens)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.throttled += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def _set_waiter(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> RateLimiter:
+    """每个服务商一个进程内共享的调度器"""
+    with _limiters_lock:
+        if provider not in _limiters:
+            rpm, tpm, concurrency = PROVIDER_LIMITS.get(provider, DEFAULT_LIMITS)
+            _limiters[provider] = RateLimiter(
+                rpm=_limit("LLM_RPM", provider, rpm),
+                tpm=_limit("LLM_TPM", provider, tpm),
+                concurrency=_limit("LLM_CONCURRENCY", provider, concurrency),
+            )
+        return _limiters[provider]
+
+
+class AsyncLLMAPI(LLMAPI):
+    """
+    LLMAPI 的异步版本：请求格式和缓存键与同步版本一致，
+    HTTP 由 httpx.AsyncClient 发出，每个请求先经服务商调度器取得配额。
+    AsyncClient 绑定创建它的事件循环，用完需 aclose()。
+    """
+
+    def __init__(self, api_type: str = "qwen", api_key: str = ""):
+        super().__init__(api_type, api_key)
+        self.limiter = get_rate_limiter(api_type)
+        self.client: Optional[httpx.AsyncClient] = None
+
+    def _ensure_client(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+            )
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def arequest(self, prompt: str) -> str:
+        """发送一次流式请求并拼接完整回答，失败时抛出异常"""
+        if self.api_type == "qwen":
+            headers, data = self.qwen_request(prompt)
+            parse_delta = self.qwen_delta
+        elif self.api_type in ("doubao", "deepseek"):
+            headers, data = self.chat_completions_request(prompt)
+            parse_delta = self.chat_completions_delta
+        else:
+            raise ValueError(f"不支持的API类型: {self.api_type}")
+
+        parts = []
+        async with self.client.stream("POST", self.base_url, headers=headers, json=data) as response:
+            bytes_sent = len(response.request.content)
+            tracing.current_span().add("bytes_sent", bytes_sent)
+            tracing.count("llm_requests", provider=self.api_type)
+            tracing.count("llm_bytes_sent", bytes_sent, provider=self.api_type)
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                delta = parse_delta(payload)
+                if delta:
+                    parts.append(delta)
+        return "".join(parts)
+
+    async def arequest_with_retry(self, prompt: str) -> str:
+        """
+        取得配额后请求；429 和 5xx 按 Retry-After 或指数退避（全抖动）重试，
+        429 同时暂停整个服务商的调度，连接失败重试，读超时不重试；
+        Retry-After 要求等待超过读取超时时不再重试，直接抛出
+        """
+        reserved = estimate_tokens(prompt) + self.params.get("max_tokens", 0)
+        for attempt in range(MAX_RETRIES + 1):
+            await self.limiter.acquire(reserved)
+            try:
+                async with self.limiter.slot():
+                    text = await self.arequest(prompt)
+                self.limiter.refund(reserved - estimate_tokens(prompt) - estimate_tokens(text))
+                return text
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in RETRY_STATUS or attempt == MAX_RETRIES or retry_after_exceeds(e):
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = random.uniform(0, min(MAX_BACKOFF, 2.0 ** attempt))
+                if e.response.status_code == 429:
+                    self.limiter.pause(delay)
+                print(f"{self.api_type} 请求失败（{e.response.status_code}），{delay:.1f}s 后重试")
+            except httpx.ConnectError as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = random.uniform(0, min(MAX_BACKOFF, 2.0 ** attempt))
+                print(f"{self.api_type} 连接失败: {e}，{delay:.1f}s 后重试")
+            tracing.current_span().add("retries")
+            tracing.count("llm_retries", provider=self.api_type)
+            await asyncio.sleep(delay)
+
+    async def acall_api(self, prompt: str, use_cache: bool = True) -> str:
+        """
+        异步调用接口，请求格式和缓存与 call_api 一致：
+        use_cache 时先查响应缓存，只缓存成功的完整响应；失败时抛出异常（不返回备用响应，避免错误文本混入结果）
+        """
+        if not self.api_key:
+            raise ValueError(f"未提供 {self.api_type} API密钥")
+        self._ensure_client()
+
+        key = self.cache_key(prompt) if use_cache else None
+        if use_cache:
+            cached = get_response_cache().get(key)
+            if cached is not None:
+                tracing.count("llm_cache_hits", provider=self.api_type)
+                return cached
+
+        # 每个协程在各自的任务上下文中运行，span 互不干扰
+        with tracing.span("llm_call", provider=self.api_type, model=self.model, batch=True) as span:
+            try:
+                text = await self.arequest_with_retry(prompt)
+            except Exception as e:
+                print(f"{self.api_type} API调用失败: {e}")
+                tracing.count("llm_errors", provider=self.api_type)
+                span.set("error", type(e).__name__)
+                raise
+            record_tokens(span, self.api_type, prompt, text)
+        if use_cache:
+            get_response_cache().set(key, text)
+        return text
+
+    async def acall_batch(self, prompts: List[str], use_cache: bool = True) -> List[Optional[str]]:
+        """并发调用，结果与输入顺序一致；失败的请求对应 None"""
+        results = await asyncio.gather(*(self.acall_api(prompt, use_cache) for prompt in prompts),
+                                       return_exceptions=True)
+        return [None if isinstance(result, BaseException) else result for result in results]
+
+
+async def _run_batch(api_type: str, api_key: str, prompts: List[str], use_cache: bool) -> List[Optional[str]]:
+    client = AsyncLLMAPI(api_type, api_key)
+    try:
+        return await client.acall_batch(prompts, use_cache)
+    finally:
+        await client.aclose()
+
+
+def call_llm_api_batch(prompts: List[str], use_cache: bool = True) -> List[Optional[str]]:
+    """
+    批量调用当前初始化的大模型，按服务商配额并发请求，结果与输入顺序一致；
+    调用失败（或尚未初始化大模型）的提示词对应 None，由调用方跳过或另行处理。
+    可在普通同步代码中调用；已处于事件循环中时在独立线程里运行。
+    """
+    llm = real_llm_api.llm_instance
+    if llm is None:
+        return [None] * len(prompts)
+    if not prompts:
+        return []
+
+    start = time.time()
+    coroutine = _run_batch(llm.api_type, llm.api_key, list(prompts), use_cache)
+    with tracing.span("llm_batch", provider=llm.api_type, prompts=len(prompts)):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            results = asyncio.run(coroutine)
+        else:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                results = executor.submit(contextvars.copy_context().run, asyncio.run, coroutine).result()
+    failed = sum(result is None for result in results)
+    print(f"{llm.api_type} 批量调用 {len(prompts)} 条（失败 {failed} 条），耗时 {time.time() - start:.2f}s")
+    return results
@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from image_dedup import description_cache_stats
+from image_encoding import upload_stats
+from ingest import PAGES_PER_JOB, PIPELINE_CONFIG, VLM_CONCURRENCY, get_ingest, start_ingest
+from parse_cache import DEFAULT_MAX_BYTES, ParseCache, hash_pdf, make_cache_key
+from parse_worker import ParseWorkerPool, count_pages
+from vector_index import delete_document, document_size, is_indexed
+
+MANIFEST_PATH = "./batch_manifest.json"
+WORK_ROOT = "./batch_work"
+
+
+class BatchManifest:
+    """
+    批量入库清单：每份PDF一条记录（内容哈希、缓存键、状态、各阶段耗时、错误、尝试次数），
+    每次状态变化都原子地写回文件。中断后重新运行时跳过已完成的文档，未完成和失败的重新入库。
+    状态: pending / running / done / failed
+    """
+
+    def __init__(self, path: str = MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.records: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.records = json.load(f)["documents"]
+
+    def get(self, pdf_path: str) -> dict:
+        with self._lock:
+            return dict(self.records.get(pdf_path, {}))
+
+    def update(self, pdf_path: str, **fields):
+        with self._lock:
+            record = self.records.setdefault(pdf_path, {"status": "pending", "attempts": 0})
+            record.update(fields)
+            record["updated"] = time.time()
+            self._save()
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"config": PIPELINE_CONFIG, "documents": self.records}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def summary(self) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for record in self.records.values():
+                counts[record["status"]] = counts.get(record["status"], 0) + 1
+            return counts
+
+
+def collect_pdfs(inputs: List[str], list_file: Optional[str] = None) -> List[str]:
+    """目录（递归查找 *.pdf）、PDF文件和列表文件（每行一个路径）中的PDF，去重后按路径排序"""
+    paths = list(inputs)
+    if list_file:
+        with open(list_file, "r", encoding="utf-8") as f:
+            paths.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    pdfs = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                pdfs.update(os.path.abspath(os.path.join(root, name)) for name in files
+                            if name.lower().endswith(".pdf"))
+        elif os.path.isfile(path):
+            pdfs.add(os.path.abspath(path))
+        else:
+            print(f"跳过不存在的路径: {path}")
+    return sorted(pdfs)
+
+
+class BatchIngester:
+    """
+    批量入库：多份文档同时在流水线中（StreamingIngest），OCR交给共享的常驻解析进程池。
+    产物与界面上传完全相同：解析缓存条目（content.md、img_descriptions.md、imgs/）和文档的向量集合，
+    之后在界面上传同一份PDF会直接命中缓存。每份文档使用独立的工作目录，完成后删除。
+    """
+
+    def __init__(self, pool: ParseWorkerPool, parse_cache: ParseCache, manifest: BatchManifest,
+                 work_root: str = WORK_ROOT, pages_per_job: int = PAGES_PER_JOB,
+                 vlm_concurrency: int = VLM_CONCURRENCY, max_attempts: int = 3, keep_workdirs: bool = False):
+        self.pool = pool
+        self.parse_cache = parse_cache
+        self.manifest = manifest
+        self.work_root = work_root
+        self.pages_per_job = pages_per_job
+        self.vlm_concurrency = vlm_concurrency
+        self.max_attempts = max_attempts
+        self.keep_workdirs = keep_workdirs
+        # 查缓存、清理条目和开始入库需要原子地进行，避免内容相同的两份文件同时入库
+        self._start_lock = threading.Lock()
+
+    def cache_key(self, pdf_path: str) -> str:
+        """文件大小和修改时间与清单中一致时直接沿用记录的缓存键，恢复运行时不必重新计算哈希"""
+        record = self.manifest.get(pdf_path)
+        stat = os.stat(pdf_path)
+        if record.get("size") == stat.st_size and record.get("mtime") == stat.st_mtime and record.get("cache_key"):
+            return record["cache_key"]
+        cache_key = make_cache_key(hash_pdf(pdf_path), PIPELINE_CONFIG)
+        self.manifest.update(pdf_path, size=stat.st_size, mtime=stat.st_mtime, cache_key=cache_key)
+        return cache_key
+
+    def ingest(self, pdf_path: str) -> str:
+        """入库一份文档，返回最终状态"""
+        record = self.manifest.get(pdf_path)
+        if record.get("status") == "failed" and record.get("attempts", 0) >= self.max_attempts:
+            return "failed"
+        cache_key = self.cache_key(pdf_path)
+        workdir = os.path.join(self.work_root, cache_key[:16])
+        pages_dir, imgs_dir = os.path.join(workdir, "pages"), os.path.join(workdir, "imgs")
+
+        with self._start_lock:
+            job = get_ingest(cache_key)
+            if job is None or job.done():
+                if self.parse_cache.lookup(cache_key) and is_indexed(cache_key):
+                    if record.get("status") != "done":
+                        self.manifest.update(pdf_path, status="done", cached=True, error=None)
+                    return "done"
+                self.manifest.update(pdf_path, status="running", attempts=record.get("attempts", 0) + 1,
+                                     started=time.time(), error=None)
+                self.parse_cache.prepare(cache_key)
+                job = start_ingest(
+                    cache_key, self.pool.iter_pages(pdf_path, self.pages_per_job),
+                    total_pages=count_pages(pdf_path), pages_dir=pages_dir, imgs_dir=imgs_dir,
+                    vlm_concurrency=self.vlm_concurrency,
+                    on_complete=lambda: self.parse_cache.store(cache_key, pages_dir, imgs_dir),
+                )
+                owner = True
+            else:
+                # 内容相同的另一份文件正在入库，等它完成即可
+                owner = False
+        job.wait()
+        stats = job.stats()
+
+        if stats["error"]:
+            if owner:
+                # 删除写了一半的向量集合，下次重新入库
+                delete_document(cache_key)
+            self.manifest.update(pdf_path, status="failed", error=stats["error"], stage_s=stats["stage_s"])
+            status = "failed"
+        else:
+            self.manifest.update(pdf_path, status="done", cached=not owner, pages=stats["pages_total"],
+                                 chunks=stats["chunks_indexed"], images=stats["images_described"],
+                                 vlm_calls=stats["vlm_calls"],
+                                 vlm_saved=stats["vlm_duplicates"] + stats["vlm_cache_hits"],
+                                 first_indexed_s=stats["first_indexed_s"], stage_s=stats["stage_s"],
+                                 total_s=stats["elapsed_s"])
+            status = "done"
+        if owner and not self.keep_workdirs:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return status
+
+    def run(self, pdfs: List[str], concurrent_docs: int) -> Dict[str, int]:
+        start = time.time()
+        for pdf_path in pdfs:
+            if not self.manifest.get(pdf_path):
+                self.manifest.update(pdf_path)
+        results: Dict[str, int] = {}
+        executor = ThreadPoolExecutor(max_workers=concurrent_docs, thread_name_prefix="batch")
+        try:
+            futures = {executor.submit(self.ingest, pdf_path): pdf_path for pdf_path in pdfs}
+            for finished, future in enumerate(as_completed(futures), 1):
+                pdf_path = futures[future]
+                try:
+                    status = future.result()
+                except Exception as e:
+                    self.manifest.update(pdf_path, status="failed", error=str(e))
+                    status = "failed"
+                results[status] = results.get(status, 0) + 1
+                record = self.manifest.get(pdf_path)
+                print(f"[{finished}/{len(pdfs)}] {status} {os.path.basename(pdf_path)} "
+                      f"{record.get('total_s', 0):.1f}s {record.get('error') or ''}")
+        except KeyboardInterrupt:
+            print("已中断，重新运行同一命令将从清单继续")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+        print(f"完成 {len(pdfs)} 份文档，耗时 {time.time() - start:.1f}s: {results}，"
+              f"图片描述缓存: {description_cache_stats()}，上传图片: {upload_stats()}")
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量入库PDF（产物与界面上传相同，可中断后继续）")
+    parser.add_argument("inputs", nargs="*", help="PDF文件或目录（递归查找）")
+    parser.add_argument("--from-list", help="每行一个PDF路径的列表文件")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("PARSE_WORKERS", max(1, (os.cpu_count() or 4) // 4))),
+                        help="OCR解析进程数（每个进程常驻一份PPStructureV3）")
+    parser.add_argument("--concurrent-docs", type=int, default=None, help="同时在流水线中的文档数，默认解析进程数+1")
+    parser.add_argument("--vlm-concurrency", type=int, default=VLM_CONCURRENCY, help="每份文档的图片描述并发数")
+    parser.add_argument("--pages-per-job", type=int, default=PAGES_PER_JOB)
+    parser.add_argument("--max-attempts", type=int, default=3, help="失败的文档最多尝试次数（跨多次运行累计）")
+    parser.add_argument("--manifest", default=MANIFEST_PATH)
+    parser.add_argument("--work-root", default=WORK_ROOT)
+    parser.add_argument("--keep-workdirs", action="store_true")
+    parser.add_argument("--cache-max-bytes", type=int,
+                        default=int(os.environ.get("PARSE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+                        help="解析缓存容量，超出后按LRU淘汰（连同向量集合），批量入库时应足够大")
+    args = parser.parse_args()
+
+    pdfs = collect_pdfs(args.inputs, args.from_list)
+    if not pdfs:
+        parser.error("没有找到PDF文件")
+    manifest = BatchManifest(args.manifest)
+    print(f"共 {len(pdfs)} 份PDF，清单 {args.manifest} 中已有: {manifest.summary()}")
+
+    if os.environ.get("VLM_API_KEY") is None:
+        print("警告: 未设置 VLM_API_KEY，图片描述将全部失败")
+
+    from embedding_registry import warm_up
+    pool = ParseWorkerPool(num_workers=args.workers)
+    warm_up()
+    ingester = BatchIngester(
+        pool, ParseCache(max_bytes=args.cache_max_bytes, on_evict=delete_document,
+                          external_size=document_size), manifest,
+        work_root=args.work_root, pages_per_job=args.pages_per_job, vlm_concurrency=args.vlm_concurrency,
+        max_attempts=args.max_attempts, keep_workdirs=args.keep_workdirs,
+    )
+    try:
+        results = ingester.run(pdfs, args.concurrent_docs or args.workers + 1)
+    except KeyboardInterrupt:
+        pool.shutdown()
+        os._exit(130)
+    pool.shutdown()
+    sys.exit(1 if results.get("failed") else 0)
+
+
+if __name__ == "__main__":
+    # 用法: python batch_ingest.py papers/ more.pdf [--from-list list.txt] [--workers 4]
+    main()
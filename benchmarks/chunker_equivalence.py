@@ -0,0 +1,113 @@
+"""
+流式markdown分块器与原两段式分块（MarkdownHeaderTextSplitter + RecursiveCharacterTextSplitter）的
+一致性检查和微基准（耗时、峰值内存）。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.chunker_equivalence [pdf路径] [--docs 200] [--seed 0]
+
+语料：随机生成的markdown（各级标题、代码块、空行、长中文段落、不可见字符等）
+加上 PDF 文本层；分别按字符和按token计长度，并把文本随机切片后逐片输入，
+要求分块文本和 h1-h4 元数据逐块一致。
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from markdown_chunker import iter_markdown_chunks
+from text_util import estimate_tokens, text_chunking_reference
+
+WORDS = ["model", "accuracy", "ResNet-50", "F1-score", "dataset", "MNIST", "training", "的", "实验结果表明",
+         "本文提出了一种新的方法", "公式(3)", "图2", "显著优于基线", "learning rate", "0.93", "表1"]
+
+
+def random_paragraph(rng):
+    if rng.random() < 0.3:
+        # 不含空格的长中文段落，迫使切分退到逐字符
+        return "".join(rng.choice(WORDS[7:]) for _ in range(rng.randint(20, 120)))
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 80)))
+
+
+def random_markdown(rng):
+    lines = []
+    for _ in range(rng.randint(1, 60)):
+        kind = rng.random()
+        if kind < 0.2:
+            lines.append("#" * rng.randint(1, 5) + rng.choice([" ", "", "  "]) + random_paragraph(rng)[:30])
+        elif kind < 0.25:
+            fence = rng.choice(["```", "~~~"])
+            lines.extend([fence + "python", "# 代码中的注释不是标题", random_paragraph(rng), fence])
+        elif kind < 0.4:
+            lines.append(rng.choice(["", "   ", "\t"]))
+        elif kind < 0.45:
+            lines.append("<PAGE_1_IMAGE_1>" + random_paragraph(rng) + "\x0b</PAGE_1_IMAGE_1>")
+        else:
+            lines.append(rng.choice(["", "- ", "  "]) + random_paragraph(rng))
+    return "\n".join(lines) + rng.choice(["", "\n", "\n\n"])
+
+
+def random_slices(rng, text):
+    cuts = sorted(rng.sample(range(len(text) + 1), min(len(text), rng.randint(0, 8))))
+    return [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+
+
+def as_pairs(docs):
+    return [(doc.page_content, doc.metadata) for doc in docs]
+
+
+def check(corpus, rng):
+    report = {"documents": len(corpus), "mismatches": []}
+    for index, text in enumerate(corpus):
+        for unit, length_function, size, overlap in (("chars", len, 200, 10), ("tokens", estimate_tokens, 64, 8)):
+            expected = as_pairs(text_chunking_reference(text, size, overlap, length_function))
+            for mode, pieces in (("whole", [text]), ("slices", random_slices(rng, text))):
+                actual = as_pairs(iter_markdown_chunks(pieces, size, overlap, length_function))
+                if actual != expected:
+                    report["mismatches"].append({"document": index, "unit": unit, "mode": mode})
+    report["equivalent"] = not report["mismatches"]
+    return report
+
+
+def measure(function, text):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(text)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"ms": round(elapsed * 1000, 2), "peak_kb": round(peak / 1024, 1)}
+
+
+def benchmark(text):
+    def reference(text):
+        return sum(1 for _ in text_chunking_reference(text))
+
+    def streaming(text):
+        return sum(1 for _ in iter_markdown_chunks([text]))
+
+    return {
+        "chars": len(text),
+        "reference": measure(reference, text),
+        "streaming": measure(streaming, text),
+    }
+
+
+def pdf_text(pdf_path):
+    import fitz
+
+    with fitz.open(pdf_path) as pdf:
+        return "\n\n".join(page.get_text() for page in pdf)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流式markdown分块器一致性与微基准")
+    parser.add_argument("pdf", nargs="?", default="zjuProj.pdf")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = [random_markdown(rng) for _ in range(args.docs)] + [pdf_text(args.pdf)]
+    large = "\n\n".join(corpus) * 5
+    print(json.dumps({"equivalence": check(corpus, rng), "benchmark": benchmark(large)}, ensure_ascii=False, indent=2))
@@ -0,0 +1,61 @@
+"""
+向量推理后端的吞吐量（分块/秒）与量化后端的一致性检查。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.embedding_throughput [pdf路径] [--threads 1 2 4] [--skip-reference]
+
+取 PDF 文本层，按 text_chunking 的规则分块后分别用全精度 HuggingFaceEmbeddings
+和 int8 ONNX 后端编码（模型加载和首批预热不计入耗时），
+并以全精度结果为参考报告逐条余弦相似度和 top-5 近邻的重合度。结果以JSON打印。
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from onnx_embeddings import OnnxEmbeddings, parity_report
+from text_util import EMBEDDING_MODEL_NAME, text_chunking
+
+
+def load_chunks(pdf_path):
+    import fitz
+
+    with fitz.open(pdf_path) as pdf:
+        text = "\n\n".join(page.get_text() for page in pdf)
+    return [chunk.page_content for chunk in text_chunking(text)]
+
+
+def measure(embeddings, chunks):
+    embeddings.embed_documents(chunks[:8])
+    start = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    elapsed = time.perf_counter() - start
+    return vectors, {"seconds": round(elapsed, 3), "chunks_per_s": round(len(chunks) / elapsed, 1)}
+
+
+def run(pdf_path, thread_counts, skip_reference=False):
+    chunks = load_chunks(pdf_path)
+    report = {"pdf": pdf_path, "chunks": len(chunks), "backends": {}}
+
+    reference = None
+    if not skip_reference:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+
+        reference, report["backends"]["torch"] = measure(HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME), chunks)
+
+    for threads in thread_counts:
+        vectors, result = measure(OnnxEmbeddings(EMBEDDING_MODEL_NAME, threads=threads), chunks)
+        if reference is not None:
+            result["parity"] = parity_report(reference, vectors)
+        report["backends"][f"onnx-int8/{threads}线程"] = result
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="向量推理后端吞吐量测试")
+    parser.add_argument("pdf", nargs="?", default="zjuProj.pdf")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--skip-reference", action="store_true", help="不运行全精度参考模型")
+    args = parser.parse_args()
+    print(json.dumps(run(args.pdf, args.threads, args.skip_reference), ensure_ascii=False, indent=2))
@@ -0,0 +1,190 @@
+"""
+本地的大模型/视觉模型替身服务，供基准测试使用，不需要真实的API密钥。
+
+支持 OpenAI 兼容的 /v1/chat/completions（DeepSeek、Doubao、Qwen-VL 兼容模式，流式与非流式）
+和 DashScope 的 /api/v1/services/aigc/text-generation/generation（流式）。
+延迟、逐token间隔和错误率（429 带 Retry-After / 503）可配置，并统计各类调用次数。
+
+单独运行:
+    python -m benchmarks.fake_llm_server --port 8001 --latency 0.3 --error-rate 0.05
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = ("根据原文片段，该研究提出了一种新的方法，在多个数据集上取得了优于基线的结果，"
+          "主要贡献包括模型结构设计、训练策略以及系统实现三个方面。")
+IMAGE_DESCRIPTION = "图中展示了实验流程示意图，包含数据预处理、模型训练和结果评估三个阶段。"
+
+
+class FakeLLMServer:
+    def __init__(self, name: str = "llm", latency: float = 0.2, jitter: float = 0.0, token_delay: float = 0.0,
+                 error_rate: float = 0.0, retry_after: float = 1.0, seed: int = 0,
+                 host: str = "127.0.0.1", port: int = 0):
+        """
+        latency: 首token（或非流式完整响应）前的等待秒数，jitter 为其上下浮动范围
+        token_delay: 流式输出时每个token之间的间隔
+        error_rate: 请求以 429（带 Retry-After）或 503 失败的概率
+        """
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts = {"requests": 0, "chat": 0, "vision": 0, "stream": 0,
+                        "errors_429": 0, "errors_503": 0, "prompt_chars": 0, "completion_chars": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"fake-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self._counts[key] += value
+
+    def _draw(self):
+        """返回 (要注入的错误状态码或None, 本次延迟)"""
+        with self._lock:
+            error = None
+            if self._random.random() < self.error_rate:
+                error = self._random.choice([429, 503])
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        return error, delay
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_events(self, events):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for index, event in enumerate(events):
+                    if index and server.token_delay:
+                        time.sleep(server.token_delay)
+                    data = f"data: {event}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/stats":
+                    self._send_json(200, server.stats())
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                server._count(requests=1)
+
+                error, delay = server._draw()
+                time.sleep(delay)
+                if error == 429:
+                    server._count(errors_429=1)
+                    self._send_json(429, {"error": {"message": "rate limited"}},
+                                    {"Retry-After": str(server.retry_after)})
+                    return
+                if error == 503:
+                    server._count(errors_503=1)
+                    self._send_json(503, {"error": {"message": "overloaded"}})
+                    return
+
+                if self.path.endswith("/chat/completions"):
+                    self._chat_completions(body)
+                elif self.path.endswith("/text-generation/generation"):
+                    self._dashscope(body)
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def _chat_completions(self, body):
+                messages = body.get("messages", [])
+                vision = any(isinstance(m.get("content"), list)
+                             and any(part.get("type") == "image_url" for part in m["content"]) for m in messages)
+                prompt_chars = sum(len(m["content"]) for m in messages if isinstance(m.get("content"), str))
+                text = IMAGE_DESCRIPTION if vision else ANSWER
+                server._count(vision=int(vision), chat=int(not vision), prompt_chars=prompt_chars,
+                              completion_chars=len(text), stream=int(bool(body.get("stream"))))
+
+                if not body.get("stream"):
+                    self._send_json(200, {
+                        "id": "fake", "object": "chat.completion", "created": int(time.time()),
+                        "model": body.get("model", ""),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": text}}],
+                    })
+                    return
+                events = [json.dumps({"choices": [{"index": 0, "delta": {"content": token}}]}, ensure_ascii=False)
+                          for token in _tokens(text)]
+                self._send_events(events + ["[DONE]"])
+
+            def _dashscope(self, body):
+                messages = body.get("input", {}).get("messages", [])
+                server._count(chat=1, stream=1, prompt_chars=sum(len(m.get("content", "")) for m in messages),
+                              completion_chars=len(ANSWER))
+                events = [json.dumps({"output": {"text": token}}, ensure_ascii=False) for token in _tokens(ANSWER)]
+                self._send_events(events)
+
+        return Handler
+
+
+def _tokens(text: str, size: int = 4):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地大模型替身服务")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeLLMServer(latency=args.latency, token_delay=args.token_delay, error_rate=args.error_rate,
+                         port=args.port).start()
+    print(f"已启动: {fake.base_url}/v1 （统计: {fake.base_url}/stats）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
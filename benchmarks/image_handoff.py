@@ -0,0 +1,111 @@
+"""
+解析阶段把图片交给描述阶段的开销对比：
+  disk   —— 原来的做法：解析结果的图片先存成PNG，描述时再读文件、解码、缩放、重新编码（image_encoding.encode_image）
+  memory —— 图片仓库（image_store.ImageStore）：直接对内存中的图片缩放编码，PNG在后台线程写出
+记录每张图在关键路径上的耗时（memory 不含后台写盘）和后台写盘的总耗时；两种方式上传的字节数相同。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.image_handoff [pdf ...] [--synthetic-pages 10] [--images 40] [--output report.json]
+
+图片取自 PDF 中的插图区域（与文本层快速通道相同的渲染方式）和按 100dpi 渲染的整页。
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic_pdf import make_synthetic_pdf
+
+
+def collect_images(pdf_path: str, limit: int) -> list:
+    import fitz
+    from PIL import Image
+
+    from text_layer import FontProfile, page_markdown
+
+    images = []
+    with fitz.open(pdf_path) as doc:
+        profile = FontProfile.from_document(doc)
+        for page in doc:
+            if len(images) >= limit:
+                break
+            pix = page.get_pixmap(dpi=100)
+            images.append(Image.frombytes("RGB", (pix.width, pix.height), pix.samples))
+            images.extend(page_markdown(page, profile)["markdown_images"].values())
+    return images[:limit]
+
+
+def run_disk(images: list, out_dir: str) -> dict:
+    from image_encoding import encode_image
+
+    start = time.perf_counter()
+    for i, image in enumerate(images):
+        path = os.path.join(out_dir, f"page_1_img_{i + 1}_{i + 1}.png")
+        image.save(path)
+        encode_image(path)
+    return {"handoff_ms_per_image": round((time.perf_counter() - start) * 1000 / len(images), 2)}
+
+
+def run_memory(images: list, out_dir: str) -> dict:
+    from image_store import ImageStore
+
+    store = ImageStore(persist=True)
+    start = time.perf_counter()
+    for i, image in enumerate(images):
+        path = os.path.join(out_dir, f"page_1_img_{i + 1}_{i + 1}.png")
+        store.put(path, image)
+        store.get(path)
+        store.release(path)
+    handoff = time.perf_counter() - start
+    store.close()
+    return {
+        "handoff_ms_per_image": round(handoff * 1000 / len(images), 2),
+        "persisted_after_s": round(time.perf_counter() - start, 3),
+        "persisted": store.stats()["persisted"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析到描述的图片交接开销对比")
+    parser.add_argument("pdfs", nargs="*", default=["zjuProj.pdf"])
+    parser.add_argument("--synthetic-pages", type=int, nargs="*", default=[])
+    parser.add_argument("--images", type=int, default=40, help="每份PDF最多取多少张图片（含整页）")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.getcwd())
+    scratch = tempfile.mkdtemp(prefix="image_handoff_")
+    pdfs = [os.path.abspath(path) for path in args.pdfs]
+    for pages in args.synthetic_pages:
+        pdfs.append(make_synthetic_pdf(os.path.join(scratch, f"synthetic_{pages}p.pdf"), pages))
+
+    report = {"documents": []}
+    try:
+        for pdf_path in pdfs:
+            images = collect_images(pdf_path, args.images)
+            if not images:
+                continue
+            entry = {"pdf": os.path.basename(pdf_path), "images": len(images)}
+            for name, run in (("disk", run_disk), ("memory", run_memory)):
+                out_dir = os.path.join(scratch, name)
+                os.makedirs(out_dir)
+                entry[name] = run(images, out_dir)
+                shutil.rmtree(out_dir)
+            entry["speedup"] = round(entry["disk"]["handoff_ms_per_image"]
+                                     / max(entry["memory"]["handoff_ms_per_image"], 1e-6), 2)
+            report["documents"].append(entry)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
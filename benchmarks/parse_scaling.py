@@ -0,0 +1,68 @@
+"""
+按页并行OCR的扩展性测试。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.parse_scaling [pdf路径] [--workers 1 2 4] [--pages-per-job N]
+
+对每个进程数：先等待所有进程加载完模型（不计入耗时），再计时完整解析一次，
+并检查合并结果与单进程结果完全一致。结果以JSON打印。
+"""
+import argparse
+import json
+import os
+import time
+
+from parse_worker import ParseWorkerPool
+
+
+def run(pdf_path, worker_counts, pages_per_job=None):
+    import fitz
+
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+
+    results = []
+    baseline_text = None
+    for workers in worker_counts:
+        pool = ParseWorkerPool(num_workers=workers)
+        try:
+            start = time.time()
+            if not pool.wait_ready(timeout=600):
+                raise RuntimeError("解析进程启动超时")
+            while pool.stats()["ready_workers"] < pool.stats()["workers"]:
+                time.sleep(0.1)
+            warmup_time = time.time() - start
+
+            start = time.time()
+            if workers == 1 and pages_per_job is None:
+                result = pool.parse(pdf_path).result()
+            else:
+                result = pool.parse_parallel(pdf_path, pages_per_job)
+            elapsed = time.time() - start
+        finally:
+            pool.shutdown()
+
+        if baseline_text is None:
+            baseline_text = result["markdown_texts"]
+        results.append({
+            "workers": workers,
+            "pages": page_count,
+            "warmup_s": round(warmup_time, 2),
+            "parse_s": round(elapsed, 2),
+            "pages_per_s": round(page_count / elapsed, 2),
+            "speedup": round(results[0]["parse_s"] / elapsed, 2) if results else 1.0,
+            "identical": result["markdown_texts"] == baseline_text,
+        })
+        print(json.dumps(results[-1], ensure_ascii=False))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按页并行OCR扩展性测试")
+    parser.add_argument("pdf", nargs="?", default="zjuProj.pdf")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--pages-per-job", type=int, default=None)
+    args = parser.parse_args()
+
+    worker_counts = sorted(set(args.workers))
+    print(json.dumps(run(args.pdf, worker_counts, args.pages_per_job), ensure_ascii=False, indent=2))
@@ -0,0 +1,261 @@
+"""
+端到端流水线基准：解析 → 图片过滤 → VLM描述 → 分块 → 向量化入库 → 检索 → 回答，
+大模型和视觉模型由本地替身服务（benchmarks.fake_llm_server）代替，不需要API密钥和浏览器。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.pipeline_e2e [pdf ...] [--synthetic-pages 5 20 50] [--parse-backend ocr|text]
+        [--llm-latency 0.3] [--vlm-latency 0.8] [--token-delay 0.01] [--error-rate 0.05] [--logo] [--output report.json]
+
+不给 pdf 时使用 zjuProj.pdf。在临时工作目录中运行（pages/、imgs/、chroma_db/ 和各类缓存不影响项目目录），
+文档依次处理、与界面一样共用 pages/ 和 imgs/；大模型响应缓存和图片描述缓存默认关闭，保证每次运行的调用次数可比。
+--logo 在合成PDF的每页加同一张图标，覆盖近似重复图片去重。
+--parse-backend text 用 PyMuPDF 文本层代替 PPStructureV3（没有安装 PaddleOCR 的环境）。
+结果为 JSON：每个阶段的耗时、期间峰值常驻内存、替身服务收到的调用次数，可在不同提交之间对比。
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from benchmarks.fake_llm_server import FakeLLMServer
+from benchmarks.synthetic_pdf import make_synthetic_pdf
+
+QUESTIONS = [
+    "这篇文章的主要贡献是什么？",
+    "实验使用了哪些数据集，F1-score提升了多少？",
+    "What learning rate and batch size were used?",
+    "第1张图片展示了什么？",
+]
+
+
+class RSSSampler:
+    """后台线程定期采样常驻内存，记录每个阶段内的峰值"""
+
+    def __init__(self, interval: float = 0.02):
+        from embedding_registry import current_rss_mb
+
+        self._read = current_rss_mb
+        self.interval = interval
+        self.peak = self._read()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._read())
+
+    def reset(self):
+        self.peak = self._read()
+
+    def stop(self):
+        self._stop.set()
+
+
+class StageRecorder:
+    def __init__(self, sampler: RSSSampler, servers: dict):
+        self.sampler = sampler
+        self.servers = servers
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        before = {key: server.stats() for key, server in self.servers.items()}
+        self.sampler.reset()
+        start = time.perf_counter()
+        record = {}
+        try:
+            yield record
+        finally:
+            record["wall_s"] = round(time.perf_counter() - start, 3)
+            record["peak_rss_mb"] = round(self.sampler.peak, 1)
+            calls = {}
+            for key, server in self.servers.items():
+                after = server.stats()
+                delta = {k: after[k] - before[key][k] for k in ("requests", "errors_429", "errors_503")}
+                if delta["requests"]:
+                    calls[key] = delta
+            if calls:
+                record["calls"] = calls
+            self.stages[name] = record
+
+
+def iter_text_layer_pages(pdf_path: str, page_delay: float = 0.0):
+    """
+    用文本层快速通道（text_layer）逐页产出与 PDFParser.predict_pages 相同格式的 markdown 信息，
+    代替 PPStructureV3；page_delay 模拟每页的OCR耗时
+    """
+    import fitz
+
+    from text_layer import FontProfile, page_markdown
+
+    with fitz.open(pdf_path) as pdf:
+        profile = FontProfile.from_document(pdf)
+        for page in pdf:
+            if page_delay:
+                time.sleep(page_delay)
+            yield page_markdown(page, profile)
+
+
+def parse_with_text_layer(pdf_path: str) -> dict:
+    """结果格式与 PDFParser.predict 相同（图片按页返回）"""
+    pages = list(iter_text_layer_pages(pdf_path))
+    return {"markdown_texts": "\n\n".join(page["markdown_texts"] for page in pages if page["markdown_texts"]),
+            "markdown_images": [page["markdown_images"] for page in pages]}
+
+
+def run_document(pdf_path: str, recorder: StageRecorder, parse_backend: str, vlm_concurrency: int) -> dict:
+    from image_manifest import ImageManifest
+    from llm_api import ask_question, extract_relevant_context, get_summary
+    from parse_cache import hash_pdf
+    from pdf_parser import describe_images
+    from text_util import iter_text_chunks
+    from vector_index import index_chunks
+
+    doc_key = hash_pdf(pdf_path)
+    result = {"pdf": os.path.basename(pdf_path)}
+
+    with recorder.stage("parse") as record:
+        if parse_backend == "ocr":
+            from pdf_parser_ocr import PDFParser
+            parser = PDFParser(pdf_path)
+            record["model_load_s"] = round(parser.load_time, 3)
+            parsed = parser.predict(pdf_path)
+        else:
+            parsed = parse_with_text_layer(pdf_path)
+        result["pages"] = len(parsed["markdown_images"])
+
+    with recorder.stage("image_filter") as record:
+        from pdf_parser_ocr import save_parse_result
+        save_parse_result(parsed)
+        manifest = ImageManifest.load("imgs")
+        record["images_total"] = sum(len(page) for page in parsed["markdown_images"] if isinstance(page, dict))
+        record["images_kept"] = len(manifest.entries)
+        record["images_duplicate"] = sum("duplicate_of" in entry for entry in manifest.entries)
+    del parsed
+
+    with recorder.stage("vlm_describe"):
+        imgs = [manifest.image_path(entry, "imgs") for entry in manifest.entries]
+        describe_images(imgs, "pages/img_descriptions.md", max_workers=vlm_concurrency, manifest=manifest)
+        manifest.save("imgs")
+
+    with open("pages/content.md", "r", encoding="utf-8") as f:
+        text = f.read()
+    with recorder.stage("chunk") as record:
+        chunks = list(iter_text_chunks(text))
+        record["chunks"] = len(chunks)
+
+    with recorder.stage("embed_index"):
+        index_chunks(doc_key, chunks)
+
+    with recorder.stage("retrieve") as record:
+        for question in QUESTIONS:
+            extract_relevant_context(question, doc_key)
+        record["queries"] = len(QUESTIONS)
+
+    with recorder.stage("answer") as record:
+        for question in QUESTIONS:
+            ask_question(text, question, doc_key)
+        record["questions"] = len(QUESTIONS)
+
+    with open("pages/img_descriptions.md", "r", encoding="utf-8") as f:
+        full_text = text + "\n" + f.read()
+    with recorder.stage("summary"):
+        get_summary(full_text)
+
+    result["stages"] = recorder.stages
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端流水线基准")
+    parser.add_argument("pdfs", nargs="*", default=["zjuProj.pdf"])
+    parser.add_argument("--synthetic-pages", type=int, nargs="*", default=[5, 20])
+    parser.add_argument("--images-per-page", type=int, default=1)
+    parser.add_argument("--parse-backend", choices=["ocr", "text"], default="ocr")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--vlm-latency", type=float, default=0.8)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--vlm-concurrency", type=int, default=4)
+    parser.add_argument("--logo", action="store_true", help="合成PDF每页加同一张图标")
+    parser.add_argument("--llm-cache", action="store_true", help="启用大模型响应缓存和图片描述缓存（默认关闭）")
+    parser.add_argument("--keep-workdir", action="store_true")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    servers = {
+        "vlm": FakeLLMServer("vlm", latency=args.vlm_latency, error_rate=args.error_rate, seed=1).start(),
+        "deepseek": FakeLLMServer("deepseek", latency=args.llm_latency, token_delay=args.token_delay,
+                                  error_rate=args.error_rate, seed=2).start(),
+    }
+    # 必须在导入流水线模块之前设置：服务地址在模块加载时读取
+    os.environ["VLM_BASE_URL"] = servers["vlm"].base_url + "/v1"
+    os.environ["DEEPSEEK_BASE_URL"] = servers["deepseek"].base_url + "/v1"
+    os.environ["VLM_API_KEY"] = "benchmark"
+    os.environ["NO_PROXY"] = "127.0.0.1,localhost"
+    if not args.llm_cache:
+        os.environ["LLM_CACHE_TTL"] = "0"
+        os.environ["VLM_CACHE"] = "0"
+
+    root = os.getcwd()
+    sys.path.insert(0, root)
+    scratch = tempfile.mkdtemp(prefix="pipeline_e2e_")
+    pdfs = [os.path.abspath(path) for path in args.pdfs]
+    for pages in args.synthetic_pages:
+        pdfs.append(make_synthetic_pdf(os.path.join(scratch, f"synthetic_{pages}p.pdf"), pages, args.images_per_page,
+                                       logo=args.logo))
+
+    os.environ["LLM_CACHE_PATH"] = os.path.join(scratch, "llm_cache.sqlite3")
+    os.environ["VLM_CACHE_PATH"] = os.path.join(scratch, "vlm_cache.sqlite3")
+    from real_llm_api import init_llm
+    init_llm("deepseek", "benchmark")
+
+    sampler = RSSSampler()
+    report = {
+        "commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("pdfs", "output", "keep_workdir")},
+        "documents": [],
+    }
+    workdir = os.path.join(scratch, "work")
+    os.makedirs(workdir)
+    os.chdir(workdir)
+    try:
+        for pdf_path in pdfs:
+            recorder = StageRecorder(sampler, servers)
+            start = time.perf_counter()
+            result = run_document(pdf_path, recorder, args.parse_backend, args.vlm_concurrency)
+            result["total_s"] = round(time.perf_counter() - start, 3)
+            report["documents"].append(result)
+        report["calls"] = {key: server.stats() for key, server in servers.items()}
+    finally:
+        os.chdir(root)
+        sampler.stop()
+        for server in servers.values():
+            server.stop()
+        if not args.keep_workdir:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+图片问题本地解析器的准确率与节省的大模型调用次数。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.question_parser_accuracy [语料路径] [--llm deepseek --api-key KEY]
+
+语料为 jsonl，每行 {"question": ..., "expected": [页, 序号]}。
+默认只评估本地解析器：本地能确定的问题算作节省一次大模型往返，统计其准确率；
+加 --llm 时，本地无法确定的问题交给大模型，统计整体准确率。
+"""
+import argparse
+import json
+import time
+
+from question_parser import parse_image_question
+
+
+def load_corpus(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run(corpus, use_llm=False):
+    if use_llm:
+        from llm_api import classify_image_question
+
+    report = {"total": len(corpus), "local_decided": 0, "local_correct": 0,
+              "llm_calls": 0, "llm_correct": 0, "errors": []}
+    start = time.perf_counter()
+    for item in corpus:
+        expected = tuple(item["expected"])
+        local = parse_image_question(item["question"])
+        if local is not None:
+            report["local_decided"] += 1
+            if local == expected:
+                report["local_correct"] += 1
+            else:
+                report["errors"].append({"question": item["question"], "expected": expected, "local": local})
+            continue
+        if use_llm:
+            report["llm_calls"] += 1
+            answer = classify_image_question(item["question"])
+            if answer == expected:
+                report["llm_correct"] += 1
+            else:
+                report["errors"].append({"question": item["question"], "expected": expected, "llm": answer})
+    elapsed = time.perf_counter() - start
+
+    decided = report["local_decided"]
+    report["local_precision"] = round(report["local_correct"] / decided, 3) if decided else None
+    report["round_trips_saved"] = decided
+    report["round_trips_saved_ratio"] = round(decided / len(corpus), 3) if corpus else None
+    if use_llm:
+        report["overall_accuracy"] = round((report["local_correct"] + report["llm_correct"]) / len(corpus), 3)
+    else:
+        report["local_parse_ms"] = round(elapsed * 1000 / max(len(corpus), 1), 3)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="图片问题本地解析器评估")
+    parser.add_argument("corpus", nargs="?", default="benchmarks/image_questions.jsonl")
+    parser.add_argument("--llm", default=None, help="本地无法确定时使用的大模型，如 deepseek")
+    parser.add_argument("--api-key", default="")
+    args = parser.parse_args()
+
+    if args.llm:
+        from real_llm_api import init_llm
+        init_llm(args.llm, args.api_key)
+    print(json.dumps(run(load_corpus(args.corpus), use_llm=bool(args.llm)), ensure_ascii=False, indent=2))
@@ -0,0 +1,66 @@
+"""
+BM25 稀疏检索的建索引耗时与单次查询延迟。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.sparse_retrieval [pdf路径] [--copies N]
+
+直接用 PyMuPDF 取出 PDF 的文本层，按与入库相同的 200 字符分块；
+--copies 把分块复制 N 份，模拟更长的文档。
+"""
+import argparse
+import json
+import statistics
+import time
+
+import fitz
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from sparse_index import BM25Index
+
+QUERIES = [
+    "实验使用了哪些数据集",
+    "模型的准确率是多少",
+    "What is the F1-score on the test set?",
+    "公式3是怎么推导的",
+    "本文的主要贡献",
+    "ResNet-50 baseline",
+    "系统架构由哪些模块组成",
+    "训练时的学习率和batch size",
+]
+
+
+def load_chunks(pdf_path, copies):
+    with fitz.open(pdf_path) as pdf:
+        text = "\n\n".join(page.get_text() for page in pdf)
+    chunks = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=10).split_text(text)
+    return chunks * copies
+
+
+def run(pdf_path, copies=1, repeat=50):
+    chunks = load_chunks(pdf_path, copies)
+    start = time.perf_counter()
+    index = BM25Index([str(i) for i in range(len(chunks))], chunks, [{} for _ in chunks])
+    build_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            start = time.perf_counter()
+            index.search(query, k=20)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "chunks": len(chunks),
+        "terms": len(index.postings),
+        "build_ms": round(build_ms, 2),
+        "query_ms_median": round(statistics.median(latencies), 3),
+        "query_ms_p99": round(latencies[int(len(latencies) * 0.99) - 1], 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BM25 稀疏检索基准")
+    parser.add_argument("pdf", nargs="?", default="zjuProj.pdf")
+    parser.add_argument("--copies", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(run(args.pdf, args.copies), ensure_ascii=False, indent=2))
@@ -0,0 +1,175 @@
+"""
+流式入库（ingest.StreamingIngest）与分阶段入库的对比：首个问题可回答的时间（time-to-first-answer）和全部入库耗时。
+大模型和视觉模型由本地替身服务代替。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.streaming_ingest [pdf ...] [--synthetic-pages 40] [--parse-backend text|ocr]
+        [--ocr-delay 0.3] [--vlm-latency 0.8] [--llm-latency 0.3] [--output report.json]
+
+--parse-backend text（默认）用 PyMuPDF 文本层加每页 --ocr-delay 秒的延迟模拟OCR，不需要 PaddleOCR；
+ocr 使用常驻解析进程池（--parse-workers 个进程）。
+每份文档先流式入库、后分阶段入库；分阶段在后，可复用分块向量缓存，对比结果偏向分阶段。
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_llm_server import FakeLLMServer
+from benchmarks.pipeline_e2e import git_commit, iter_text_layer_pages
+from benchmarks.synthetic_pdf import make_synthetic_pdf
+
+QUESTION = "实验使用了哪些数据集，F1-score提升了多少？"
+
+
+def page_source(pdf_path: str, backend: str, pool, ocr_delay: float):
+    if backend == "ocr":
+        from ingest import PAGES_PER_JOB
+        return pool.iter_pages(pdf_path, PAGES_PER_JOB)
+    return iter_text_layer_pages(pdf_path, ocr_delay)
+
+
+def run_streaming(pdf_path: str, doc_key: str, args, pool) -> dict:
+    from ingest import StreamingIngest
+    from llm_api import ask_question
+    from parse_worker import count_pages
+
+    start = time.perf_counter()
+    job = StreamingIngest(doc_key, page_source(pdf_path, args.parse_backend, pool, args.ocr_delay),
+                          total_pages=count_pages(pdf_path), vlm_concurrency=args.vlm_concurrency).start()
+    while not job.done() and job.stats()["chunks_indexed"] == 0:
+        time.sleep(0.01)
+    first_indexed = time.perf_counter() - start
+    ask_question("", QUESTION, doc_key)
+    first_answer = time.perf_counter() - start
+    pages_at_answer = job.stats()["pages_indexed"]
+    job.wait()
+    stats = job.stats()
+    return {
+        "first_indexed_s": round(first_indexed, 3),
+        "first_answer_s": round(first_answer, 3),
+        "pages_indexed_at_first_answer": pages_at_answer,
+        "total_s": round(time.perf_counter() - start, 3),
+        "chunks": stats["chunks_indexed"],
+        "images": stats["images_described"],
+        "error": stats["error"],
+    }
+
+
+def run_phased(pdf_path: str, doc_key: str, args, pool) -> dict:
+    from image_manifest import ImageManifest
+    from llm_api import ask_question
+    from pdf_parser import describe_images
+    from pdf_parser_ocr import MarkdownPageJoiner, save_parse_result
+    from text_util import iter_text_chunks
+    from vector_index import index_chunks
+
+    start = time.perf_counter()
+    joiner = MarkdownPageJoiner()
+    pages = list(page_source(pdf_path, args.parse_backend, pool, args.ocr_delay))
+    save_parse_result({"markdown_texts": "".join(joiner.add(page) for page in pages),
+                       "markdown_images": [page.get("markdown_images", {}) for page in pages]})
+    del pages
+    manifest = ImageManifest.load("imgs")
+    imgs = [manifest.image_path(entry, "imgs") for entry in manifest.entries]
+    describe_images(imgs, "pages/img_descriptions.md", max_workers=args.vlm_concurrency, manifest=manifest)
+    manifest.save("imgs")
+    with open("pages/content.md", "r", encoding="utf-8") as f:
+        index_chunks(doc_key, iter_text_chunks(f.read()))
+    ingest_s = time.perf_counter() - start
+    ask_question("", QUESTION, doc_key)
+    return {
+        "first_answer_s": round(time.perf_counter() - start, 3),
+        "total_s": round(ingest_s, 3),
+        "images": len(imgs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式入库与分阶段入库对比")
+    parser.add_argument("pdfs", nargs="*", default=[])
+    parser.add_argument("--synthetic-pages", type=int, nargs="*", default=[40])
+    parser.add_argument("--images-per-page", type=int, default=1)
+    parser.add_argument("--parse-backend", choices=["ocr", "text"], default="text")
+    parser.add_argument("--parse-workers", type=int, default=1)
+    parser.add_argument("--ocr-delay", type=float, default=0.3, help="text 模式下每页模拟的OCR秒数")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--vlm-latency", type=float, default=0.8)
+    parser.add_argument("--vlm-concurrency", type=int, default=4)
+    parser.add_argument("--keep-workdir", action="store_true")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    servers = {
+        "vlm": FakeLLMServer("vlm", latency=args.vlm_latency, seed=1).start(),
+        "deepseek": FakeLLMServer("deepseek", latency=args.llm_latency, seed=2).start(),
+    }
+    # 必须在导入流水线模块之前设置：服务地址在模块加载时读取
+    os.environ["VLM_BASE_URL"] = servers["vlm"].base_url + "/v1"
+    os.environ["DEEPSEEK_BASE_URL"] = servers["deepseek"].base_url + "/v1"
+    os.environ["VLM_API_KEY"] = "benchmark"
+    os.environ["NO_PROXY"] = "127.0.0.1,localhost"
+    os.environ["LLM_CACHE_TTL"] = "0"
+    # 分阶段在后，图片描述缓存会让它不调用VLM
+    os.environ["VLM_CACHE"] = "0"
+
+    root = os.getcwd()
+    sys.path.insert(0, root)
+    scratch = tempfile.mkdtemp(prefix="streaming_ingest_")
+    pdfs = [os.path.abspath(path) for path in args.pdfs]
+    for pages in args.synthetic_pages:
+        pdfs.append(make_synthetic_pdf(os.path.join(scratch, f"synthetic_{pages}p.pdf"), pages, args.images_per_page))
+
+    from embedding_registry import warm_up
+    from parse_cache import hash_pdf
+    from real_llm_api import init_llm
+    init_llm("deepseek", "benchmark")
+
+    pool = None
+    if args.parse_backend == "ocr":
+        from parse_worker import ParseWorkerPool
+        pool = ParseWorkerPool(num_workers=args.parse_workers)
+        pool.wait_ready()
+
+    report = {
+        "commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("pdfs", "output", "keep_workdir")},
+        "documents": [],
+    }
+    workdir = os.path.join(scratch, "work")
+    os.makedirs(workdir)
+    os.chdir(workdir)
+    try:
+        # 向量模型加载不计入任何一种方式
+        warm_up()
+        for pdf_path in pdfs:
+            content_hash = hash_pdf(pdf_path)
+            streaming = run_streaming(pdf_path, "stream" + content_hash, args, pool)
+            phased = run_phased(pdf_path, "phased" + content_hash, args, pool)
+            report["documents"].append({
+                "pdf": os.path.basename(pdf_path),
+                "streaming": streaming,
+                "phased": phased,
+                "first_answer_speedup": round(phased["first_answer_s"] / streaming["first_answer_s"], 2),
+            })
+    finally:
+        os.chdir(root)
+        if pool is not None:
+            pool.shutdown()
+        for server in servers.values():
+            server.stop()
+        if not args.keep_workdir:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+分段总结（summarizer.split_sections）分段边界的局部性检查：随机生成论文式的markdown，修改其中一个小节的正文
+（变长、变短或改写），要求除包含该小节的分段（修改前或修改后）以外，其余分段的提示词完全不变，
+即文档局部修改后只有受影响的分段需要重新总结，其余分段的响应缓存仍然命中。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.summary_sections [--docs 200] [--edits 5] [--seed 0]
+
+另外固定检查一例：六个约500 token的同级小节，把第一个加长到约900 token。
+"""
+import argparse
+import json
+import random
+import re
+
+from summarizer import SECTION_PROMPT, split_sections
+from text_util import estimate_tokens
+
+WORDS = ["model", "accuracy", "dataset", "training", "baseline", "F1-score", "表1", "实验结果表明", "显著优于基线",
+         "本文提出了一种新的方法", "learning rate", "0.93"]
+MARKER = re.compile(r"^#+ S(\d+) ", re.MULTILINE)
+
+
+def body(rng, tokens):
+    words, total = [], 0
+    while total < tokens:
+        words.append(rng.choice(WORDS))
+        total += estimate_tokens(words[-1] + " ")
+    return " ".join(words)
+
+
+def random_paper(rng):
+    """(标题行, 正文) 列表；标题中的 S{序号} 用来识别分段包含哪些小节"""
+    sections = [("# S0 Title", body(rng, rng.randint(20, 300)))]
+    for _ in range(rng.randint(3, 12)):
+        sections.append((f"## S{len(sections)} Section", body(rng, rng.choice([100, 400, 700, 1500, 5000]))))
+        for _ in range(rng.choice([0, 0, 1, 3, 6])):
+            sections.append((f"### S{len(sections)} Subsection", body(rng, rng.randint(50, 1200))))
+    return sections
+
+
+def render(sections):
+    return "\n\n".join(f"{heading}\n\n{text}" for heading, text in sections)
+
+
+def groups(sections):
+    """每个分段的提示词和它包含的小节序号（超长小节切开后，不以标题开头的分段属于前一个小节）"""
+    result, last = [], None
+    for text in split_sections(render(sections)):
+        members = {int(i) for i in MARKER.findall(text)}
+        if not text.startswith("#") and last is not None:
+            members.add(last)
+        last = max(members) if members else last
+        result.append((SECTION_PROMPT.format(text=text), frozenset(members)))
+    return result
+
+
+def check_edit(sections, index, text):
+    edited = list(sections)
+    edited[index] = (sections[index][0], text)
+    before, after = groups(sections), groups(edited)
+    touched = set()
+    for _, members in before + after:
+        if index in members:
+            touched |= members
+    others_before = [prompt for prompt, members in before if not members & touched]
+    others_after = [prompt for prompt, members in after if not members & touched]
+    reused = sum(1 for prompt, _ in after if prompt in {p for p, _ in before})
+    return others_before == others_after, reused, len(after)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分段总结分段边界的局部性检查")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--edits", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    report = {"edits": 0, "violations": [], "prompts": 0, "prompts_reused": 0}
+    for doc in range(args.docs):
+        sections = random_paper(rng)
+        for _ in range(args.edits):
+            index = rng.randrange(len(sections))
+            tokens = estimate_tokens(sections[index][1])
+            text = body(rng, max(10, int(tokens * rng.choice([0.3, 0.9, 1.0, 1.8, 4.0]))))
+            unchanged, reused, prompts = check_edit(sections, index, text)
+            report["edits"] += 1
+            report["prompts"] += prompts
+            report["prompts_reused"] += reused
+            if not unchanged:
+                report["violations"].append({"document": doc, "section": index})
+
+    siblings = [("# S0 Title", "")] + [(f"## S{i} Section", body(rng, 500)) for i in range(1, 7)]
+    report["six_sections_case"] = check_edit(siblings, 1, body(rng, 900))[0]
+    report["reuse_ratio"] = round(report["prompts_reused"] / max(report["prompts"], 1), 3)
+    report["local"] = not report["violations"] and report["six_sections_case"]
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if not report["local"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+生成指定页数的合成PDF，供基准测试使用：每页有标题、中英文段落和若干插图，
+其中部分插图是纯白图片，用来覆盖无效图片过滤；--logo 在每页放同一张图标（重新编码、尺寸不同），用来覆盖近似重复图片去重。
+
+用法:
+    python -m benchmarks.synthetic_pdf out.pdf --pages 20 --images-per-page 2 [--logo]
+"""
+import argparse
+import io
+import random
+
+import numpy as np
+from PIL import Image
+
+PARAGRAPHS = [
+    "We propose a lightweight retrieval-augmented pipeline for reading academic papers. "
+    "The system parses PDF layouts, describes figures with a vision-language model and answers questions.",
+    "Experiments on three benchmark datasets show that the method improves F1-score by 3.2 points "
+    "over the strongest baseline while reducing latency by 40%.",
+    "Table 1 lists the hyper-parameters: learning rate 3e-4, batch size 32, 20 epochs with cosine decay.",
+]
+CJK_FONT = "china-s"
+
+
+def random_image(rng: random.Random, blank: bool = False) -> bytes:
+    width, height = rng.randint(200, 480), rng.randint(150, 360)
+    if blank:
+        array = np.full((height, width, 3), 255, dtype=np.uint8)
+    else:
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        noise = np.random.default_rng(rng.randint(0, 2 ** 31)).integers(0, 80, (height, width, 3))
+        array = np.clip(gradient * np.array([1.0, 0.6, 0.3]) + noise, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def logo_image(size: int) -> bytes:
+    """同一张图标的不同尺寸、不同编码版本，感知哈希应近似相同"""
+    yy, xx = np.mgrid[0:size, 0:size] / size
+    array = np.zeros((size, size, 3), dtype=np.uint8)
+    array[..., 0] = np.where((xx - 0.5) ** 2 + (yy - 0.5) ** 2 < 0.16, 200, 30)
+    array[..., 2] = (yy * 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format="JPEG" if size % 2 else "PNG", quality=85)
+    return buffer.getvalue()
+
+
+def make_synthetic_pdf(path: str, pages: int, images_per_page: int = 1, seed: int = 0, logo: bool = False) -> str:
+    import fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_num in range(1, pages + 1):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((56, 72), f"{page_num} Section {page_num}: Method and Results", fontsize=18)
+        y = 100
+        page.insert_textbox(fitz.Rect(56, y, 539, y + 60),
+                            f"第{page_num}节介绍了实验设置与结果分析，图{page_num}给出了整体流程。",
+                            fontsize=11, fontname=CJK_FONT)
+        y += 60
+        for _ in range(2):
+            page.insert_textbox(fitz.Rect(56, y, 539, y + 80), rng.choice(PARAGRAPHS), fontsize=11)
+            y += 80
+        for image_index in range(images_per_page):
+            # 每三页放一张纯白图片，应被过滤掉
+            blank = image_index == 0 and page_num % 3 == 0
+            top = y + image_index * 170
+            page.insert_image(fitz.Rect(100, top, 495, top + 160), stream=random_image(rng, blank))
+        if logo:
+            page.insert_image(fitz.Rect(495, 20, 555, 80), stream=logo_image(rng.randint(64, 160)))
+    doc.save(path)
+    doc.close()
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成合成PDF")
+    parser.add_argument("output")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--images-per-page", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--logo", action="store_true")
+    args = parser.parse_args()
+    print(make_synthetic_pdf(args.output, args.pages, args.images_per_page, args.seed, args.logo))
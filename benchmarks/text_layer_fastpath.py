@@ -0,0 +1,123 @@
+"""
+文本层快速通道（text_layer）的测量：每页的判定结果（文本层 / 扫描 / 乱码）、文本层提取耗时、
+提取出的标题数和插图数；加 --ocr 时用 PPStructureV3 解析同一份PDF，对比耗时和标题数。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.text_layer_fastpath [pdf ...] [--synthetic-pages 20] [--ocr] [--dump-dir out/]
+        [--output report.json]
+
+--dump-dir 写出每份PDF两种方式的 markdown，便于人工对比。
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.synthetic_pdf import make_synthetic_pdf
+
+HEADING = re.compile(r"^#+ ", re.MULTILINE)
+
+
+def measure_text_layer(pdf_path: str) -> tuple:
+    import fitz
+
+    from text_layer import FontProfile, classify_page, page_markdown
+
+    result = {"pages": 0, "classes": Counter(), "classify_ms": 0.0, "extract_ms": 0.0, "figures": 0}
+    markdown = []
+    with fitz.open(pdf_path) as doc:
+        start = time.perf_counter()
+        profile = FontProfile.from_document(doc)
+        result["profile_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        for page in doc:
+            start = time.perf_counter()
+            reason = classify_page(page)
+            result["classify_ms"] += (time.perf_counter() - start) * 1000
+            result["classes"][reason or "text_layer"] += 1
+            result["pages"] += 1
+            if reason is not None:
+                continue
+            start = time.perf_counter()
+            md_info = page_markdown(page, profile)
+            result["extract_ms"] += (time.perf_counter() - start) * 1000
+            result["figures"] += len(md_info["markdown_images"])
+            markdown.append(md_info["markdown_texts"])
+    text = "\n\n".join(markdown)
+    result["classes"] = dict(result["classes"])
+    result["classify_ms"] = round(result["classify_ms"], 1)
+    result["extract_ms"] = round(result["extract_ms"], 1)
+    text_pages = result["classes"].get("text_layer", 0)
+    result["extract_ms_per_page"] = round(result["extract_ms"] / text_pages, 1) if text_pages else None
+    result["headings"] = len(HEADING.findall(text))
+    result["chars"] = len(text)
+    return result, text
+
+
+def measure_ocr(pdf_path: str, parser) -> tuple:
+    start = time.perf_counter()
+    parsed = parser.predict(pdf_path)
+    text = parsed["markdown_texts"]
+    return {
+        "total_s": round(time.perf_counter() - start, 2),
+        "headings": len(HEADING.findall(text)),
+        "chars": len(text),
+        "figures": sum(len(page) for page in parsed["markdown_images"] if isinstance(page, dict)),
+    }, text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文本层快速通道测量")
+    parser.add_argument("pdfs", nargs="*", default=["zjuProj.pdf"])
+    parser.add_argument("--synthetic-pages", type=int, nargs="*", default=[])
+    parser.add_argument("--ocr", action="store_true", help="同时用 PPStructureV3 解析并对比（需要 PaddleOCR）")
+    parser.add_argument("--dump-dir", default=None)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.getcwd())
+    scratch = tempfile.mkdtemp(prefix="text_layer_")
+    pdfs = [os.path.abspath(path) for path in args.pdfs]
+    for pages in args.synthetic_pages:
+        pdfs.append(make_synthetic_pdf(os.path.join(scratch, f"synthetic_{pages}p.pdf"), pages))
+
+    ocr_parser = None
+    if args.ocr:
+        from pdf_parser_ocr import PDFParser
+        ocr_parser = PDFParser()
+    if args.dump_dir:
+        os.makedirs(args.dump_dir, exist_ok=True)
+
+    report = {"documents": []}
+    try:
+        for pdf_path in pdfs:
+            name = os.path.splitext(os.path.basename(pdf_path))[0]
+            text_layer, text = measure_text_layer(pdf_path)
+            entry = {"pdf": os.path.basename(pdf_path), "text_layer": text_layer}
+            if args.dump_dir:
+                with open(os.path.join(args.dump_dir, f"{name}.text_layer.md"), "w", encoding="utf-8") as f:
+                    f.write(text)
+            if ocr_parser is not None:
+                entry["ocr"], ocr_text = measure_ocr(pdf_path, ocr_parser)
+                text_layer_s = (text_layer["profile_ms"] + text_layer["classify_ms"] + text_layer["extract_ms"]) / 1000
+                entry["speedup"] = round(entry["ocr"]["total_s"] / max(text_layer_s, 1e-6), 1)
+                if args.dump_dir:
+                    with open(os.path.join(args.dump_dir, f"{name}.ocr.md"), "w", encoding="utf-8") as f:
+                        f.write(ocr_text)
+            report["documents"].append(entry)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+埋点开销：关闭时（默认）与开启时，每次 span / traced 调用 / 计数器累加的额外耗时。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.tracing_overhead [--iterations 200000]
+
+开启时的结构化日志写到临时文件，不影响 traces/ 目录。
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import tracing
+
+
+def plain(x):
+    return x + 1
+
+
+@tracing.traced("bench")
+def traced_call(x):
+    return x + 1
+
+
+def with_span(x):
+    with tracing.span("bench", x=x):
+        return x + 1
+
+
+def with_count(x):
+    tracing.count("bench", provider="bench")
+    return x + 1
+
+
+def per_call_ns(func, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def measure(iterations):
+    baseline = per_call_ns(plain, iterations)
+    return {
+        name: round(per_call_ns(func, iterations) - baseline, 1)
+        for name, func in (("traced", traced_call), ("span", with_span), ("count", with_count))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="埋点开销")
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    tracing.disable()
+    disabled = measure(args.iterations)
+    with tempfile.TemporaryDirectory() as tmp:
+        tracing.enable(os.path.join(tmp, "spans.jsonl"))
+        # 开启时每个span都写一行日志，次数少一些
+        enabled = measure(max(1, args.iterations // 20))
+        tracing.disable()
+    print(json.dumps({"extra_ns_per_call": {"disabled": disabled, "enabled": enabled}}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
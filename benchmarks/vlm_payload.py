@@ -0,0 +1,127 @@
+"""
+VLM上传图片预处理（image_encoding.encode_image）的对比：不同最长边和编码格式下的上传字节数、编码耗时，
+以及与原图（缩放到同一尺寸后比较）的 PSNR，用来判断压缩是否损失了可辨认的细节。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.vlm_payload [pdf ...] [--max-edge 0 1600 1280 1024] [--format png jpeg webp]
+        [--quality 85] [--describe] [--output report.json]
+
+图片取自 PDF 中的插图和按 100dpi 渲染的整页（与 extract_text_and_images_from_pdf 相同）。
+--describe 用真实VLM（需要 VLM_API_KEY）描述每种设置下的前几张图片，记录每张的耗时和描述，便于人工比较描述质量。
+--max-edge 0 表示不缩放。
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+
+def extract_images(pdf_path: str, out_dir: str, limit: int) -> list:
+    import fitz
+
+    paths = []
+    with fitz.open(pdf_path) as pdf:
+        for page_index, page in enumerate(pdf):
+            if len(paths) >= limit:
+                break
+            page_path = os.path.join(out_dir, f"page_{page_index + 1}.png")
+            page.get_pixmap(dpi=100).save(page_path)
+            paths.append(page_path)
+            for image_index, info in enumerate(page.get_images(full=True)):
+                data = pdf.extract_image(info[0])
+                image_path = os.path.join(out_dir, f"page_{page_index + 1}_img_{image_index + 1}.{data['ext']}")
+                with open(image_path, "wb") as f:
+                    f.write(data["image"])
+                paths.append(image_path)
+    return paths[:limit]
+
+
+def psnr(original: Image.Image, encoded: Image.Image) -> float:
+    reference = np.asarray(original.convert("RGB").resize(encoded.size, Image.LANCZOS), dtype=np.float64)
+    mse = np.mean((reference - np.asarray(encoded.convert("RGB"), dtype=np.float64)) ** 2)
+    return float("inf") if mse == 0 else round(10 * np.log10(255 ** 2 / mse), 2)
+
+
+def run_setting(paths: list, max_edge: int, image_format: str, quality: int, describe: int) -> dict:
+    from image_encoding import encode_image
+
+    record = {"max_edge": max_edge, "format": image_format, "bytes_original": 0, "bytes_sent": 0,
+              "encode_ms": 0.0, "psnr": []}
+    for path in paths:
+        start = time.perf_counter()
+        encoded, _ = encode_image(path, max_edge or 10 ** 6, image_format, quality)
+        record["encode_ms"] += (time.perf_counter() - start) * 1000
+        data = base64.b64decode(encoded)
+        record["bytes_original"] += os.path.getsize(path)
+        record["bytes_sent"] += len(data)
+        with Image.open(path) as original, Image.open(io.BytesIO(data)) as sent:
+            record["psnr"].append(psnr(original, sent))
+    record["encode_ms"] = round(record["encode_ms"], 1)
+    finite = [value for value in record["psnr"] if value != float("inf")]
+    record["psnr"] = round(min(finite), 2) if finite else None
+    record["ratio"] = round(record["bytes_sent"] / record["bytes_original"], 3)
+
+    if describe:
+        from http_transport import get_vlm_client
+        from pdf_parser import IMAGE_DESCRIPTION_PROMPT, VLM_BASE_URL, VLM_MODEL, build_vlm_messages
+
+        client = get_vlm_client(os.environ["VLM_API_KEY"], VLM_BASE_URL)
+        record["descriptions"] = []
+        for path in paths[:describe]:
+            encoded, mime = encode_image(path, max_edge or 10 ** 6, image_format, quality)
+            start = time.perf_counter()
+            completion = client.chat.completions.create(
+                model=VLM_MODEL, messages=build_vlm_messages(encoded, IMAGE_DESCRIPTION_PROMPT, mime), timeout=60)
+            record["descriptions"].append({
+                "image": os.path.basename(path),
+                "latency_s": round(time.perf_counter() - start, 2),
+                "text": (completion.choices[0].message.content or "").strip(),
+            })
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VLM上传图片预处理对比")
+    parser.add_argument("pdfs", nargs="*", default=["zjuProj.pdf"])
+    parser.add_argument("--max-edge", type=int, nargs="*", default=[0, 1600, 1280, 1024])
+    parser.add_argument("--format", nargs="*", default=["png", "jpeg", "webp"])
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--images", type=int, default=40, help="每份PDF最多取多少张图片（含整页）")
+    parser.add_argument("--describe", type=int, nargs="?", const=3, default=0,
+                        help="用真实VLM描述每种设置下的前N张图片（默认3）")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.getcwd())
+    scratch = tempfile.mkdtemp(prefix="vlm_payload_")
+    paths = []
+    report = {"quality": args.quality, "settings": []}
+    try:
+        for pdf_path in args.pdfs:
+            out_dir = os.path.join(scratch, os.path.splitext(os.path.basename(pdf_path))[0])
+            os.makedirs(out_dir)
+            paths.extend(extract_images(pdf_path, out_dir, args.images))
+        report["images"] = len(paths)
+        for max_edge in args.max_edge:
+            for image_format in args.format:
+                report["settings"].append(run_setting(paths, max_edge, image_format, args.quality, args.describe))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from file_lock import file_lock
+
+CACHE_ROOT = "./embedding_cache"
+
+
+def normalize_text(text: str) -> str:
+    """归一化分块文本：NFKC、合并空白、去掉首尾空白"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    持久化的分块向量缓存，每个向量模型一个目录：
+    vectors.f16 为 float16 行矩阵（内存映射读取），index.txt 每行一个文本哈希，行号即矩阵行号。
+    两个文件都只追加写入，先写向量再写索引；加载时把两个文件截断到一致的行数，中途崩溃最多丢掉最后一批。
+    界面和批量入库等多个进程可共用同一目录：追加在目录下的 lock 文件锁内进行，追加前先读入其他进程已追加的行。
+    """
+
+    def __init__(self, model_name: str, root: str = CACHE_ROOT):
+        safe_name = re.sub(r"[^0-9A-Za-z_.-]", "_", model_name)
+        self.dir = Path(root) / safe_name
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.dir / "vectors.f16"
+        self.index_path = self.dir / "index.txt"
+        self.lock_path = self.dir / "lock"
+        self.dim: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._rows: Dict[str, int] = {}
+        # 已读入的索引行数（即向量行数）和这些行在 index.txt 中的字节数
+        self._count = 0
+        self._index_bytes = 0
+        self._matrix = None
+        self._lock = threading.Lock()
+        with self._lock, file_lock(self.lock_path):
+            self._sync()
+        self._remap()
+
+    def _sync(self):
+        """
+        在文件锁内调用：读入 index.txt 中尚未读入的行（其他进程追加的），并把两个文件截断到一致的行数。
+        持锁时没有进程在写，不一致只能是崩溃留下的：没有换行符的末行、没有索引的向量行或没有向量的索引行，
+        不截断的话之后追加的向量与索引行号错位，会返回别的文本的向量。
+        """
+        dim_path = self.dir / "dim"
+        if self.dim is None and dim_path.exists():
+            self.dim = int(dim_path.read_text().strip())
+        if self.dim is None:
+            return
+        tail = b""
+        if self.index_path.exists():
+            with open(self.index_path, "rb") as f:
+                f.seek(self._index_bytes)
+                tail = f.read()
+        lines = tail.split(b"\n")[:-1]
+        row_bytes = self.dim * 2
+        row_count = os.path.getsize(self.vectors_path) // row_bytes if self.vectors_path.exists() else 0
+        keep = max(0, min(len(lines), row_count - self._count))
+        if self.vectors_path.exists() and os.path.getsize(self.vectors_path) != (self._count + keep) * row_bytes:
+            os.truncate(self.vectors_path, (self._count + keep) * row_bytes)
+        kept_bytes = sum(len(line) + 1 for line in lines[:keep])
+        if kept_bytes != len(tail):
+            os.truncate(self.index_path, self._index_bytes + kept_bytes)
+        for line in lines[:keep]:
+            self._rows[line.rstrip(b"\r").decode("utf-8")] = self._count
+            self._count += 1
+        self._index_bytes += kept_bytes
+
+    def _remap(self):
+        if self._count and self.dim:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(self._count, self.dim))
+        else:
+            self._matrix = None
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """批量查询，未命中的位置为 None"""
+        with self._lock:
+            rows = [self._rows.get(key) for key in keys]
+            found = [i for i, row in enumerate(rows) if row is not None]
+            result: List[Optional[np.ndarray]] = [None] * len(keys)
+            if found:
+                block = np.asarray(self._matrix[[rows[i] for i in found]], dtype=np.float32)
+                for i, vector in zip(found, block):
+                    result[i] = vector
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            return result
+
+    def add_many(self, keys: List[str], vectors: np.ndarray):
+        with self._lock, file_lock(self.lock_path):
+            count = self._count
+            self._sync()
+            new = [(key, vector) for key, vector in zip(keys, vectors) if key not in self._rows]
+            if new:
+                if self.dim is None:
+                    self.dim = int(vectors.shape[1])
+                    (self.dir / "dim").write_text(str(self.dim))
+                block = np.asarray([vector for _, vector in new], dtype=np.float16)
+                with open(self.vectors_path, "ab") as f:
+                    f.write(block.tobytes())
+                data = "".join(key + "\n" for key, _ in new).encode("utf-8")
+                with open(self.index_path, "ab") as f:
+                    f.write(data)
+                for key, _ in new:
+                    self._rows[key] = self._count
+                    self._count += 1
+                self._index_bytes += len(data)
+            if self._count != count:
+                self._remap()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._rows), "hits": self.hits, "misses": self.misses}
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带分块缓存的向量模型包装：embed_documents 只把未命中的文本交给底层模型，
+    查询向量不缓存，直接透传。
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_key(text) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        miss_texts = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None and key not in miss_texts:
+                miss_texts[key] = text
+        if miss_texts:
+            miss_keys = list(miss_texts)
+            computed = np.asarray(self.embeddings.embed_documents([miss_texts[k] for k in miss_keys]), dtype=np.float32)
+            self.cache.add_many(miss_keys, computed)
+            # 与缓存命中时保持一致，统一返回 float16 精度的向量
+            computed_by_key = dict(zip(miss_keys, computed.astype(np.float16).astype(np.float32)))
+            vectors = [computed_by_key[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
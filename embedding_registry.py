@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_community.vectorstores import Chroma
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from text_util import EMBEDDING_MODEL_NAME
+import tracing
+
+# 向量推理后端："torch"（HuggingFaceEmbeddings，全精度）或 "onnx-int8"（量化的 ONNX Runtime CPU 推理）
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+
+# 进程内共享：问答、不同会话和入库都复用同一份模型与向量库句柄
+_lock = threading.RLock()
+_embeddings: Dict[str, object] = {}
+_load_times: Dict[str, float] = {}
+_cached_embeddings: Dict[str, CachedEmbeddings] = {}
+_vectorstores: Dict[Tuple[str, Optional[str], str], Chroma] = {}
+
+
+def backend_model_id(model_name: str = EMBEDDING_MODEL_NAME) -> str:
+    """区分后端的模型标识，量化后端的向量与全精度略有差异，分块缓存分开存放"""
+    return model_name if EMBEDDING_BACKEND == "torch" else f"{model_name}@{EMBEDDING_BACKEND}"
+
+
+def get_embeddings(model_name: str = EMBEDDING_MODEL_NAME):
+    """获取向量模型（按 EMBEDDING_BACKEND 选择后端），首次调用时加载，之后直接复用"""
+    embeddings = _embeddings.get(model_name)
+    if embeddings is not None:
+        return embeddings
+    with _lock:
+        if model_name not in _embeddings:
+            start = time.time()
+            with tracing.span("load_embedding_model", model=model_name, backend=EMBEDDING_BACKEND):
+                if EMBEDDING_BACKEND == "onnx-int8":
+                    from onnx_embeddings import OnnxEmbeddings
+                    _embeddings[model_name] = OnnxEmbeddings(model_name)
+                elif EMBEDDING_BACKEND == "torch":
+                    _embeddings[model_name] = HuggingFaceEmbeddings(model_name=model_name)
+                else:
+                    raise ValueError(f"不支持的向量后端: {EMBEDDING_BACKEND}")
+            _load_times[model_name] = time.time() - start
+            print(f"向量模型 {model_name} 加载耗时: {_load_times[model_name]:.1f}s")
+        return _embeddings[model_name]
+
+
+def get_cached_embeddings(model_name: str = EMBEDDING_MODEL_NAME) -> CachedEmbeddings:
+    """带持久化分块缓存的向量模型，底层模型只在出现未命中时才加载"""
+    cached = _cached_embeddings.get(model_name)
+    if cached is not None:
+        return cached
+    with _lock:
+        if model_name not in _cached_embeddings:
+            _cached_embeddings[model_name] = CachedEmbeddings(
+                _LazyEmbeddings(model_name), EmbeddingCache(backend_model_id(model_name)))
+        return _cached_embeddings[model_name]
+
+
+class _LazyEmbeddings:
+    """推迟到第一次真正推理时才加载模型，全部命中缓存时不加载"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    def embed_documents(self, texts):
+        return get_embeddings(self.model_name).embed_documents(texts)
+
+    def embed_query(self, text):
+        return get_embeddings(self.model_name).embed_query(text)
+
+
+def get_vectorstore(persist_directory: str, collection_name: Optional[str] = None,
+                    model_name: str = EMBEDDING_MODEL_NAME) -> Chroma:
+    """获取Chroma向量库句柄，同一目录和集合只打开一次"""
+    key = (persist_directory, collection_name, model_name)
+    vectorstore = _vectorstores.get(key)
+    if vectorstore is not None:
+        return vectorstore
+    with _lock:
+        if key not in _vectorstores:
+            kwargs = {"collection_name": collection_name} if collection_name else {}
+            _vectorstores[key] = Chroma(
+                persist_directory=persist_directory,
+                embedding_function=get_cached_embeddings(model_name),
+                **kwargs,
+            )
+        return _vectorstores[key]
+
+
+def release_vectorstores(persist_directory: str, collection_name: Optional[str] = None):
+    """丢弃某个目录（或其中某个集合）的向量库句柄，目录或集合被删除时调用"""
+    with _lock:
+        for key in list(_vectorstores):
+            if key[0] == persist_directory and (collection_name is None or key[1] == collection_name):
+                _vectorstores.pop(key)
+
+
+def warm_up(model_name: str = EMBEDDING_MODEL_NAME) -> float:
+    """预先加载模型并跑一次推理，返回耗时（秒）"""
+    start = time.time()
+    get_embeddings(model_name).embed_query("warm up")
+    return time.time() - start
+
+
+def current_rss_mb() -> float:
+    """当前进程常驻内存（MB），非Linux平台退化为峰值内存"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _model_size_mb(embeddings) -> Optional[float]:
+    if hasattr(embeddings, "model_size_mb"):
+        return embeddings.model_size_mb
+    client = getattr(embeddings, "client", None)
+    if client is None or not hasattr(client, "parameters"):
+        return None
+    return sum(p.numel() * p.element_size() for p in client.parameters()) / 1024 / 1024
+
+
+def memory_report() -> dict:
+    """已加载模型的参数大小、加载耗时，以及进程内存"""
+    with _lock:
+        models = {
+            name: {
+                "backend": EMBEDDING_BACKEND,
+                "params_mb": _model_size_mb(embeddings),
+                "load_time_s": _load_times.get(name),
+            }
+            for name, embeddings in _embeddings.items()
+        }
+        vectorstore_count = len(_vectorstores)
+        embedding_caches = {name: cached.cache.stats() for name, cached in _cached_embeddings.items()}
+    return {
+        "rss_mb": current_rss_mb(),
+        "models": models,
+        "vectorstores": vectorstore_count,
+        "embedding_caches": embedding_caches,
+    }
@@ -0,0 +1,138 @@
+import email.utils
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (连接超时, 读取超时)，秒
+CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", 120))
+DEFAULT_TIMEOUT: Tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT)
+# 连接池大小需不小于并发数（如 VLM_CONCURRENCY）
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 16))
+MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", 3))
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# 两次重试之间最长等待（秒），指数退避和服务端的 Retry-After 都不超过它
+MAX_BACKOFF = float(os.environ.get("HTTP_MAX_BACKOFF", 30))
+
+_lock = threading.Lock()
+_sessions: Dict[str, requests.Session] = {}
+_vlm_clients: Dict[Tuple[str, str], object] = {}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After（秒数或HTTP日期），缺失或无法解析时返回 None"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class BoundedRetry(Retry):
+    """
+    Retry-After 最多等 MAX_BACKOFF 秒；服务端要求的等待超过读取超时时视为重试次数已用尽，
+    按 raise_on_status=False（build_retry 的设置）直接把该 429/503 响应返回给调用方，由调用方按状态码处理
+    """
+
+    def parse_retry_after(self, retry_after: str) -> float:
+        return min(super().parse_retry_after(retry_after), MAX_BACKOFF)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        wait = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        if wait is not None and wait > READ_TIMEOUT:
+            print(f"Retry-After {wait:.0f}s 超过读取超时，不再重试")
+            exhausted = self.new(total=0, status=0)
+            return super(BoundedRetry, exhausted).increment(method, url, response=response, error=error,
+                                                            _pool=_pool, _stacktrace=_stacktrace)
+        return super().increment(method, url, response=response, error=error, _pool=_pool, _stacktrace=_stacktrace)
+
+
+def build_retry(max_retries: int = MAX_RETRIES) -> Retry:
+    """
+    429 和 5xx 按指数退避重试，遵守服务端的 Retry-After（最多等 MAX_BACKOFF 秒，要求等待超过读取超时则不再重试）；
+    重试用尽后返回最后一次的响应而不抛出异常，调用方按状态码处理；
+    连接失败可安全重试，读超时不重试（请求可能已被处理并计费）。
+    """
+    return BoundedRetry(
+        total=max_retries,
+        connect=max_retries,
+        read=0,
+        status=max_retries,
+        backoff_factor=1.0,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def get_session(provider: str) -> requests.Session:
+    """每个服务商一个带 keep-alive 连接池的 Session，进程内复用"""
+    session = _sessions.get(provider)
+    if session is not None:
+        return session
+    with _lock:
+        if provider not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=build_retry())
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[provider] = session
+        return _sessions[provider]
+
+
+def get_vlm_client(api_key: str, base_url: str):
+    """复用的OpenAI兼容客户端（底层httpx连接池），重试由调用方按 Retry-After 控制"""
+    key = (api_key, base_url)
+    client = _vlm_clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        if key not in _vlm_clients:
+            import httpx
+            from openai import OpenAI
+
+            _vlm_clients[key] = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=0,
+                timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                http_client=httpx.Client(
+                    limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+                ),
+            )
+        return _vlm_clients[key]
+
+
+def _requested_wait(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    return parse_retry_after(headers.get("retry-after")) if headers else None
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """从异常携带的HTTP响应中读取 Retry-After（秒，最多 MAX_BACKOFF），没有则返回 None"""
+    wait = _requested_wait(error)
+    return None if wait is None else min(wait, MAX_BACKOFF)
+
+
+def retry_after_exceeds(error: Exception, timeout: float = READ_TIMEOUT) -> bool:
+    """服务端要求的等待超过请求超时，再重试已无意义，调用方应放弃"""
+    wait = _requested_wait(error)
+    return wait is not None and wait > timeout
+
+
+def retry_count(response) -> int:
+    """requests 响应在连接池层面（urllib3 Retry）已重试的次数"""
+    retries = getattr(getattr(response, "raw", None), "retries", None)
+    history = getattr(retries, "history", None)
+    return len(history) if history else 0
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+CACHE_PATH = "./vlm_cache/descriptions.sqlite3"
+HASH_SIZE = 8
+# 两张图片的哈希相差不超过这么多位即视为近似重复（共 2*HASH_SIZE*HASH_SIZE 位）
+MAX_DISTANCE = int(os.environ.get("IMAGE_DEDUP_DISTANCE", 10))
+# 置位太少的哈希（几乎纯色的图片）区分度不够，不参与去重和缓存
+MIN_BITS = 8
+
+
+def image_hash(image: Image.Image, hash_size: int = HASH_SIZE) -> str:
+    """
+    感知哈希（dHash）：缩成灰度小图后比较相邻像素的明暗，横向、纵向各 hash_size*hash_size 位，
+    返回十六进制串。缩放、重新压缩、轻微调色后的同一张图哈希不变或只差几位。
+    """
+    gray = np.asarray(image.convert("L").resize((hash_size + 1, hash_size + 1), Image.LANCZOS), dtype=np.int16)
+    bits = np.concatenate([(gray[:-1, 1:] > gray[:-1, :-1]).ravel(), (gray[1:, :-1] > gray[:-1, :-1]).ravel()])
+    return np.packbits(bits).tobytes().hex()
+
+
+def file_hash(image_path: str) -> str:
+    with Image.open(image_path) as image:
+        return image_hash(image)
+
+
+def hamming(a: str, b: str) -> int:
+    if len(a) != len(b):
+        return len(a) * 4
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def is_distinctive(value: Optional[str]) -> bool:
+    return bool(value) and bin(int(value, 16)).count("1") >= MIN_BITS
+
+
+def prompt_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()[:32]
+
+
+class DescriptionCache:
+    """
+    跨文档的图片描述缓存（sqlite）：(图片感知哈希, 模型+提示词) -> 描述。
+    同一张图出现在不同文档（论文的不同版本、共用的图标）时不再重复调用VLM；描述不会过期。
+    """
+
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS descriptions (image_hash TEXT NOT NULL, prompt_key TEXT NOT NULL, "
+            "description TEXT NOT NULL, created REAL NOT NULL, PRIMARY KEY (image_hash, prompt_key))"
+        )
+        self._db.commit()
+
+    def get(self, image_hash_value: str, model: str, prompt: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT description FROM descriptions WHERE image_hash = ? AND prompt_key = ?",
+                (image_hash_value, prompt_key(model, prompt)),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, image_hash_value: str, model: str, prompt: str, description: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO descriptions (image_hash, prompt_key, description, created) VALUES (?, ?, ?, ?)",
+                (image_hash_value, prompt_key(model, prompt), description, time.time()),
+            )
+            self._db.commit()
+            self.stores += 1
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM descriptions")
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores, "entries": entries}
+
+
+_cache: Optional[DescriptionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_description_cache() -> Optional[DescriptionCache]:
+    """进程内共享的描述缓存，位置由 VLM_CACHE_PATH 配置；VLM_CACHE=0 时关闭（返回 None）"""
+    global _cache
+    if os.environ.get("VLM_CACHE", "1") == "0":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DescriptionCache(os.environ.get("VLM_CACHE_PATH", CACHE_PATH))
+    return _cache
+
+
+def description_cache_stats() -> dict:
+    cache = get_description_cache()
+    return cache.stats() if cache is not None else {"hits": 0, "misses": 0, "stores": 0, "entries": 0}
@@ -0,0 +1,116 @@
+import base64
+import io
+import os
+import threading
+from typing import Tuple
+
+from PIL import Image
+
+import tracing
+
+# 上传给VLM前的预处理：最长边不超过 VLM_MAX_EDGE 像素，重新编码为 VLM_IMAGE_FORMAT（jpeg / webp / png）
+VLM_MAX_EDGE = int(os.environ.get("VLM_MAX_EDGE", 1280))
+VLM_IMAGE_FORMAT = os.environ.get("VLM_IMAGE_FORMAT", "jpeg").lower()
+VLM_IMAGE_QUALITY = int(os.environ.get("VLM_IMAGE_QUALITY", 85))
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png", "GIF": "image/gif"}
+
+_lock = threading.Lock()
+# 读文件编码的图片记原文件大小；内存中的图片没有原文件，未压缩的像素数据另记，两者不能直接比较
+_totals = {"images": 0, "bytes_original": 0, "bytes_sent": 0,
+           "memory_images": 0, "memory_bytes_raw": 0, "memory_bytes_sent": 0}
+
+
+def encoding_config() -> str:
+    """预处理参数，写入流水线配置：参数变化时图片描述需要重新生成"""
+    return f"{VLM_IMAGE_FORMAT}:{VLM_MAX_EDGE}:{VLM_IMAGE_QUALITY}"
+
+
+def _reencode(image: Image.Image, image_format: str, quality: int) -> bytes:
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        # JPEG 不支持透明通道，透明部分按白色背景合成
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    elif image_format == "WEBP" and image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or image.mode == "P" else "RGB")
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        image.save(buffer, format="PNG", optimize=True)
+    else:
+        image.save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue()
+
+
+def _resize(image: Image.Image, max_edge: int) -> Tuple[Image.Image, bool]:
+    if max(image.size) <= max_edge:
+        return image, False
+    scale = max_edge / max(image.size)
+    return image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                        Image.LANCZOS), True
+
+
+def _target_format(image_format: str) -> str:
+    return "JPEG" if image_format in ("jpeg", "jpg") else image_format.upper()
+
+
+def _record(bytes_encoded: int, bytes_original: int = None, bytes_raw: int = None):
+    span = tracing.current_span()
+    span.set("bytes_encoded", bytes_encoded)
+    tracing.count("vlm_image_bytes_encoded", bytes_encoded)
+    with _lock:
+        if bytes_original is not None:
+            span.set("bytes_original", bytes_original)
+            tracing.count("vlm_image_bytes_original", bytes_original)
+            _totals["images"] += 1
+            _totals["bytes_original"] += bytes_original
+            _totals["bytes_sent"] += bytes_encoded
+        else:
+            span.set("bytes_raw", bytes_raw)
+            tracing.count("vlm_image_bytes_raw", bytes_raw)
+            _totals["memory_images"] += 1
+            _totals["memory_bytes_raw"] += bytes_raw
+            _totals["memory_bytes_sent"] += bytes_encoded
+
+
+def encode_image(image_path: str, max_edge: int = VLM_MAX_EDGE, image_format: str = VLM_IMAGE_FORMAT,
+                 quality: int = VLM_IMAGE_QUALITY) -> Tuple[str, str]:
+    """
+    读取图片，缩放到最长边不超过 max_edge 并按 image_format 重新编码，返回 (base64字符串, MIME类型)。
+    不需要缩放且原文件更小时直接发送原文件（MIME类型按实际格式）。
+    压缩前后的字节数记入当前span和计数器。
+    """
+    with open(image_path, "rb") as f:
+        original = f.read()
+    target_format = _target_format(image_format)
+    with Image.open(io.BytesIO(original)) as image:
+        source_format = image.format
+        image, resized = _resize(image, max_edge)
+        data = _reencode(image, target_format, quality)
+    mime = MIME_TYPES[target_format]
+    if not resized and len(original) <= len(data) and source_format in MIME_TYPES:
+        data, mime = original, MIME_TYPES[source_format]
+    _record(len(data), bytes_original=len(original))
+    return base64.b64encode(data).decode("utf-8"), mime
+
+
+def encode_pil_image(image: Image.Image, max_edge: int = VLM_MAX_EDGE, image_format: str = VLM_IMAGE_FORMAT,
+                     quality: int = VLM_IMAGE_QUALITY) -> Tuple[bytes, str]:
+    """
+    与 encode_image 相同的缩放和编码，但直接处理内存中的图片，返回 (编码后的字节, MIME类型)，不经过文件。
+    没有原文件大小可比，未压缩的像素数据量单独记为 bytes_raw（span属性、计数器和累计值都与文件图片分开）。
+    """
+    target_format = _target_format(image_format)
+    resized, _ = _resize(image, max_edge)
+    data = _reencode(resized, target_format, quality)
+    _record(len(data), bytes_raw=image.width * image.height * len(image.getbands()))
+    return data, MIME_TYPES[target_format]
+
+
+def upload_stats() -> dict:
+    """
+    进程内累计的上传图片数和字节数：images / bytes_original / bytes_sent 为读文件编码的图片（原文件与上传字节数），
+    memory_* 为内存中交接的图片（未压缩像素与上传字节数）
+    """
+    with _lock:
+        return dict(_totals)
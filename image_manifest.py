@@ -0,0 +1,127 @@
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+MANIFEST_NAME = "manifest.json"
+DESCRIPTION_PATTERN = re.compile(rb"<PAGE_(\d+)_IMAGE_(\d+)>(.*?)</PAGE_\1_IMAGE_\2>", re.DOTALL)
+
+
+class ImageManifest:
+    """
+    图片清单：(页, 页内序号) -> 全局序号、文件名、描述在 img_descriptions.md 中的字节区间。
+    加载后常驻内存，按页/序号或全局序号查找都是 O(1)，不依赖目录列举和全文正则。
+    """
+
+    def __init__(self, entries: Optional[List[dict]] = None):
+        self.entries: List[dict] = []
+        self._by_page_image: Dict[Tuple[int, int], dict] = {}
+        self._by_index: Dict[int, dict] = {}
+        for entry in entries or []:
+            self._register(entry)
+
+    def _register(self, entry: dict):
+        self.entries.append(entry)
+        self._by_page_image[(entry["page"], entry["image"])] = entry
+        self._by_index[entry["index"]] = entry
+
+    def add(self, page: int, image: int, index: int, file_name: str, image_hash: Optional[str] = None,
+            duplicate_of: Optional[int] = None):
+        """image_hash 为感知哈希；duplicate_of 为与之近似重复的、更早一张图片的全局序号（共用描述）"""
+        entry = {"page": page, "image": image, "index": index, "file": file_name,
+                 "desc_start": None, "desc_end": None}
+        if image_hash is not None:
+            entry["hash"] = image_hash
+        if duplicate_of is not None:
+            entry["duplicate_of"] = duplicate_of
+        self._register(entry)
+
+    def find_similar(self, image_hash: str, max_distance: int) -> Optional[dict]:
+        """与 image_hash 相差不超过 max_distance 位的第一张图片（本身不是重复图片）"""
+        from image_dedup import hamming
+
+        for entry in self.entries:
+            if "hash" in entry and "duplicate_of" not in entry and hamming(entry["hash"], image_hash) <= max_distance:
+                return entry
+        return None
+
+    def get(self, page: int, image: int) -> Optional[dict]:
+        return self._by_page_image.get((page, image))
+
+    def get_by_index(self, index: int) -> Optional[dict]:
+        return self._by_index.get(index)
+
+    def set_description_span(self, page: int, image: int, start: int, end: int):
+        entry = self.get(page, image)
+        if entry is not None:
+            entry["desc_start"] = start
+            entry["desc_end"] = end
+
+    def save(self, imgs_dir: str):
+        path = os.path.join(imgs_dir, MANIFEST_NAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"images": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, imgs_dir: str) -> "ImageManifest":
+        with open(os.path.join(imgs_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return cls(json.load(f)["images"])
+
+    @classmethod
+    def rebuild(cls, imgs_dir: str, descriptions_path: str) -> "ImageManifest":
+        """兼容没有清单的旧解析结果：列举一次目录、扫描一次描述文件重建清单"""
+        manifest = cls()
+        if os.path.exists(imgs_dir):
+            for file_name in sorted(os.listdir(imgs_dir)):
+                if not file_name.endswith(".png"):
+                    continue
+                parts = os.path.splitext(file_name)[0].split("_")
+                manifest.add(int(parts[1]), int(parts[3]), int(parts[4]), file_name)
+        if os.path.exists(descriptions_path):
+            with open(descriptions_path, "rb") as f:
+                data = f.read()
+            for match in DESCRIPTION_PATTERN.finditer(data):
+                manifest.set_description_span(int(match.group(1)), int(match.group(2)), match.start(3), match.end(3))
+        return manifest
+
+    def image_path(self, entry: dict, imgs_dir: str) -> str:
+        return os.path.join(imgs_dir, entry["file"])
+
+    def read_description(self, entry: dict, descriptions_path: str) -> Optional[str]:
+        """按字节区间直接读取描述，不扫描整个文件"""
+        if entry.get("desc_start") is None:
+            return None
+        with open(descriptions_path, "rb") as f:
+            f.seek(entry["desc_start"])
+            data = f.read(entry["desc_end"] - entry["desc_start"])
+        return data.decode("utf-8").strip()
+
+
+_lock = threading.Lock()
+_loaded: Dict[Tuple[str, str], Tuple[tuple, ImageManifest]] = {}
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def load_manifest(imgs_dir: str = "imgs", descriptions_path: str = "pages/img_descriptions.md") -> ImageManifest:
+    """加载清单并缓存在内存中，清单或描述文件变化（如切换文档）时才重新加载"""
+    key = (imgs_dir, descriptions_path)
+    version = (_mtime(os.path.join(imgs_dir, MANIFEST_NAME)), _mtime(descriptions_path))
+    with _lock:
+        cached = _loaded.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        if version[0] is not None:
+            manifest = ImageManifest.load(imgs_dir)
+        else:
+            manifest = ImageManifest.rebuild(imgs_dir, descriptions_path)
+        _loaded[key] = (version, manifest)
+        return manifest
@@ -0,0 +1,92 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+import tracing
+from image_encoding import encode_pil_image
+
+
+class ImageStore:
+    """
+    进程内的图片交接：解析阶段 put 解析出的图片，描述阶段 get 取出按VLM上传要求编码好的缓冲（memoryview），
+    中间不经过文件，每张图只编码一次。键为图片的保存路径，与图片清单、描述标签中的路径一致。
+
+    persist=True 时图片在后台线程按原样写成PNG（界面展示和回答中的图片证据需要文件），不阻塞解析和描述；
+    flush() 等待已提交的写入全部完成，写解析缓存前须先调用。
+    """
+
+    def __init__(self, persist: bool = True):
+        self.persist = persist
+        self._lock = threading.Lock()
+        self._images: Dict[str, Image.Image] = {}
+        self._encoded: Dict[str, Tuple[memoryview, str]] = {}
+        self._writes: List = []
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persist-images") if persist else None
+        self._stats = {"images": 0, "encoded": 0, "persisted": 0, "bytes_encoded": 0}
+
+    def put(self, path: str, image: Image.Image):
+        with self._lock:
+            self._images[path] = image
+            self._stats["images"] += 1
+            if self._writer is not None:
+                # 在调用方的上下文中运行，写盘的span挂在调用方的span之下
+                self._writes.append(self._writer.submit(contextvars.copy_context().run, self._persist, path, image))
+
+    def get(self, path: str) -> Optional[Tuple[memoryview, str]]:
+        """返回 (编码后的缓冲, MIME类型)；图片不在内存中（未放入或已释放）时返回 None，由调用方改读文件"""
+        with self._lock:
+            encoded = self._encoded.get(path)
+            image = self._images.get(path)
+        if encoded is not None or image is None:
+            return encoded
+        data, mime = encode_pil_image(image)
+        with self._lock:
+            encoded = self._encoded.setdefault(path, (memoryview(data), mime))
+            self._images.pop(path, None)
+            self._stats["encoded"] += 1
+            self._stats["bytes_encoded"] += len(data)
+        return encoded
+
+    def peek(self, path: str) -> Optional[Image.Image]:
+        """内存中尚未编码的原图（计算感知哈希等用），不在内存中或已编码时返回 None"""
+        with self._lock:
+            return self._images.get(path)
+
+    def release(self, path: str):
+        """描述完成（或不需要描述）后释放该图片占用的内存；尚未写盘的图片由写入任务持有到写完"""
+        with self._lock:
+            self._images.pop(path, None)
+            self._encoded.pop(path, None)
+
+    def flush(self):
+        """等待已提交的写盘全部完成，有写入失败时抛出第一个异常"""
+        with self._lock:
+            writes, self._writes = self._writes, []
+        for future in writes:
+            future.result()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self._writer is not None:
+                self._writer.shutdown(wait=True)
+            with self._lock:
+                self._images.clear()
+                self._encoded.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_memory"] = len(self._images) + len(self._encoded)
+        return stats
+
+    def _persist(self, path: str, image: Image.Image):
+        with tracing.span("persist_image", image=os.path.basename(path)):
+            image.save(path)
+        with self._lock:
+            self._stats["persisted"] += 1
@@ -0,0 +1,311 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+import tracing
+from image_encoding import encoding_config
+from image_manifest import ImageManifest
+from image_store import ImageStore
+from markdown_chunker import StreamingMarkdownChunker
+from pdf_parser import DESCRIPTION_FAILED, IMAGE_DESCRIPTION_PROMPT, VLM_MODEL, DescriptionScheduler, DescriptionWriter
+from pdf_parser_ocr import TEXT_RECOGNITION_MODEL, MarkdownPageJoiner, clear_imgs, save_page_images
+from text_layer import CLASSIFY_VERSION, TEXT_LAYER
+from text_util import CHUNK_OVERLAP, CHUNK_SIZE, EMBEDDING_MODEL_NAME
+from vector_index import ChunkIndexer
+
+# 影响解析结果的流水线配置，任何一项变化都会使解析缓存失效（界面和批量入库共用）
+PIPELINE_CONFIG = {
+    "ocr_model": TEXT_RECOGNITION_MODEL,
+    "vlm_model": VLM_MODEL,
+    "vlm_prompt": IMAGE_DESCRIPTION_PROMPT,
+    "vlm_image": encoding_config(),
+    "text_layer": TEXT_LAYER and CLASSIFY_VERSION,
+    "embedding_model": EMBEDDING_MODEL_NAME,
+}
+
+# 阶段之间队列的容量：下游跟不上时上游阻塞，内存中只保留有限的几页文本和分块
+PAGE_QUEUE_SIZE = int(os.environ.get("INGEST_PAGE_QUEUE", 4))
+CHUNK_QUEUE_SIZE = int(os.environ.get("INGEST_CHUNK_QUEUE", 256))
+# 每个OCR任务的页数：越小，首批页面越早可以检索
+PAGES_PER_JOB = int(os.environ.get("INGEST_PAGES_PER_JOB", 2))
+VLM_CONCURRENCY = int(os.environ.get("VLM_CONCURRENCY", 4))
+
+_END = object()
+
+
+class StreamingIngest:
+    """
+    流式入库：解析 → 分块 → 向量化入库三个阶段各占一个线程，经有界队列逐页传递；
+    每页的图片在该页解析完后立即交给VLM并发描述，与文本处理同时进行（近似重复的图片和命中描述缓存的图片不调用VLM）；
+    图片经内存中的图片仓库交给描述阶段，imgs/ 下的文件在后台写出，全部写完后才调用 on_complete。
+    每页的分块写入后即可检索（向量检索和BM25都包含已写入的分块），
+    content.md 和 img_descriptions.md 边处理边写出，图片清单随之更新。
+
+    pages 为按页序到达的每页 markdown 信息（{"markdown_texts", "markdown_images", "page_continuation_flags"}），
+    如 ParseWorkerPool.iter_pages 的结果。全部完成且没有出错时调用 on_complete（如写入解析缓存）。
+    """
+
+    def __init__(self, doc_key: str, pages: Iterable[dict], total_pages: Optional[int] = None,
+                 pages_dir: str = "pages", imgs_dir: str = "imgs", vlm_concurrency: int = VLM_CONCURRENCY,
+                 prompt: str = IMAGE_DESCRIPTION_PROMPT, on_complete: Optional[Callable[[], None]] = None):
+        self.doc_key = doc_key
+        self.pages = pages
+        self.pages_dir = pages_dir
+        self.imgs_dir = imgs_dir
+        self.prompt = prompt
+        self.on_complete = on_complete
+        self.content_path = os.path.join(pages_dir, "content.md")
+        self.descriptions_path = os.path.join(pages_dir, "img_descriptions.md")
+        self.manifest = ImageManifest()
+        self.writer: Optional[DescriptionWriter] = None
+        self.error: Optional[str] = None
+
+        self._page_queue: queue.Queue = queue.Queue(maxsize=PAGE_QUEUE_SIZE)
+        self._chunk_queue: queue.Queue = queue.Queue(maxsize=CHUNK_QUEUE_SIZE)
+        self._executor = ThreadPoolExecutor(max_workers=vlm_concurrency, thread_name_prefix="describe")
+        self.images = ImageStore(persist=True)
+        self._scheduler = DescriptionScheduler(self._executor, prompt, self.manifest, store=self.images)
+        self._manifest_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._failed = threading.Event()
+        self._done = threading.Event()
+        self._span = None
+        self._stats = {
+            "pages_total": total_pages,
+            "pages_parsed": 0,
+            "pages_indexed": 0,
+            "chunks_indexed": 0,
+            "images_total": 0,
+            "images_described": 0,
+        }
+        self._started = None
+        self._first_indexed = None
+        self._finished = None
+        self._stage_times: Dict[str, float] = {}
+
+    # ---- 对外接口 ----
+
+    def start(self) -> "StreamingIngest":
+        os.makedirs(self.pages_dir, exist_ok=True)
+        clear_imgs(self.imgs_dir)
+        os.makedirs(self.imgs_dir, exist_ok=True)
+        self.writer = DescriptionWriter(self.descriptions_path, self.manifest)
+        self._started = time.time()
+        self._span = tracing.start_span("ingest", doc=self.doc_key[:12])
+        threading.Thread(target=self._run, name="ingest", daemon=True).start()
+        return self
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def failed(self) -> bool:
+        return self._failed.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def stats(self) -> dict:
+        """
+        入库进度。pages_indexed 为已入库到第几页：该页末尾尚未结束的小节要等后续页到达才会切分入库。
+        first_indexed_s 为首批分块可检索时距开始的秒数，stage_s 为各阶段结束时距开始的秒数。
+        vlm_calls 为实际调用VLM的次数，vlm_duplicates / vlm_cache_hits 为近似重复和描述缓存各节省的次数。
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["stage_s"] = dict(self._stage_times)
+        stats.update(self._scheduler.stats())
+        now = self._finished or time.time()
+        stats["elapsed_s"] = round(now - self._started, 2) if self._started else 0.0
+        stats["first_indexed_s"] = round(self._first_indexed - self._started, 2) if self._first_indexed else None
+        stats["done"] = self.done()
+        stats["error"] = self.error
+        return stats
+
+    # ---- 各阶段 ----
+
+    def _run(self):
+        stages = [
+            threading.Thread(target=self._stage, args=(name, target), name=f"ingest-{name}", daemon=True)
+            for name, target in (("parse", self._parse_stage), ("chunk", self._chunk_stage),
+                                 ("index", self._index_stage))
+        ]
+        for thread in stages:
+            thread.start()
+        for thread in stages:
+            thread.join()
+        # 解析阶段结束后不会再提交新的图片，等在途的描述全部写出
+        self._executor.shutdown(wait=True)
+        self._mark_stage("describe")
+        try:
+            self.images.close()
+        except Exception as e:
+            self._fail("persist", e)
+        self._mark_stage("persist")
+        if not self._failed.is_set() and self.on_complete is not None:
+            try:
+                self.on_complete()
+            except Exception as e:
+                self._fail("complete", e)
+            self._mark_stage("complete")
+        self._finished = time.time()
+        stats = self.stats()
+        self._span.set("pages", stats["pages_indexed"])
+        self._span.set("chunks", stats["chunks_indexed"])
+        self._span.set("images", stats["images_described"])
+        self._span.set("vlm_calls", stats["vlm_calls"])
+        self._span.end()
+        # 释放页面来源（解析进程池的生成器等），完成后的任务只保留统计信息
+        self.pages = None
+        self._done.set()
+        print(f"流式入库完成: {self.stats()}")
+
+    def _stage(self, name: str, target):
+        with tracing.activate(self._span):
+            target()
+        self._mark_stage(name)
+
+    def _mark_stage(self, name: str):
+        with self._lock:
+            self._stage_times[name] = round(time.time() - self._started, 3)
+
+    def _fail(self, stage: str, error: Exception):
+        print(f"流式入库失败（{stage}）: {error}")
+        if self.error is None:
+            self.error = f"{stage}: {error}"
+        self._failed.set()
+
+    def _update(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                self._stats[key] = value
+
+    def _increment(self, key: str, value: int = 1):
+        with self._lock:
+            self._stats[key] += value
+
+    def _parse_stage(self):
+        """逐页取出解析结果：追加写入 content.md、保存图片并提交描述，再把本页文本交给分块阶段"""
+        joiner = MarkdownPageJoiner()
+        try:
+            with open(self.content_path, "w", encoding="utf-8") as f:
+                for page_idx, md_info in enumerate(self.pages):
+                    if self._failed.is_set():
+                        break
+                    with tracing.span("ingest_page", page=page_idx + 1):
+                        piece = joiner.add(md_info)
+                        f.write(piece)
+                        f.flush()
+                        with self._manifest_lock:
+                            saved = save_page_images(page_idx, md_info.get("markdown_images"), self.manifest,
+                                                     self.imgs_dir, self.images)
+                            self.manifest.save(self.imgs_dir)
+                        for path in saved:
+                            self._describe(path)
+                    self._update(pages_parsed=page_idx + 1)
+                    self._page_queue.put((page_idx + 1, piece))
+        except Exception as e:
+            self._fail("parse", e)
+        finally:
+            self._page_queue.put(_END)
+
+    def _describe(self, path: str):
+        self.writer.expect(path)
+        self._increment("images_total")
+        self._scheduler.submit(path).add_done_callback(lambda f: self._described(path, f))
+
+    def _described(self, path: str, future):
+        try:
+            description = future.result()
+        except Exception as e:
+            print(f"图片描述最终失败: {path} {e}")
+            description = DESCRIPTION_FAILED
+        with self._manifest_lock:
+            if self.writer.done(path, description):
+                self.manifest.save(self.imgs_dir)
+        self._increment("images_described")
+
+    def _chunk_stage(self):
+        """逐页流式分块；每页送完后放入页号，通知入库阶段把已有分块写入"""
+        chunker = StreamingMarkdownChunker(CHUNK_SIZE, CHUNK_OVERLAP)
+        while True:
+            item = self._page_queue.get()
+            if item is _END:
+                break
+            if self._failed.is_set():
+                # 出错后继续取走上游的数据，避免上游阻塞在满队列上
+                continue
+            page_num, piece = item
+            try:
+                for chunk in chunker.feed(piece):
+                    self._chunk_queue.put(chunk)
+                self._chunk_queue.put(page_num)
+            except Exception as e:
+                self._fail("chunk", e)
+        try:
+            if not self._failed.is_set():
+                for chunk in chunker.close():
+                    self._chunk_queue.put(chunk)
+        except Exception as e:
+            self._fail("chunk", e)
+        finally:
+            self._chunk_queue.put(_END)
+
+    def _index_stage(self):
+        """分块攒批向量化写入；收到页号时把不足一批的分块也写入，使该页立即可检索"""
+        indexer = None
+        try:
+            indexer = ChunkIndexer(self.doc_key, publish=True)
+        except Exception as e:
+            self._fail("index", e)
+        while True:
+            item = self._chunk_queue.get()
+            if item is _END:
+                break
+            if self._failed.is_set():
+                continue
+            try:
+                if isinstance(item, int):
+                    indexer.flush()
+                    if len(indexer) and self._first_indexed is None:
+                        self._first_indexed = time.time()
+                    self._update(pages_indexed=item, chunks_indexed=len(indexer))
+                else:
+                    indexer.add(item)
+            except Exception as e:
+                self._fail("index", e)
+        if self._failed.is_set():
+            return
+        try:
+            indexer.finish()
+            if len(indexer) and self._first_indexed is None:
+                self._first_indexed = time.time()
+            self._update(chunks_indexed=len(indexer))
+        except Exception as e:
+            self._fail("index", e)
+
+
+_lock = threading.Lock()
+_jobs: Dict[str, StreamingIngest] = {}
+
+
+def start_ingest(doc_key: str, pages: Iterable[dict], **kwargs) -> StreamingIngest:
+    """
+    开始流式入库；同一文档已有进行中的任务时直接返回该任务。
+    已完成的任务在新任务开始时移出登记表，不会在进程中一直累积（仍持有任务的调用方不受影响）。
+    """
+    with _lock:
+        job = _jobs.get(doc_key)
+        if job is not None and not job.done():
+            return job
+        for key in [key for key, other in _jobs.items() if other.done()]:
+            del _jobs[key]
+        job = _jobs[doc_key] = StreamingIngest(doc_key, pages, **kwargs)
+    return job.start()
+
+
+def get_ingest(doc_key: str) -> Optional[StreamingIngest]:
+    with _lock:
+        return _jobs.get(doc_key)
@@ -1,12 +1,18 @@
 import array
 import re
 import os
-from typing import Tuple, List
+from typing import Iterator, Optional, Tuple, List
 from chromadb.utils import embedding_functions
-from real_llm_api import call_llm_api, init_llm
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from pdf_parser import extract_specific_image_description
+from real_llm_api import call_llm_api, stream_llm_api, init_llm
+from vector_index import hybrid_search
+from image_manifest import load_manifest
+from question_parser import parse_image_question
+from summarizer import SINGLE_PASS_TOKENS, summarize_stream
+from text_util import estimate_tokens
+import tracing
+
+IMGS_DIR = "imgs"
+IMG_DESCRIPTIONS_PATH = "pages/img_descriptions.md"
 
 def translate_to_english(question_zh: str) -> str:
     """
@@ -19,9 +25,11 @@ def translate_to_english(question_zh: str) -> str:
         return translation.strip().split('\n')[0]
     return question_zh
 
-def extract_relevant_context(question: str):
+@tracing.traced()
+def extract_relevant_context(question: str, doc_key: str):
     """
     根据问题提取相关原文片段（支持中英文自动切换）
+    只在当前文档自己的集合中检索：向量检索与BM25关键词检索按排名融合
     """
     # 检查问题是否为中文，若是则翻译为英文
     # if re.search(r'[\u4e00-\u9fff]', question):
@@ -30,18 +38,20 @@ def extract_relevant_context(question: str):
     #     question_en = question
     # 1. 让LLM提取关键词
     # keywords = extract_keywords_by_llm(question, lang="en")  # 或lang="zh"
-    embedding = HuggingFaceEmbeddings(model_name="shibing624/text2vec-base-multilingual")
-    vectorstore = Chroma(persist_directory="./chroma_db", embedding_function=embedding)
-    docs = vectorstore.similarity_search(question, k=5)
+    docs = hybrid_search(doc_key, question, k=5)
     
     return docs
     
 
 
-def get_summary(text: str) -> str:
+def get_summary_stream(text: str) -> Iterator[str]:
     """
-    生成文献总结
+    流式生成文献总结，逐段产出增量文本
+    长文档按标题小节分段并发总结后再合并，避免超出上下文窗口
     """
+    if estimate_tokens(text) > SINGLE_PASS_TOKENS:
+        return summarize_stream(text)
+
     prompt = f"""
     请对以下学术文献进行总结，要求：
     1. 总结核心研究内容和方法
@@ -54,58 +64,70 @@ def get_summary(text: str) -> str:
     """
     
     # 调用真实的大模型API
-    response = call_llm_api(prompt)
-    return response
+    return stream_llm_api(prompt)
 
-def ask_question(text: str, question: str) -> Tuple[str, str, bool]:
+def get_summary(text: str) -> str:
     """
-    回答问题并返回原文依据
+    生成文献总结
     """
-    print(question)
+    return "".join(get_summary_stream(text))
+
+def classify_image_question(question: str) -> Optional[Tuple[int, int]]:
+    """
+    判断问题是否询问图片，返回 (页, 序号)：(0, n) 第n张图片，(m, n) 第m页第n张图片，(0, 0) 与图片无关。
+    先用本地规则解析，只有本地无法确定时才调用大模型；大模型的回答无法解析时返回 None。
+    """
+    local = parse_image_question(question)
+    if local is not None:
+        tracing.count("image_question_local")
+        return local
 
-    # 先判断是否询问图片内容
     prompt = f"""
     请判断以下问题是否有关图片，如果是，若询问第n张图片，返回'0, n'，若询问第m页第n张照片，返回'm, n'，若不是则返回'0, 0'，不要输出其他内容。：
     {question}
     """
-    answer = call_llm_api(prompt)
-
-
+    with tracing.span("classify_image_question"):
+        answer = call_llm_api(prompt)
     print(answer)
     # 解析返回的字符串格式
     try:
         parts = answer.split(',')
-        page_num = int(parts[0].strip())
-        img_num = int(parts[1].strip())
-        if len(parts) == 2:    
-            if page_num == 0 and img_num > 0:
-                # 询问第n张图片
-                for file in os.listdir('imgs'):
-                    img_path = os.path.join('imgs', file)
-                    part_name = file.split('_')
-                    img_idx = part_name[4].split('.')[0]
-                    if int(img_idx) == img_num:
-                        description = extract_specific_image_description(text, int(part_name[3]), int(part_name[1]))
-                        return description, img_path, True
+        if len(parts) == 2:
+            return int(parts[0].strip()), int(parts[1].strip())
+    except (ValueError, IndexError):
+        pass
+    return None
 
+def ask_question_stream(text: str, question: str, doc_key: str, imgs_dir: str = IMGS_DIR,
+                        descriptions_path: str = IMG_DESCRIPTIONS_PATH) -> Tuple[Iterator[str], str, bool]:
+    """
+    回答问题并返回原文依据，答案为逐段产出的增量文本；
+    原文依据在返回前就已检索好，界面可先展示依据再渲染答案。
+    图片问题从 imgs_dir 和 descriptions_path（该文档的工作目录或解析缓存条目）中查找图片及其描述
+    """
+    print(question)
 
-            elif page_num > 0 and img_num > 0:
+    # 先判断是否询问图片内容：本地规则能确定时不再调用大模型
+    image_target = classify_image_question(question)
+    print(image_target)
+    if image_target is not None:
+        page_num, img_num = image_target
+        if img_num > 0:
+            # 通过常驻内存的图片清单定位图片及其描述
+            manifest = load_manifest(imgs_dir, descriptions_path)
+            if page_num == 0:
+                # 询问第n张图片
+                entry = manifest.get_by_index(img_num)
+            else:
                 # 询问第m页第n张图片
-                for file in os.listdir('imgs'):
-                    if file.endswith('.png'):
-                        part_name = file.split('_')
-
-                        if part_name[1] == str(page_num) and part_name[3] == str(img_num):
-                            img_path = os.path.join('imgs', file)
-                            part_name = file.split('_')
-                            description = extract_specific_image_description(text, int(part_name[3]), int(part_name[1]))
-                            return description, img_path, True
-    except (ValueError, IndexError):
-        pass
+                entry = manifest.get(page_num, img_num)
+            if entry is not None:
+                description = manifest.read_description(entry, descriptions_path) or "未找到图片的描述"
+                return iter([description]), manifest.image_path(entry, imgs_dir), True
     
     # 如果不是询问图片，则按正常流程处理
     # 1. 提取相关原文片段
-    docs = extract_relevant_context(question)
+    docs = extract_relevant_context(question, doc_key)
     relevant_context = [doc.page_content for doc in docs]
     evidence = ""
     for i, context in enumerate(relevant_context):        
@@ -136,11 +158,19 @@ def ask_question(text: str, question: str) -> Tuple[str, str, bool]:
     # """
     
     # # 3. 调用大模型API
-    answer = call_llm_api(prompt)
+    answer = stream_llm_api(prompt)
     
     # # 4. 返回答案和原文依据
     return answer, evidence, False
 
+def ask_question(text: str, question: str, doc_key: str, imgs_dir: str = IMGS_DIR,
+                 descriptions_path: str = IMG_DESCRIPTIONS_PATH) -> Tuple[str, str, bool]:
+    """
+    回答问题并返回原文依据
+    """
+    answer, evidence, is_image_question = ask_question_stream(text, question, doc_key, imgs_dir, descriptions_path)
+    return "".join(answer), evidence, is_image_question
+
 # 初始化大模型API（可选）
 def setup_llm_api(api_type: str = "deepseek", api_key: str = ""):
     """
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+CACHE_PATH = "./llm_cache/responses.sqlite3"
+DEFAULT_MEMORY_SIZE = 512
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+def make_key(provider: str, model: str, params: dict, prompt: str) -> str:
+    """缓存键：服务商、模型、生成参数和提示词哈希"""
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    payload = json.dumps([provider, model, params, prompt_hash], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    两级的大模型响应缓存（精确匹配）：
+    内存 LRU 层命中只需微秒级；sqlite 磁盘层跨进程、跨重启保留，条目带过期时间（TTL）。
+    """
+
+    def __init__(self, path: str = CACHE_PATH, memory_size: int = DEFAULT_MEMORY_SIZE, ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None and item[1] > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return item[0]
+            if item is not None:
+                self._memory.pop(key)
+
+            row = self._db.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] > now:
+                self._remember(key, row[0], row[1])
+                self.disk_hits += 1
+                return row[0]
+            if row is not None:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._db.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+            return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else None,
+            "memory_entries": len(self._memory),
+        }
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> LLMResponseCache:
+    """进程内共享的响应缓存，位置和TTL可通过 LLM_CACHE_PATH / LLM_CACHE_TTL 配置"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache(
+                    path=os.environ.get("LLM_CACHE_PATH", CACHE_PATH),
+                    ttl=float(os.environ.get("LLM_CACHE_TTL", DEFAULT_TTL)),
+                )
+    return _cache
@@ -0,0 +1,200 @@
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from langchain_core.documents import Document
+
+# 与 text_util 中 MarkdownHeaderTextSplitter 的配置一致，按长度降序匹配
+HEADERS_TO_SPLIT_ON = [("####", "h4"), ("###", "h3"), ("##", "h2"), ("#", "h1")]
+SEPARATORS = ["\n\n", "\n", " ", ""]
+
+
+class StreamingMarkdownChunker:
+    """
+    单遍、流式的 markdown 分块器，结果与
+    MarkdownHeaderTextSplitter(h1-h4, strip_headers=False) + RecursiveCharacterTextSplitter.split_documents
+    逐块一致（文本和 h1-h4 元数据都相同）。
+
+    文本可以任意切片后 feed，按行处理；同一标题下的内容聚合成小节，
+    小节一结束就递归切分并产出分块，内存中只保留当前小节。
+    length_function 决定 chunk_size / chunk_overlap 的单位（默认按字符，可传 estimate_tokens 按token）。
+    """
+
+    def __init__(self, chunk_size: int = 200, chunk_overlap: int = 10,
+                 length_function: Callable[[str], int] = len):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length_function = length_function
+        self._buffer = ""
+        # 行级状态（对应 MarkdownHeaderTextSplitter.split_text 的循环变量）
+        self._current_content: List[str] = []
+        self._current_metadata: Dict[str, str] = {}
+        self._header_stack: List[tuple] = []
+        self._initial_metadata: Dict[str, str] = {}
+        self._in_code_block = False
+        self._opening_fence = ""
+        # 正在聚合的小节（对应 aggregate_lines_to_chunks 的最后一项）
+        self._section: Optional[List[str]] = None
+        self._section_metadata: Dict[str, str] = {}
+        self._closed = False
+
+    # ---- 输入 ----
+
+    def feed(self, text: str) -> Iterator[Document]:
+        """输入一段文本，产出因此而完整的分块"""
+        text = self._buffer + text
+        # 逐行查找换行符，不把整段文本拆成行列表；不完整的最后一行留到下次
+        start = 0
+        while True:
+            end = text.find("\n", start)
+            if end < 0:
+                break
+            yield from self._process_line(text[start:end])
+            start = end + 1
+        self._buffer = text[start:]
+
+    def close(self) -> Iterator[Document]:
+        """输入结束，处理最后一行并产出剩余分块"""
+        if self._closed:
+            return
+        self._closed = True
+        yield from self._process_line(self._buffer)
+        self._buffer = ""
+        if self._current_content:
+            yield from self._add_group("\n".join(self._current_content), self._current_metadata)
+            self._current_content = []
+        if self._section is not None:
+            yield from self._split_section()
+
+    # ---- 标题切分 ----
+
+    def _process_line(self, line: str) -> Iterator[Document]:
+        stripped_line = "".join(filter(str.isprintable, line.strip()))
+        if not self._in_code_block:
+            if stripped_line.startswith("```") and stripped_line.count("```") == 1:
+                self._in_code_block = True
+                self._opening_fence = "```"
+            elif stripped_line.startswith("~~~"):
+                self._in_code_block = True
+                self._opening_fence = "~~~"
+        elif stripped_line.startswith(self._opening_fence):
+            self._in_code_block = False
+            self._opening_fence = ""
+
+        if self._in_code_block:
+            self._current_content.append(stripped_line)
+            return
+
+        for sep, name in HEADERS_TO_SPLIT_ON:
+            if stripped_line.startswith(sep) and (len(stripped_line) == len(sep) or stripped_line[len(sep)] == " "):
+                level = len(sep)
+                while self._header_stack and self._header_stack[-1][0] >= level:
+                    _, popped_name = self._header_stack.pop()
+                    self._initial_metadata.pop(popped_name, None)
+                self._header_stack.append((level, name))
+                self._initial_metadata[name] = stripped_line[len(sep):].strip()
+
+                if self._current_content:
+                    yield from self._add_group("\n".join(self._current_content), self._current_metadata.copy())
+                    self._current_content = []
+                self._current_content.append(stripped_line)
+                break
+        else:
+            if stripped_line:
+                self._current_content.append(stripped_line)
+            elif self._current_content:
+                yield from self._add_group("\n".join(self._current_content), self._current_metadata.copy())
+                self._current_content = []
+
+        self._current_metadata = self._initial_metadata.copy()
+
+    def _add_group(self, content: str, metadata: Dict[str, str]) -> Iterator[Document]:
+        """把一段内容并入当前小节；标题不同则先切分并产出上一个小节"""
+        if self._section is not None:
+            if self._section_metadata == metadata:
+                self._section.append(content)
+                return
+            # 上一段只有更浅的标题行时，与下一级标题的内容合并（保留标题时的行为）
+            if (len(self._section_metadata) < len(metadata)
+                    and self._section[-1].split("\n")[-1][:1] == "#"):
+                self._section.append(content)
+                self._section_metadata = metadata
+                return
+            yield from self._split_section()
+        self._section = [content]
+        self._section_metadata = metadata
+
+    # ---- 递归字符切分 ----
+
+    def _split_section(self) -> Iterator[Document]:
+        text = "  \n".join(self._section)
+        metadata = self._section_metadata
+        self._section = None
+        for chunk in self._split_text(text, SEPARATORS):
+            yield Document(page_content=chunk, metadata=dict(metadata))
+
+    def _split_text(self, text: str, separators: List[str]) -> Iterator[str]:
+        separator = separators[-1]
+        new_separators: List[str] = []
+        for i, candidate in enumerate(separators):
+            if not candidate:
+                separator = candidate
+                break
+            if candidate in text:
+                separator = candidate
+                new_separators = separators[i + 1:]
+                break
+
+        if separator:
+            # 分隔符保留在后一段开头
+            parts = text.split(separator)
+            splits = [parts[0]] + [separator + part for part in parts[1:]]
+        else:
+            splits = list(text)
+
+        good_splits: List[str] = []
+        for split in splits:
+            if not split:
+                continue
+            if self.length_function(split) < self.chunk_size:
+                good_splits.append(split)
+                continue
+            if good_splits:
+                yield from self._merge_splits(good_splits)
+                good_splits = []
+            if not new_separators:
+                yield split
+            else:
+                yield from self._split_text(split, new_separators)
+        if good_splits:
+            yield from self._merge_splits(good_splits)
+
+    def _merge_splits(self, splits: Iterable[str]) -> Iterator[str]:
+        """把小片段合并到不超过 chunk_size，相邻分块保留不超过 chunk_overlap 的重叠"""
+        current = deque()
+        total = 0
+        for split in splits:
+            length = self.length_function(split)
+            if total + length > self.chunk_size:
+                if current:
+                    doc = "".join(current).strip()
+                    if doc:
+                        yield doc
+                    while total > self.chunk_overlap or (total + length > self.chunk_size and total > 0):
+                        total -= self.length_function(current.popleft())
+            current.append(split)
+            total += length
+        doc = "".join(current).strip()
+        if doc:
+            yield doc
+
+
+def iter_markdown_chunks(chunks: Iterable[str], chunk_size: int = 200, chunk_overlap: int = 10,
+                         length_function: Callable[[str], int] = len) -> Iterator[Document]:
+    """
+    对按顺序到达的 markdown 文本片段（可以是整篇文档、逐页文本或任意切片）流式分块，
+    每个小节结束就产出其分块，下游可以边分块边向量化。
+    """
+    chunker = StreamingMarkdownChunker(chunk_size, chunk_overlap, length_function)
+    for text in chunks:
+        yield from chunker.feed(text)
+    yield from chunker.close()
@@ -0,0 +1,151 @@
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# CPU 推理线程数，默认用满所有核心
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", os.cpu_count() or 1))
+# 一个批次内 批大小 × 最长序列 的上限；按长度排序后分批，短文本不会被长文本拖着补齐
+BATCH_TOKENS = int(os.environ.get("EMBEDDING_BATCH_TOKENS", 8192))
+MAX_BATCH_SIZE = 64
+# 与 text2vec-base-multilingual 的 sentence-transformers 配置一致：最长256个token，均值池化
+MAX_SEQ_LENGTH = 256
+MODEL_ROOT = "./onnx_models"
+
+
+def export_int8_model(model_name: str, output_dir: Path) -> Path:
+    """
+    把 HuggingFace 模型导出为 ONNX 并做动态 int8 量化（权重int8，激活按批次动态量化），
+    分词器一并保存。只在第一次使用时执行，之后直接加载。
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    fp32_path = output_dir / "model.onnx"
+    int8_path = output_dir / "model.int8.onnx"
+
+    start = time.time()
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    model.config.return_dict = False
+    dummy = tokenizer(["warm up"], return_tensors="pt")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            str(fp32_path),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state", "pooler_output"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+                "pooler_output": {0: "batch"},
+            },
+            opset_version=14,
+        )
+    quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(str(output_dir))
+    fp32_path.unlink()
+    print(f"向量模型 {model_name} 已导出为 int8 ONNX，耗时 {time.time() - start:.1f}s")
+    return int8_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    int8 量化的 ONNX Runtime CPU 推理后端，输出与 HuggingFaceEmbeddings 相同（均值池化，不归一化）。
+    文本先按token长度排序再分批，每批只补齐到批内最长的长度，最后按原顺序返回。
+    """
+
+    def __init__(self, model_name: str, threads: int = EMBEDDING_THREADS, root: str = MODEL_ROOT):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.threads = threads
+        model_dir = Path(root) / re.sub(r"[^0-9A-Za-z_.-]", "_", model_name)
+        model_path = model_dir / "model.int8.onnx"
+        if not model_path.exists():
+            model_path = export_int8_model(model_name, model_dir)
+        self.model_size_mb = os.path.getsize(model_path) / 1024 / 1024
+
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        # InferenceSession.run 可并发调用，但同一时刻只跑一批才能让每批用满线程
+        self._lock = threading.Lock()
+
+    def _batches(self, lengths: List[int]) -> List[List[int]]:
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+        batches, current = [], []
+        for i in order:
+            # 已按长度升序，当前文本就是批内最长的
+            if current and ((len(current) + 1) * lengths[i] > BATCH_TOKENS or len(current) >= MAX_BATCH_SIZE):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _encode(self, token_ids: List[List[int]]) -> np.ndarray:
+        width = max(len(ids) for ids in token_ids)
+        input_ids = np.full((len(token_ids), width), self.tokenizer.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(token_ids), width), dtype=np.int64)
+        for row, ids in enumerate(token_ids):
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+        with self._lock:
+            hidden = self.session.run(["last_hidden_state"], {"input_ids": input_ids, "attention_mask": attention_mask})[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        token_ids = self.tokenizer(list(texts), truncation=True, max_length=MAX_SEQ_LENGTH)["input_ids"]
+        result: Optional[np.ndarray] = None
+        for batch in self._batches([len(ids) for ids in token_ids]):
+            vectors = self._encode([token_ids[i] for i in batch])
+            if result is None:
+                result = np.zeros((len(texts), vectors.shape[1]), dtype=np.float32)
+            result[batch] = vectors
+        return result
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_array([text])[0].tolist()
+
+
+def parity_report(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    """量化后端与参考实现逐条的余弦相似度，以及检索排序（top-5）的一致程度"""
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    ref_unit = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand_unit = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = (ref_unit * cand_unit).sum(axis=1)
+
+    # 每条文本作为查询，比较两种向量下最相近的5条是否一致
+    k = min(5, len(reference) - 1)
+    overlap = None
+    if k > 0:
+        ref_top = np.argsort(-(ref_unit @ ref_unit.T), axis=1)[:, 1:k + 1]
+        cand_top = np.argsort(-(cand_unit @ cand_unit.T), axis=1)[:, 1:k + 1]
+        overlap = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)]))
+    return {
+        "cosine_min": float(cosine.min()),
+        "cosine_mean": float(cosine.mean()),
+        "top5_overlap": overlap,
+    }
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from file_lock import file_lock
+
+CACHE_ROOT = "./parse_cache"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def hash_pdf(pdf_path: str, block_size: int = 1 << 20) -> str:
+    """计算PDF文件内容的sha256哈希"""
+    h = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def make_cache_key(content_hash: str, config: dict) -> str:
+    """由PDF内容哈希和流水线配置（OCR模型、VLM提示词、向量模型等）生成缓存键"""
+    h = hashlib.sha256(content_hash.encode("utf-8"))
+    h.update(json.dumps(config, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+def dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ParseCache:
+    """
+    以内容哈希为键的解析结果缓存。
+    每个条目保存 content.md、imgs/、img_descriptions.md，
+    总大小超过 max_bytes 时按最近最少使用（LRU）淘汰。
+    条目对应的向量集合保存在共享的Chroma库中，淘汰时通过 on_evict 回调删除；
+    external_size 回调返回条目在缓存目录之外占用的磁盘空间（向量集合和BM25索引），计入条目大小一起受 max_bytes 约束。
+    """
+
+    def __init__(self, root: str = CACHE_ROOT, max_bytes: int = DEFAULT_MAX_BYTES,
+                 on_evict: Optional[Callable[[str], None]] = None,
+                 external_size: Optional[Callable[[str], int]] = None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.external_size = external_size
+        self.index_path = self.root / "index.json"
+        # index.json 的读-改-写在该文件锁内进行，界面和批量入库可同时使用同一缓存目录
+        self.lock_path = self.root / "index.lock"
+        self._lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _load_index(self) -> dict:
+        if not self.index_path.exists():
+            return {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index: dict):
+        tmp_path = self.index_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def entry_dir(self, key: str) -> Path:
+        return self.root / key
+
+    def keys(self) -> List[str]:
+        return list(self._load_index())
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """查找完整的缓存条目，命中时刷新其访问时间"""
+        with self._lock, file_lock(self.lock_path):
+            index = self._load_index()
+            if key not in index or not self.entry_dir(key).exists():
+                return None
+            index[key]["last_access"] = time.time()
+            self._save_index(index)
+            return self.entry_dir(key)
+
+    def prepare(self, key: str) -> Path:
+        """为新条目准备目录，清理上次中断留下的残余文件"""
+        entry = self.entry_dir(key)
+        with self._lock, file_lock(self.lock_path):
+            index = self._load_index()
+            if key in index:
+                index.pop(key)
+                self._save_index(index)
+        if entry.exists():
+            shutil.rmtree(entry)
+        entry.mkdir(parents=True)
+        return entry
+
+    def store(self, key: str, pages_dir: str = "pages", imgs_dir: str = "imgs") -> Path:
+        """把解析产物复制进缓存条目并登记（大小含 external_size 统计的向量集合），随后执行LRU淘汰"""
+        entry = self.entry_dir(key)
+        entry.mkdir(parents=True, exist_ok=True)
+        for name in ("content.md", "img_descriptions.md"):
+            src = os.path.join(pages_dir, name)
+            if os.path.exists(src):
+                shutil.copy2(src, entry / name)
+        if os.path.exists(entry / "imgs"):
+            shutil.rmtree(entry / "imgs")
+        if os.path.exists(imgs_dir):
+            shutil.copytree(imgs_dir, entry / "imgs")
+        else:
+            (entry / "imgs").mkdir()
+
+        size = dir_size(entry)
+        if self.external_size:
+            try:
+                size += self.external_size(key)
+            except Exception as e:
+                print(f"统计缓存条目 {key} 的关联数据大小失败: {e}")
+
+        with self._lock, file_lock(self.lock_path):
+            index = self._load_index()
+            now = time.time()
+            index[key] = {"size": size, "created": now, "last_access": now}
+            self._evict(index, keep=key)
+            self._save_index(index)
+        return entry
+
+    def restore(self, key: str, pages_dir: str = "pages", imgs_dir: str = "imgs"):
+        """把缓存条目还原到工作目录，供界面展示图片和原文依据"""
+        entry = self.entry_dir(key)
+        os.makedirs(pages_dir, exist_ok=True)
+        for name in ("content.md", "img_descriptions.md"):
+            src = entry / name
+            dst = os.path.join(pages_dir, name)
+            if src.exists():
+                shutil.copy2(src, dst)
+            elif os.path.exists(dst):
+                os.remove(dst)
+        if os.path.exists(imgs_dir):
+            shutil.rmtree(imgs_dir)
+        shutil.copytree(entry / "imgs", imgs_dir)
+
+    def _evict(self, index: dict, keep: str):
+        total = sum(item["size"] for item in index.values())
+        for key in sorted(index, key=lambda k: index[k]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= index[key]["size"]
+            index.pop(key)
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            if self.on_evict:
+                try:
+                    self.on_evict(key)
+                except Exception as e:
+                    print(f"清理缓存条目 {key} 的关联数据失败: {e}")
+            print(f"解析缓存已淘汰: {key}")
+
+    def stats(self) -> dict:
+        index = self._load_index()
+        return {
+            "entries": len(index),
+            "total_bytes": sum(item["size"] for item in index.values()),
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,255 @@
+import itertools
+import math
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import Future
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import tracing
+
+
+def _worker_main(job_queue, result_queue):
+    """常驻解析进程：PPStructureV3只加载一次，之后循环处理队列中的任务"""
+    from pdf_parser_ocr import PDFParser
+
+    parser = PDFParser()
+    result_queue.put(("ready", os.getpid(), parser.load_time))
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        job_id, method, args = job
+        result_queue.put(("started", job_id, os.getpid()))
+        try:
+            result = getattr(parser, method)(*args)
+            result_queue.put(("done", job_id, result))
+        except Exception as e:
+            result_queue.put(("error", job_id, f"{e}\n{traceback.format_exc()}"))
+
+
+def count_pages(pdf_path: str) -> int:
+    import fitz
+
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def _page_runs(pages: List[int]) -> List[Tuple[int, int]]:
+    """把有序页号分成连续的区间 [start, end)"""
+    runs = []
+    for page in pages:
+        if runs and runs[-1][1] == page:
+            runs[-1][1] = page + 1
+        else:
+            runs.append([page, page + 1])
+    return [tuple(run) for run in runs]
+
+
+class ParseWorkerPool:
+    """
+    常驻的PDF解析进程池。
+    每个进程持有一个预热好的PPStructureV3，任务通过本地队列下发，
+    结果以结构化数据（见 PDFParser.predict）返回，而不是写文件。
+    """
+
+    def __init__(self, num_workers: int = 1):
+        # paddle 不是 fork 安全的，统一使用 spawn
+        self._ctx = mp.get_context("spawn")
+        self._job_queue = self._ctx.Queue()
+        self._result_queue = self._ctx.Queue()
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._futures: Dict[int, Future] = {}
+        self._waiting = set()
+        self._running: Dict[int, int] = {}  # job_id -> pid
+        self._processes: Dict[int, mp.Process] = {}
+        self._ready = threading.Event()
+        self._closed = False
+        self.num_workers = num_workers
+        self.model_load_times: Dict[int, float] = {}
+        self.jobs_done = 0
+
+        for _ in range(num_workers):
+            self._spawn_worker()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _spawn_worker(self):
+        process = self._ctx.Process(target=_worker_main, args=(self._job_queue, self._result_queue), daemon=True)
+        process.start()
+        self._processes[process.pid] = process
+
+    def submit(self, method: str, *args) -> Future:
+        """下发任务，method 为 PDFParser 上的方法名"""
+        if self._closed:
+            raise RuntimeError("解析进程池已关闭")
+        future = Future()
+        with self._lock:
+            job_id = next(self._job_ids)
+            self._futures[job_id] = future
+            self._waiting.add(job_id)
+        self._job_queue.put((job_id, method, args))
+        return future
+
+    def parse(self, pdf_path: str) -> Future:
+        """解析整份PDF，结果为 {"markdown_texts", "markdown_images"}"""
+        return self.submit("predict", os.path.abspath(pdf_path))
+
+    def parse_parallel(self, pdf_path: str, pages_per_job: Optional[int] = None) -> dict:
+        """
+        按页拆分后并行解析，再按页序合并，结果与单进程 predict 一致。
+        pages_per_job 默认让每个进程分到约两段，以平衡各页耗时差异。
+        所有页面都走OCR（不使用文本层快速通道），以保证与 predict 的结果逐字一致。
+        """
+        from pdf_parser_ocr import concatenate_pages
+
+        # 在本进程中拼接：不必把各页的图片再传给解析进程，也不占用OCR进程
+        return concatenate_pages(list(self.iter_pages(pdf_path, pages_per_job, text_layer=False)))
+
+    def iter_pages(self, pdf_path: str, pages_per_job: Optional[int] = None,
+                   text_layer: Optional[bool] = None) -> Iterator[dict]:
+        """
+        按页拆分提交给各进程，按页序逐页产出每页的 markdown 信息（未拼接），
+        前面的页解析完即可交给下游，不必等整份文档。
+        text_layer 为真（默认取 TEXT_LAYER）时先逐页判断文本层是否可用：可用的页面在本进程中直接提取，
+        只有扫描页和乱码页提交OCR，连续的OCR页按 pages_per_job 分组。
+        """
+        import fitz
+        from text_layer import TEXT_LAYER, FontProfile, classify_document, page_markdown
+
+        pdf_path = os.path.abspath(pdf_path)
+        page_count = count_pages(pdf_path)
+        if page_count == 0:
+            return
+        if text_layer is None:
+            text_layer = TEXT_LAYER
+        reasons = classify_document(pdf_path) if text_layer else ["ocr"] * page_count
+        ocr_pages = [page for page, reason in enumerate(reasons) if reason is not None]
+        if pages_per_job is None:
+            pages_per_job = max(1, math.ceil(len(ocr_pages) / (self.num_workers * 2)))
+        jobs = {}
+        for run_start, run_end in _page_runs(ocr_pages):
+            for start in range(run_start, run_end, pages_per_job):
+                jobs[start] = self.submit("predict_pages", pdf_path, start, min(start + pages_per_job, run_end))
+        if text_layer:
+            print(f"文本层直接提取 {page_count - len(ocr_pages)} 页，OCR {len(ocr_pages)} 页"
+                  f"{dict(Counter(reason for reason in reasons if reason))}")
+
+        with fitz.open(pdf_path) as doc:
+            profile = FontProfile.from_document(doc) if len(ocr_pages) < page_count else None
+            page = 0
+            while page < page_count:
+                if page in jobs:
+                    md_infos = jobs[page].result()
+                    tracing.count("pages_parsed", len(md_infos), method="ocr")
+                    yield from md_infos
+                    page += len(md_infos)
+                else:
+                    tracing.count("pages_parsed", method="text_layer")
+                    yield page_markdown(doc[page], profile)
+                    page += 1
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """等待至少一个进程完成模型加载"""
+        return self._ready.wait(timeout)
+
+    def queue_depth(self) -> int:
+        """排队中尚未被进程领取的任务数"""
+        with self._lock:
+            return len(self._waiting)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": len(self._processes),
+                "ready_workers": len(self.model_load_times),
+                "queue_depth": len(self._waiting),
+                "in_flight": len(self._running),
+                "jobs_done": self.jobs_done,
+                "model_load_time": max(self.model_load_times.values(), default=None),
+            }
+
+    def _collect(self):
+        while not self._closed:
+            try:
+                message = self._result_queue.get(timeout=1.0)
+            except queue.Empty:
+                self._reap_dead_workers()
+                continue
+            kind, key, payload = message
+            if kind == "ready":
+                with self._lock:
+                    self.model_load_times[key] = payload
+                print(f"解析进程 {key} 模型加载耗时: {payload:.1f}s")
+                self._ready.set()
+                continue
+            if kind == "started":
+                with self._lock:
+                    self._waiting.discard(key)
+                    self._running[key] = payload
+                continue
+            with self._lock:
+                future = self._futures.pop(key, None)
+                self._waiting.discard(key)
+                self._running.pop(key, None)
+                self.jobs_done += 1
+            if future is None:
+                continue
+            if kind == "done":
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(f"PDF解析失败: {payload}"))
+
+    def _reap_dead_workers(self):
+        """
+        进程异常退出时，让它手上的任务失败并补充一个新进程。
+        若进程在模型加载完成前就退出（如缺少依赖），不再重启，避免无限拉起。
+        """
+        for pid, process in list(self._processes.items()):
+            if process.is_alive() or self._closed:
+                continue
+            with self._lock:
+                self._processes.pop(pid)
+                was_ready = self.model_load_times.pop(pid, None) is not None
+                lost = [job_id for job_id, owner in self._running.items() if owner == pid]
+                futures = [self._futures.pop(job_id) for job_id in lost]
+                for job_id in lost:
+                    self._running.pop(job_id)
+            error = RuntimeError(f"解析进程 {pid} 异常退出 (exitcode={process.exitcode})")
+            for future in futures:
+                future.set_exception(error)
+            if was_ready:
+                print(f"解析进程 {pid} 已退出，重新启动")
+                self._spawn_worker()
+            else:
+                print(f"解析进程 {pid} 启动失败 (exitcode={process.exitcode})")
+
+        if not self._processes and not self._closed:
+            self._fail_pending(RuntimeError("所有解析进程均启动失败"))
+
+    def _fail_pending(self, error: Exception):
+        self._closed = True
+        with self._lock:
+            futures = list(self._futures.values())
+            self._futures.clear()
+            self._waiting.clear()
+            self._running.clear()
+        for future in futures:
+            future.set_exception(error)
+
+    def shutdown(self, timeout: float = 10.0):
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._processes:
+            self._job_queue.put(None)
+        deadline = time.time() + timeout
+        for process in self._processes.values():
+            process.join(max(0.0, deadline - time.time()))
+            if process.is_alive():
+                process.terminate()
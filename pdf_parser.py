@@ -6,72 +6,327 @@ import os
 import cv2
 import numpy as np
 from typing import List, Dict, Any, Tuple
+import random
 import re
 import shutil
 import time
 import socket
+import threading
+import contextvars
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from http_transport import MAX_BACKOFF, get_vlm_client, retry_after_exceeds, retry_after_seconds
+from image_dedup import file_hash, get_description_cache, image_hash as perceptual_hash, is_distinctive
+from image_encoding import encode_image, upload_stats
+from image_store import ImageStore
+import tracing
 
-def extract_text_from_image(image_path, file_path, description:bool, prompt="", api_key=None):
+VLM_MODEL = "qwen-vl-plus"
+# 可通过环境变量指向其他OpenAI兼容服务（如本地测试服务）
+VLM_BASE_URL = os.environ.get("VLM_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+IMAGE_DESCRIPTION_PROMPT = "请用简洁的语言描述这张图片的内容，不要输出任何其他信息。"
+DESCRIPTION_FAILED = "[图片内容描述失败]"
+
+def backoff_delay(attempt: int, base_delay: float = 1.0, max_delay: float = MAX_BACKOFF) -> float:
+    """指数退避 + 全抖动：第attempt次失败后等待 [0, min(max_delay, base*2^attempt)] 秒"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """服务端给出 Retry-After（如429限流）时按其等待（最多 MAX_BACKOFF 秒），否则指数退避"""
+    retry_after = retry_after_seconds(error)
+    return retry_after if retry_after is not None else backoff_delay(attempt)
+
+def build_vlm_messages(encoded_string: str, prompt: str, mime: str = "image/jpeg") -> list:
+    return [
+        {
+            "role": "system",
+            "content": [{"type": "text", "text": prompt}],
+        },
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {
+                    "url": f"data:{mime};base64,{encoded_string}"
+                },
+                },
+                {"type": "text", "text": "请描述这张图片的内容"},
+            ],
+        },
+    ]
+
+def record_vlm_request(span, attempt: int, bytes_sent: int):
+    """记录一次VLM请求的发送字节数；attempt > 0 时记为重试"""
+    span.set("retries", attempt)
+    span.add("bytes_sent", bytes_sent)
+    tracing.count("vlm_requests", model=VLM_MODEL)
+    tracing.count("vlm_bytes_sent", bytes_sent, model=VLM_MODEL)
+    if attempt:
+        tracing.count("vlm_retries", model=VLM_MODEL)
+
+def record_vlm_usage(span, completion):
+    """非流式响应带有 usage 时记录token数"""
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = getattr(usage, f"{kind}_tokens", None) or 0
+        span.set(f"{kind}_tokens", tokens)
+        tracing.count("vlm_tokens", tokens, model=VLM_MODEL, kind=kind)
+
+def parse_image_name(image_path: str) -> Tuple[int, int, int]:
+    """从 page_{页}_img_{页内序号}_{全局序号}.png 中解析出 (页, 页内序号, 全局序号)"""
+    splits = os.path.splitext(os.path.basename(image_path))[0].split('_')
+    return int(splits[1]), int(splits[3]), int(splits[4])
+
+def encode_for_vlm(image_path: str, store=None) -> Tuple[str, str]:
+    """上传用的 (base64字符串, MIME类型)：图片仓库 store 中有该图片时直接用内存中编码好的缓冲，否则读文件编码"""
+    image = store.get(image_path) if store is not None else None
+    if image is None:
+        return encode_image(image_path)
+    buffer, mime = image
+    return base64.b64encode(buffer).decode("utf-8"), mime
+
+def extract_text_from_image(image_path, file_path, description:bool, prompt="", api_key=None, max_attempts=5, timeout=120, store=None):
     """使用Qwen-VL-Max提取图片中的文本"""
-    while True:
-        try:
-            # 如果没有提供api_key，尝试从环境变量获取
-            if api_key is None:
-                import os
-                api_key = os.environ.get('VLM_API_KEY')
-                if not api_key:
-                    return "错误：未提供API密钥"
-            
-            # 读取图片文件并转换为base64
-            with open(image_path, "rb") as image_file:
-                encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-            
-            client = OpenAI(api_key = api_key, base_url="https://dashscope.aliyuncs.com/compatible-mode/v1")
-            completion = client.chat.completions.create(
-                model="qwen-vl-plus",  # 此处以qwen-vl-plus为例，可按需更换模型名称。模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
-                messages=[
-                    {
-                        "role": "system",
-                        "content": [{"type": "text", "text": prompt}],
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                "url": f"data:image/jpeg;base64,{encoded_string}"
-                            },
-                            },
-                            {"type": "text", "text": "请描述这张图片的内容"},
-                        ],
-                    },
-                ],
-                stream = True,
-            )
-
-            with open(file_path, 'a', encoding='utf-8') as f:
-                if description:
-                    splits = image_path.split('/')[-1].split('_')
-                    page_num = splits[1]
-                    image_index = splits[3]
-                    
-                    f.write(f"<PAGE_{page_num}_IMAGE_{image_index}>")
+    # 如果没有提供api_key，尝试从环境变量获取
+    if api_key is None:
+        api_key = os.environ.get('VLM_API_KEY')
+        if not api_key:
+            return "错误：未提供API密钥"
+
+    client = get_vlm_client(api_key, VLM_BASE_URL)
+    with tracing.span("extract_text_from_image", image=os.path.basename(image_path)) as span:
+        # 缩放并重新编码后转换为base64
+        encoded_string, mime = encode_for_vlm(image_path, store)
+        for attempt in range(max_attempts):
+            record_vlm_request(span, attempt, len(encoded_string) + len(prompt.encode('utf-8')))
+            try:
+                completion = client.chat.completions.create(
+                    model=VLM_MODEL,  # 此处以qwen-vl-plus为例，可按需更换模型名称。模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
+                    messages=build_vlm_messages(encoded_string, prompt, mime),
+                    stream = True,
+                    timeout = timeout,
+                )
+
+                # 先完整接收再写文件，避免重试时写入半截内容
+                contents = []
                 for chunk in completion:
                     if chunk.choices:
                         content = chunk.choices[0].delta.content
                         if content is not None:
-                            f.write(content)
-                if description:
-                    f.write(f"</PAGE_{page_num}_IMAGE_{image_index}>\n")
-            return True
-        except Exception as e:
-            print("提取图片文本时出错: ",image_path, e)
-            
+                            contents.append(content)
+                span.set("completion_chars", sum(len(content) for content in contents))
+
+                with open(file_path, 'a', encoding='utf-8') as f:
+                    if description:
+                        page_num, image_index, _ = parse_image_name(image_path)
+                        f.write(f"<PAGE_{page_num}_IMAGE_{image_index}>")
+                    f.write("".join(contents))
+                    if description:
+                        f.write(f"</PAGE_{page_num}_IMAGE_{image_index}>\n")
+                return True
+            except Exception as e:
+                print("提取图片文本时出错: ",image_path, e)
+                if retry_after_exceeds(e, timeout):
+                    break
+                if attempt + 1 < max_attempts:
+                    time.sleep(retry_delay(e, attempt))
+        span.set("error", "exhausted")
+    return False
+
+def describe_image(image_path: str, prompt: str = IMAGE_DESCRIPTION_PROMPT, api_key=None, max_attempts: int = 4, timeout: float = 60,
+                   store=None) -> str:
+    """
+    请求VLM描述单张图片并返回描述文本（不写文件）。
+    每次请求最长 timeout 秒，失败后指数退避重试，最多 max_attempts 次，仍失败则抛出最后一次的异常；
+    服务端要求的等待（Retry-After）超过 timeout 时不再重试。
+    传入图片仓库 store 时优先使用内存中的图片，不读文件。
+    """
+    if api_key is None:
+        api_key = os.environ.get('VLM_API_KEY')
+        if not api_key:
+            raise ValueError("未提供VLM API密钥")
+
+    client = get_vlm_client(api_key, VLM_BASE_URL)
+    with tracing.span("describe_image", image=os.path.basename(image_path)) as span:
+        encoded_string, mime = encode_for_vlm(image_path, store)
+        for attempt in range(max_attempts):
+            record_vlm_request(span, attempt, len(encoded_string) + len(prompt.encode('utf-8')))
+            try:
+                completion = client.chat.completions.create(
+                    model=VLM_MODEL,
+                    messages=build_vlm_messages(encoded_string, prompt, mime),
+                    timeout=timeout,
+                )
+                record_vlm_usage(span, completion)
+                return (completion.choices[0].message.content or "").strip()
+            except Exception as e:
+                print(f"图片描述失败（第{attempt + 1}次）: {image_path} {e}")
+                if attempt + 1 >= max_attempts or retry_after_exceeds(e, timeout):
+                    raise
+                time.sleep(retry_delay(e, attempt))
+
+class DescriptionScheduler:
+    """
+    把图片描述提交到线程池，尽量少调用VLM：
+    同一文档内近似重复的图片（清单中 duplicate_of 指向同一张）共用一次请求；
+    感知哈希命中跨文档的描述缓存（哈希 + 模型 + 提示词）时直接使用缓存的描述。
+    stats() 给出实际调用次数和两种方式各节省的次数。
+    传入图片仓库 store 时从内存取图片，每张图片提交后（描述完成或无需描述）即从仓库释放。
+    """
+
+    def __init__(self, executor, prompt: str = IMAGE_DESCRIPTION_PROMPT, manifest=None,
+                 max_attempts: int = 4, timeout: float = 60, store=None):
+        self.executor = executor
+        self.prompt = prompt
+        self.manifest = manifest
+        self.store = store
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._stats = {"vlm_calls": 0, "vlm_duplicates": 0, "vlm_cache_hits": 0}
+
+    def submit(self, image_path: str):
+        """返回该图片描述的 Future；近似重复的图片返回同一个 Future"""
+        entry = self.manifest.get_by_index(parse_image_name(image_path)[2]) if self.manifest is not None else None
+        group = image_path if entry is None else entry.get("duplicate_of", entry["index"])
+        with self._lock:
+            future = self._futures.get(group)
+            if future is not None:
+                self._stats["vlm_duplicates"] += 1
+                tracing.count("vlm_calls_saved", reason="duplicate")
+                if self.store is not None:
+                    self.store.release(image_path)
+                return future
+            # 在调用方的上下文中运行，各图片的span挂在调用方的span之下
+            future = self._futures[group] = self.executor.submit(
+                contextvars.copy_context().run, self._describe, image_path, entry.get("hash") if entry else None)
+        return future
+
+    def _describe(self, image_path: str, image_hash=None) -> str:
+        try:
+            return self._lookup_or_describe(image_path, image_hash)
+        finally:
+            if self.store is not None:
+                self.store.release(image_path)
+
+    def _lookup_or_describe(self, image_path: str, image_hash=None) -> str:
+        cache = get_description_cache()
+        if cache is not None and image_hash is None:
+            # 图片仓库中的PNG在后台写出，此时文件可能还不存在，优先对内存中的图片计算哈希
+            image = self.store.peek(image_path) if self.store is not None else None
+            image_hash = perceptual_hash(image) if image is not None else file_hash(image_path)
+        if cache is not None and is_distinctive(image_hash):
+            description = cache.get(image_hash, VLM_MODEL, self.prompt)
+            if description is not None:
+                with self._lock:
+                    self._stats["vlm_cache_hits"] += 1
+                tracing.count("vlm_calls_saved", reason="cache")
+                return description
+        with self._lock:
+            self._stats["vlm_calls"] += 1
+        description = describe_image(image_path, self.prompt, None, self.max_attempts, self.timeout, self.store)
+        if cache is not None and is_distinctive(image_hash) and description:
+            cache.set(image_hash, VLM_MODEL, self.prompt, description)
+        return description
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+class DescriptionWriter:
+    """
+    把图片描述按 (页, 页内序号) 顺序追加写入 output_file：先完成的描述等排在前面的图片完成后再写，
+    文件内容与全部完成后一次写出相同，而已写出的部分随时可读。
+    若传入图片清单 manifest，会记录每条描述在文件中的字节区间。
+    """
+
+    def __init__(self, output_file: str, manifest=None):
+        self.output_file = output_file
+        self.manifest = manifest
+        self._lock = threading.Lock()
+        self._order: List[str] = []
+        self._pending: Dict[str, str] = {}
+        self._written = 0
+        os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+        open(output_file, 'wb').close()
+
+    def expect(self, image_path: str):
+        """登记一张待描述的图片，须按页序调用"""
+        with self._lock:
+            self._order.append(image_path)
+
+    def done(self, image_path: str, description: str) -> int:
+        """提交一张图片的描述，返回本次写出的条数"""
+        with self._lock:
+            self._pending[image_path] = description
+            written = 0
+            # 以二进制写入，字节偏移在各平台上都与文件内容一致
+            with open(self.output_file, 'ab') as f:
+                while self._written < len(self._order) and self._order[self._written] in self._pending:
+                    path = self._order[self._written]
+                    page_num, image_index, _ = parse_image_name(path)
+                    f.write(f"<PAGE_{page_num}_IMAGE_{image_index}>".encode('utf-8'))
+                    start = f.tell()
+                    f.write(self._pending.pop(path).encode('utf-8'))
+                    if self.manifest is not None:
+                        self.manifest.set_description_span(page_num, image_index, start, f.tell())
+                    f.write(f"</PAGE_{page_num}_IMAGE_{image_index}>\n".encode('utf-8'))
+                    self._written += 1
+                    written += 1
+            return written
+
+    def written(self) -> int:
+        with self._lock:
+            return self._written
+
+def describe_images(image_paths: List[str], output_file: str = 'pages/img_descriptions.md', max_workers: int = 4,
+                    max_attempts: int = 4, timeout: float = 60, prompt: str = IMAGE_DESCRIPTION_PROMPT,
+                    manifest=None, store=None) -> Dict[str, str]:
+    """
+    并发描述多张图片，同时在途的请求数不超过 max_workers。
+    描述按 (页, 页内序号) 顺序写入 output_file，而不是按完成顺序；失败的图片写入占位描述。
+    若传入图片清单 manifest，会记录每条描述在文件中的字节区间，清单中标记为近似重复的图片只描述一次。
+    若传入图片仓库 store，图片从内存中取，不读文件。
+    返回 {图片路径: 描述}
+    """
+    image_paths = sorted(image_paths, key=parse_image_name)
+    descriptions = {}
+    writer = DescriptionWriter(output_file, manifest)
+    uploaded_before = upload_stats()
+    for path in image_paths:
+        writer.expect(path)
+    if image_paths:
+        with tracing.span("describe_images", images=len(image_paths)) as span, \
+                ThreadPoolExecutor(max_workers=max_workers) as executor:
+            scheduler = DescriptionScheduler(executor, prompt, manifest, max_attempts, timeout, store)
+            futures = {}
+            for path in image_paths:
+                futures.setdefault(scheduler.submit(path), []).append(path)
+            for future in as_completed(futures):
+                try:
+                    description = future.result()
+                except Exception as e:
+                    print(f"图片描述最终失败: {futures[future][0]} {e}")
+                    description = DESCRIPTION_FAILED
+                for path in futures[future]:
+                    descriptions[path] = description
+                    writer.done(path, description)
+            stats = scheduler.stats()
+            for key, value in stats.items():
+                span.set(key, value)
+        uploaded = {key: value - uploaded_before[key] for key, value in upload_stats().items()}
+        print(f"图片描述: {len(image_paths)} 张，VLM调用 {stats['vlm_calls']} 次"
+              f"（近似重复节省 {stats['vlm_duplicates']} 次，缓存命中节省 {stats['vlm_cache_hits']} 次），"
+              f"上传图片 {(uploaded['bytes_sent'] + uploaded['memory_bytes_sent']) / 1024:.0f} KB"
+              f"（读文件的 {uploaded['images']} 张压缩前 {uploaded['bytes_original'] / 1024:.0f} KB，"
+              f"内存中的 {uploaded['memory_images']} 张未压缩 {uploaded['memory_bytes_raw'] / 1024:.0f} KB）")
+    return descriptions
 
-def extract_images_from_pdf_page(page, page_num: int, img_idx_all: int) -> List[Dict[str, Any]]:
-    """从PDF页面提取图像"""
+def extract_images_from_pdf_page(page, page_num: int, img_idx_all: int, store=None) -> List[Dict[str, Any]]:
+    """从PDF页面提取图像；传入图片仓库 store 时放入内存，不写临时文件"""
     images = []
     image_list = page.get_images()
     
@@ -85,8 +340,13 @@ def extract_images_from_pdf_page(page, page_num: int, img_idx_all: int) -> List[
             
         # 保存图像
         img_path = f"temp_images/page_{page_num}_img_{img_index + 1}_{img_idx_all}.png"   
-        os.makedirs("temp_images", exist_ok=True)
-        pix.save(img_path)
+        if store is not None:
+            if pix.n - pix.alpha >= 4:
+                pix = fitz.Pixmap(fitz.csRGB, pix)
+            store.put(img_path, pix.pil_image())
+        else:
+            os.makedirs("temp_images", exist_ok=True)
+            pix.save(img_path)
         
         images.append({
             'path': img_path,
@@ -100,11 +360,11 @@ def extract_images_from_pdf_page(page, page_num: int, img_idx_all: int) -> List[
         
     return images
 
-def describe_image_with_qwen(image_path: str, image_index: int):
+def describe_image_with_qwen(image_path: str, image_index: int, store=None):
     """使用Qwen-VL描述图片内容"""
     try:
         # 调用Qwen-VL API描述图片
-        extract_text_from_image(image_path, f'pages/img_descriptions.md',description=True, prompt="请用简洁的语言描述这张图片的内容，不要输出任何其他信息。")
+        extract_text_from_image(image_path, f'pages/img_descriptions.md',description=True, prompt=IMAGE_DESCRIPTION_PROMPT, store=store)
 
     except Exception as e:
         print(f"图片描述失败: {e}")
@@ -126,6 +386,8 @@ def extract_text_and_images_from_pdf(pdf_path: str) -> Tuple[str, str]:
         f.truncate(0)
 
     img_idx = 1
+    # 整页截图和页内图片只在内存中交给VLM，不写 pages/page_N.png 和 temp_images/
+    store = ImageStore(persist=False)
     try:
         for page_num in range(len(doc)):
             page = doc.load_page(page_num)
@@ -133,16 +395,19 @@ def extract_text_and_images_from_pdf(pdf_path: str) -> Tuple[str, str]:
             # 提取文本
             pix = page.get_pixmap(dpi=100)
             page_image = 'pages/page_'+str(page_num+1)+'.png'
-            pix.save(page_image)
-            extract_text_from_image(page_image, f'pages/content.md', description=False, prompt="请提取图片中的所有文本内容，包括标题、正文、图表标题、公式等。请以markdown格式返回，保持原文的层次结构和格式。只输出你提取出的所有信息，不要提供其他信息。输出的markdown不需要用```markdown包裹。")
+            store.put(page_image, pix.pil_image())
+            extract_text_from_image(page_image, f'pages/content.md', description=False, prompt="请提取图片中的所有文本内容，包括标题、正文、图表标题、公式等。请以markdown格式返回，保持原文的层次结构和格式。只输出你提取出的所有信息，不要提供其他信息。输出的markdown不需要用```markdown包裹。", store=store)
+            store.release(page_image)
             # 提取并描述图片
-            images = extract_images_from_pdf_page(page, page_num + 1, img_idx)
+            images = extract_images_from_pdf_page(page, page_num + 1, img_idx, store)
             for img in images:
-                describe_image_with_qwen(img['path'], img['index'])
+                describe_image_with_qwen(img['path'], img['index'], store)
+                store.release(img['path'])
     except Exception as e:
             print("提取图片文本时出错: ",  e)
         
     
+    store.close()
     doc.close()
     return "\n\n".join(all_content), "\n\n".join(text_only)
 
@@ -1,82 +1,210 @@
 import os
+import re
+import sys
+import tempfile
 import time
+import fitz
 from paddleocr import PPStructureV3
 from pathlib import Path
 import numpy as np
+from image_manifest import ImageManifest
+from image_dedup import MAX_DISTANCE, image_hash, is_distinctive
+import tracing
+
+TEXT_RECOGNITION_MODEL = "en_PP-OCRv4_mobile_rec"
+
+def is_meaningless_img(pil_img, threshold=250):
+    """
+    判断图片是否为全白（或几乎全白）。
+    threshold: 允许的最小灰度值，越低越严格。
+    """
+    arr = np.array(pil_img)
+    # 支持RGB和RGBA
+    if arr.ndim == 3 and arr.shape[2] >= 3:
+        arr = arr[:, :, :3]
+    # 判断所有像素是否都大于等于阈值
+    return np.all(arr >= threshold)
+
+def save_page_images(page_idx, page_dic, manifest, save_dir="./imgs", store=None):
+    """
+    保存一页中的有效图片并登记到清单，返回保存的文件路径。
+    全局序号接着清单中已有的图片编号，逐页调用与一次性调用 save_images 的结果相同。
+    同时记录每张图片的感知哈希，与文档中更早的图片近似重复时在清单中标记 duplicate_of，只描述一次。
+    传入图片仓库 store（ImageStore）时图片放入内存交给描述阶段，文件由仓库在后台写出。
+    """
+    saved = []
+    if isinstance(page_dic, dict) and page_dic:
+        for img_idx, (path, image) in enumerate(page_dic.items()):
+            if not is_meaningless_img(image) and not "table" in path:
+                img_count = len(manifest.entries)
+                file_name = f"page_{page_idx + 1}_img_{img_idx + 1}_{img_count + 1}.png"
+                if store is not None:
+                    store.put(os.path.join(save_dir, file_name), image)
+                else:
+                    image.save(os.path.join(save_dir, file_name))
+                img_hash = image_hash(image)
+                original = manifest.find_similar(img_hash, MAX_DISTANCE) if is_distinctive(img_hash) else None
+                manifest.add(page_idx + 1, img_idx + 1, img_count + 1, file_name, img_hash,
+                             original["index"] if original else None)
+                saved.append(os.path.join(save_dir, file_name))
+    return saved
+
+def save_images(markdown_images, save_dir="./imgs"):
+    """保存有效图片，并写出图片清单 manifest.json"""
+    os.makedirs(save_dir, exist_ok=True)
+    manifest = ImageManifest()
+    with tracing.span("save_images") as span:
+        for page_idx, page_dic in enumerate(markdown_images):
+            if isinstance(page_dic, dict):
+                span.add("images_total", len(page_dic))
+            save_page_images(page_idx, page_dic, manifest, save_dir)
+        span.set("images_kept", len(manifest.entries))
+        span.set("images_duplicate", sum("duplicate_of" in entry for entry in manifest.entries))
+        manifest.save(save_dir)
+    tracing.count("images_saved", len(manifest.entries))
+    return manifest
+
+class MarkdownPageJoiner:
+    """
+    逐页拼接 markdown，规则与 PPStructureV3.concatenate_markdown_pages 相同：
+    上一页末段未结束且本页首段不是新段落时直接续接（非中文之间补一个空格），否则空一行。
+    每次 add 返回本页要追加的文本，供按页到达的流式处理使用。
+    """
+
+    def __init__(self):
+        self._last_char = ""
+        self._previous_end_flag = True
+
+    def add(self, md_info) -> str:
+        text = md_info["markdown_texts"]
+        start_flag, end_flag = md_info.get("page_continuation_flags", (True, True))
+        if not start_flag and not self._previous_end_flag:
+            first_char = text[:1]
+            if re.match(r"[\u4e00-\u9fff]", self._last_char) or re.match(r"[\u4e00-\u9fff]", first_char):
+                piece = text
+            else:
+                piece = " " + text
+        else:
+            piece = "\n\n" + text
+        if piece:
+            self._last_char = piece[-1]
+        self._previous_end_flag = end_flag
+        return piece
+
+def concatenate_pages(markdown_list: list) -> dict:
+    """按页序拼接每页的 markdown 信息，结果与 PPStructureV3.concatenate_markdown_pages 相同，不需要加载模型"""
+    joiner = MarkdownPageJoiner()
+    markdown_texts = "".join(joiner.add(md_info) for md_info in markdown_list)
+    markdown_images = [md_info.get("markdown_images", {}) for md_info in markdown_list]
+    return {"markdown_texts": markdown_texts, "markdown_images": markdown_images}
+
+def clear_imgs(save_dir="./imgs"):
+    if os.path.exists(save_dir):
+        for file in os.listdir(save_dir):
+            os.remove(os.path.join(save_dir, file))
+        os.rmdir(save_dir)
+
+def save_parse_result(result, output_path="./pages", imgs_dir="./imgs"):
+    """把结构化解析结果落盘为 content.md 和 imgs/ 下的图片"""
+    mkd_file_path = Path(output_path) / "content.md"
+    mkd_file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(mkd_file_path, "w", encoding="utf-8") as f:
+        f.write(result["markdown_texts"])
+
+    clear_imgs(imgs_dir)
+    save_images(result["markdown_images"], imgs_dir)
+
 
 class PDFParser:
-    def __init__(self, input_file: str):
+    def __init__(self, input_file: str = None, workers: int = 1):
+        """
+        workers > 1 时按页拆分，交给 ParseWorkerPool 的多个进程并行OCR，
+        本进程不再加载模型。
+        """
         self.input_file = input_file
         self.output_path = Path("./pages")
-        self.pipeline = PPStructureV3(
-            text_recognition_model_name="en_PP-OCRv4_mobile_rec",
-        )
+        self.workers = workers
+        self.pipeline = None
+        self.load_time = 0.0
+        if workers <= 1:
+            start = time.time()
+            self.pipeline = PPStructureV3(
+                text_recognition_model_name=TEXT_RECOGNITION_MODEL,
+            )
+            self.load_time = time.time() - start
 
+    @tracing.traced("pdf_parse")
     def parse(self):
-        output = self.pipeline.predict(self.input_file)
+        if self.workers > 1:
+            from parse_worker import ParseWorkerPool
+            pool = ParseWorkerPool(num_workers=self.workers)
+            try:
+                result = pool.parse_parallel(self.input_file)
+            finally:
+                pool.shutdown()
+            save_parse_result(result, self.output_path)
+            self.markdown_texts = result["markdown_texts"]
+            self.markdown_images = result["markdown_images"]
+            return
+        with tracing.span("ocr_predict"):
+            output = self.pipeline.predict(self.input_file)
         self.save_markdown(output)
 
-    def is_meaningless_img(self, pil_img, threshold=250):
+    def predict(self, input_file: str = None) -> dict:
         """
-        判断图片是否为全白（或几乎全白）。
-        threshold: 允许的最小灰度值，越低越严格。
+        解析PDF并返回结构化结果，不产生任何文件。
+        返回 {"markdown_texts": 拼接后的markdown, "markdown_images": 每页的{路径: PIL图片}}
         """
-        arr = np.array(pil_img)
-        # 支持RGB和RGBA
-        if arr.ndim == 3 and arr.shape[2] >= 3:
-            arr = arr[:, :, :3]
-        # 判断所有像素是否都大于等于阈值
-        return np.all(arr >= threshold)
-
-    
-    def save_images(self):
-        os.makedirs("./imgs", exist_ok=True)
-        img_count = 0
-        for page_idx, page_dic in enumerate(self.markdown_images):
-            if isinstance(page_dic, dict) and page_dic:
-                for img_idx, (path, image) in enumerate(page_dic.items()):
-                    if not self.is_meaningless_img(image) and not "table" in path:
-                        save_path = os.path.join("./imgs", f"page_{page_idx + 1}_img_{img_idx + 1}_{img_count + 1}.png")
-                        image.save(save_path)
-                        img_count += 1
+        with tracing.span("ocr_predict"):
+            output = self.pipeline.predict(input_file or self.input_file)
+        return self.collect_markdown(output)
 
-    def clear_imgs(self, save_dir = "./imgs"):
-        if os.path.exists(save_dir):
-            for file in os.listdir(save_dir):
-                os.remove(os.path.join(save_dir, file))
-            os.rmdir(save_dir)
-    
-    def save_markdown(self, output):
-        markdown_list = []
-        markdown_images = []
+    def predict_pages(self, input_file: str, start: int, end: int) -> list:
+        """
+        只解析 [start, end) 页，返回每页的 markdown 信息（未拼接），
+        供并行模式按页序合并。
+        """
+        with fitz.open(input_file) as doc, fitz.open() as sub_doc:
+            sub_doc.insert_pdf(doc, from_page=start, to_page=end - 1)
+            fd, sub_path = tempfile.mkstemp(suffix=".pdf")
+            os.close(fd)
+            sub_doc.save(sub_path)
+        try:
+            with tracing.span("ocr_predict", start=start, end=end):
+                output = self.pipeline.predict(sub_path)
+            return [res.markdown for res in output]
+        finally:
+            os.remove(sub_path)
 
-        for res in output:
-            md_info = res.markdown
-            markdown_list.append(md_info)
-            markdown_images.append(md_info.get("markdown_images", {}))
+    def concatenate(self, markdown_list: list) -> dict:
+        """按页序拼接每页的 markdown 信息"""
+        return concatenate_pages(markdown_list)
 
-        markdown_texts = self.pipeline.concatenate_markdown_pages(markdown_list)
+    def collect_markdown(self, output) -> dict:
+        return self.concatenate([res.markdown for res in output])
 
-        mkd_file_path = self.output_path / f"content.md"
-        mkd_file_path.parent.mkdir(parents=True, exist_ok=True)
+    def is_meaningless_img(self, pil_img, threshold=250):
+        return is_meaningless_img(pil_img, threshold)
 
-        with open(mkd_file_path, "w", encoding="utf-8") as f:
-            f.write(markdown_texts)
+    def save_images(self):
+        save_images(self.markdown_images)
 
-        # for item in markdown_images:
-        #     if item:
-        #         for path, image in item.items():
-        #             file_path = self.output_path / path
-        #             file_path.parent.mkdir(parents=True, exist_ok=True)
-        #             image.save(file_path)
-        
-        self.clear_imgs()
-        self.markdown_texts = markdown_texts
-        self.markdown_images = markdown_images
-        self.save_images()
+    def clear_imgs(self, save_dir = "./imgs"):
+        clear_imgs(save_dir)
+    
+    def save_markdown(self, output):
+        result = self.collect_markdown(output)
+        save_parse_result(result, self.output_path)
+        self.markdown_texts = result["markdown_texts"]
+        self.markdown_images = result["markdown_images"]
 
 
 
 if __name__ == "__main__":
-    parser = PDFParser("attention is all you need.pdf")
+    # 用法: python pdf_parser_ocr.py <pdf路径> [并行进程数]
+    parser = PDFParser(
+        sys.argv[1] if len(sys.argv) > 1 else "attention is all you need.pdf",
+        workers=int(sys.argv[2]) if len(sys.argv) > 2 else 1,
+    )
     parser.parse()
@@ -0,0 +1,92 @@
+import re
+import unicodedata
+from typing import Optional, Tuple
+
+# 问答前的本地快速判断：能确定时直接给出 (页, 序号)，不确定时返回 None 交给大模型。
+# 返回值语义与大模型分类提示词一致：(0, n) 第n张图片；(m, n) 第m页第n张图片；(0, 0) 与图片无关。
+
+CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+EN_ORDINALS = {
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5,
+    "sixth": 6, "seventh": 7, "eighth": 8, "ninth": 9, "tenth": 10,
+}
+
+NUM = r"(\d+|[零一二两三四五六七八九十百]+)"
+CN_IMAGE = r"(?:图片|图像|插图|照片|配图|图表|图)"
+CN_IMAGE_ORDINAL = re.compile(r"第\s*" + NUM + r"\s*(?:张|幅|个)?\s*" + CN_IMAGE)
+CN_PAGE = re.compile(r"第\s*" + NUM + r"\s*页")
+# "图4"、"图 4"，排除"试图""意图"等词
+CN_FIGURE_LABEL = re.compile(r"(?<![试意企地版])图\s*(\d+)")
+EN_FIGURE = re.compile(r"\b(?:figure|fig\.?|image|img|picture|photo)\s*(?:no\.?\s*)?#?\s*(\d+)\b")
+EN_ORDINAL_FIGURE = re.compile(
+    r"\b(" + "|".join(EN_ORDINALS) + r"|\d+(?:st|nd|rd|th))\s+(?:figure|fig\.?|image|picture|photo)\b")
+EN_PAGE = re.compile(r"\b(?:page|p\.)\s*(\d+)\b")
+
+# 出现这些词才可能是图片问题；"图神经网络""知识图谱""试图"等不算
+IMAGE_KEYWORDS = re.compile(
+    r"图片|图像|插图|照片|配图|图表|(?<![试意企地版])图(?!灵|书|谱|神经|结构|论|算法)"
+    r"|\bfig(?:ure)?s?\b|\bimages?\b|\bpictures?\b|\bphotos?\b|\bdiagrams?\b|\bcharts?\b|\bplots?\b"
+)
+
+
+def chinese_to_int(text: str) -> Optional[int]:
+    """把阿拉伯数字或一百以内的中文数字转成整数"""
+    if text.isdigit():
+        return int(text)
+    if text == "百" or text == "一百":
+        return 100
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        tens_value = CN_DIGITS.get(tens, None) if tens else 1
+        ones_value = CN_DIGITS.get(ones, None) if ones else 0
+        if tens_value is None or ones_value is None:
+            return None
+        return tens_value * 10 + ones_value
+    if len(text) == 1:
+        return CN_DIGITS.get(text)
+    return None
+
+
+def _ordinal_to_int(text: str) -> Optional[int]:
+    if text in EN_ORDINALS:
+        return EN_ORDINALS[text]
+    digits = re.match(r"\d+", text)
+    return int(digits.group()) if digits else None
+
+
+def _pages(question: str) -> set:
+    pages = {chinese_to_int(m) for m in CN_PAGE.findall(question)}
+    pages |= {int(m) for m in EN_PAGE.findall(question)}
+    return pages
+
+
+def parse_image_question(question: str) -> Optional[Tuple[int, int]]:
+    """
+    本地解析问题是否在问某张图片。
+    返回 (页, 序号)，页为0表示按全文序号；(0, 0) 表示确定与图片无关；None 表示无法确定。
+    """
+    text = unicodedata.normalize("NFKC", question).lower()
+
+    if not IMAGE_KEYWORDS.search(text):
+        return (0, 0)
+
+    # 中文序数："第2张图片"；先把"第m页"去掉，避免页码被当成图片序号
+    image_text = CN_PAGE.sub(" ", text)
+    image_nums = {chinese_to_int(m) for m in CN_IMAGE_ORDINAL.findall(image_text)}
+    image_nums |= {int(m) for m in CN_FIGURE_LABEL.findall(text)}
+    image_nums |= {int(m) for m in EN_FIGURE.findall(text)}
+    image_nums |= {_ordinal_to_int(m) for m in EN_ORDINAL_FIGURE.findall(text)}
+    image_nums.discard(None)
+    image_nums.discard(0)
+
+    if len(image_nums) != 1:
+        # 提到了图但没给出序号（如"第5页的图说明了什么"），或同时问了多张图，交给大模型判断
+        return None
+    image_num = image_nums.pop()
+
+    pages = _pages(text)
+    if not pages:
+        return (0, image_num)
+    if len(pages) > 1 or None in pages or 0 in pages:
+        return None
+    return (pages.pop(), image_num)
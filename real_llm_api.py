@@ -1,4 +1,42 @@
-import requests
+import json
+import os
+import time
+from typing import Callable, Iterator, Optional, Tuple
+from http_transport import DEFAULT_TIMEOUT, get_session, retry_count
+from llm_cache import get_response_cache, make_key
+import tracing
+
+# 已输出部分内容后连接中断时追加在回答末尾，界面上可见，调用方也可据此判断回答不完整
+TRUNCATED_NOTICE = "\n\n[回答因连接中断而不完整]"
+
+def iter_sse_data(response) -> Iterator[str]:
+    """逐条读取SSE响应中 data: 行的内容"""
+    response.encoding = "utf-8"
+    for line in response.iter_lines(decode_unicode=True):
+        if line and line.startswith("data:"):
+            yield line[len("data:"):].strip()
+
+def record_request(provider: str, response):
+    """在当前span（llm_call）上记录本次HTTP请求的发送字节数和连接池层面的重试次数"""
+    body = response.request.body or b""
+    retries = retry_count(response)
+    span = tracing.current_span()
+    span.add("bytes_sent", len(body))
+    span.add("retries", retries)
+    tracing.count("llm_requests", provider=provider)
+    tracing.count("llm_bytes_sent", len(body), provider=provider)
+    if retries:
+        tracing.count("llm_retries", retries, provider=provider)
+
+def record_tokens(span, provider: str, prompt: str, text: str):
+    """记录估算的输入/输出token数（流式接口不返回用量）"""
+    if not tracing.enabled():
+        return
+    from text_util import estimate_tokens
+    for kind, value in (("prompt", prompt), ("completion", text)):
+        tokens = estimate_tokens(value)
+        span.set(f"{kind}_tokens", tokens)
+        tracing.count("llm_tokens", tokens, provider=provider, kind=kind)
 
 class LLMAPI:
     def __init__(self, api_type: str = "qwen", api_key: str = ""):
@@ -8,106 +46,227 @@ class LLMAPI:
         """
         self.api_type = api_type
         self.api_key = api_key
+        self.params = {"max_tokens": 2000, "temperature": 0.7}
+        self.timeout = DEFAULT_TIMEOUT
+        self.last_ttft = None
+        self.last_truncated = False
         self.setup_api_config()
+        # 同一服务商共享 keep-alive 连接池，429/5xx 按 Retry-After 重试
+        self.session = get_session(self.api_type)
     
     def setup_api_config(self):
-        """设置API配置"""
+        """设置API配置，服务地址可通过 QWEN_BASE_URL / DOUBAO_BASE_URL / DEEPSEEK_BASE_URL 覆盖"""
         if self.api_type == "qwen":
-            self.base_url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
+            self.model = "qwen-turbo"
+            self.base_url = os.environ.get("QWEN_BASE_URL", "https://dashscope.aliyuncs.com/api/v1") + "/services/aigc/text-generation/generation"
             self.headers = {
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
             }
         elif self.api_type == "doubao":
-            self.base_url = "https://api.doubao.com/v1/chat/completions"
+            self.model = "doubao-pro"
+            self.base_url = os.environ.get("DOUBAO_BASE_URL", "https://api.doubao.com/v1") + "/chat/completions"
             self.headers = {
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
             }
         elif self.api_type == "deepseek":
-            self.base_url = "https://api.deepseek.com/v1/chat/completions"
+            self.model = "deepseek-chat"
+            self.base_url = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1") + "/chat/completions"
             self.headers = {
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
             }
+        else:
+            self.model = ""
+            self.base_url = ""
+            self.headers = {}
     
-    def call_qwen_api(self, prompt: str) -> str:
-        """调用Qwen API"""
+    def qwen_request(self, prompt: str) -> Tuple[dict, dict]:
+        """Qwen 流式请求的 (请求头, 请求体)"""
         data = {
-            "model": "qwen-turbo",
+            "model": self.model,
             "input": {
                 "messages": [
                     {"role": "user", "content": prompt}
                 ]
             },
-            "parameters": {
-                "max_tokens": 2000,
-                "temperature": 0.7
-            }
+            "parameters": {**self.params, "incremental_output": True}
         }
-        
-        try:
-            response = requests.post(self.base_url, headers=self.headers, json=data)
-            response.raise_for_status()
-            result = response.json()
-            return result["output"]["text"]
-        except Exception as e:
-            print(f"Qwen API调用失败: {e}")
-            return self.get_fallback_response(prompt)
+        headers = {**self.headers, "X-DashScope-SSE": "enable"}
+        return headers, data
     
-    def call_doubao_api(self, prompt: str) -> str:
-        """调用Doubao API"""
+    def chat_completions_request(self, prompt: str) -> Tuple[dict, dict]:
+        """OpenAI兼容接口流式请求的 (请求头, 请求体)"""
         data = {
-            "model": "doubao-pro",
+            "model": self.model,
             "messages": [
                 {"role": "user", "content": prompt}
             ],
-            "max_tokens": 2000,
-            "temperature": 0.7
+            "stream": True,
+            **self.params
         }
+        return self.headers, data
+    
+    @staticmethod
+    def qwen_delta(payload: str) -> Optional[str]:
+        """从Qwen的一条SSE数据中取出增量文本"""
+        return json.loads(payload).get("output", {}).get("text")
+    
+    @staticmethod
+    def chat_completions_delta(payload: str) -> Optional[str]:
+        """从OpenAI兼容接口的一条SSE数据中取出增量文本（[DONE] 之前）"""
+        result = json.loads(payload)
+        if result.get("choices"):
+            return result["choices"][0].get("delta", {}).get("content")
+        return None
+    
+    def stream_qwen(self, prompt: str) -> Iterator[str]:
+        """流式请求Qwen API，逐段产出增量文本，失败时抛出异常"""
+        headers, data = self.qwen_request(prompt)
         
-        try:
-            response = requests.post(self.base_url, headers=self.headers, json=data)
+        with self.session.post(self.base_url, headers=headers, json=data, timeout=self.timeout, stream=True) as response:
+            record_request(self.api_type, response)
             response.raise_for_status()
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
-        except Exception as e:
-            print(f"Doubao API调用失败: {e}")
-            return self.get_fallback_response(prompt)
+            for payload in iter_sse_data(response):
+                delta = self.qwen_delta(payload)
+                if delta:
+                    yield delta
     
-    def call_deepseek_api(self, prompt: str) -> str:
-        """调用Deepseek API"""
-        data = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "max_tokens": 2000,
-            "temperature": 0.7
-        }
+    def stream_chat_completions(self, prompt: str) -> Iterator[str]:
+        """流式请求OpenAI兼容的chat completions接口（Doubao、Deepseek），失败时抛出异常"""
+        headers, data = self.chat_completions_request(prompt)
         
-        try:
-            response = requests.post(self.base_url, headers=self.headers, json=data)
+        with self.session.post(self.base_url, headers=headers, json=data, timeout=self.timeout, stream=True) as response:
+            record_request(self.api_type, response)
             response.raise_for_status()
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
+            for payload in iter_sse_data(response):
+                if payload == "[DONE]":
+                    break
+                delta = self.chat_completions_delta(payload)
+                if delta:
+                    yield delta
+    
+    def stream(self, prompt: str) -> Iterator[str]:
+        """按服务商分发流式请求，失败时抛出异常"""
+        if self.api_type == "qwen":
+            yield from self.stream_qwen(prompt)
+        elif self.api_type in ("doubao", "deepseek"):
+            yield from self.stream_chat_completions(prompt)
+        else:
+            raise ValueError(f"不支持的API类型: {self.api_type}")
+    
+    def request_qwen(self, prompt: str) -> str:
+        """请求Qwen API，失败时抛出异常"""
+        return "".join(self.stream_qwen(prompt))
+    
+    def request_chat_completions(self, prompt: str) -> str:
+        """请求OpenAI兼容的chat completions接口（Doubao、Deepseek），失败时抛出异常"""
+        return "".join(self.stream_chat_completions(prompt))
+    
+    def request(self, prompt: str) -> str:
+        """按服务商分发请求，失败时抛出异常"""
+        return "".join(self.stream(prompt))
+    
+    def stream_with_fallback(self, deltas: Iterator[str], prompt: str,
+                             on_complete: Optional[Callable[[str], None]] = None) -> Iterator[str]:
+        """
+        透传增量文本并记录首token耗时；出错时若尚未输出任何内容，则输出备用响应，
+        已输出部分内容则追加 TRUNCATED_NOTICE 并把 last_truncated 置为 True，不会当作完整回答。
+        完整接收后以全文调用 on_complete（不完整的回答不缓存）。
+        """
+        start = time.time()
+        parts = []
+        self.last_truncated = False
+        # 生成器会在调用方的循环中挂起，span 不进入上下文，只在拉取增量时临时设为当前span
+        span = tracing.start_span("llm_call", provider=self.api_type, model=self.model)
+        deltas = iter(deltas)
+        try:
+            while True:
+                with tracing.activate(span):
+                    delta = next(deltas, None)
+                if delta is None:
+                    break
+                if not parts:
+                    self.last_ttft = time.time() - start
+                    span.set("ttft_ms", round(self.last_ttft * 1000, 1))
+                    print(f"{self.api_type} 首token耗时: {self.last_ttft:.2f}s")
+                parts.append(delta)
+                yield delta
+            text = "".join(parts)
+            record_tokens(span, self.api_type, prompt, text)
         except Exception as e:
-            print(f"Deepseek API调用失败: {e}")
-            return self.get_fallback_response(prompt)
+            print(f"{self.api_type} API调用失败: {e}")
+            tracing.count("llm_errors", provider=self.api_type)
+            span.end(e)
+            if not parts:
+                yield self.get_fallback_response(prompt)
+            else:
+                self.last_truncated = True
+                tracing.count("llm_truncated", provider=self.api_type)
+                yield TRUNCATED_NOTICE
+            return
+        finally:
+            # 调用方提前停止迭代时也结束span
+            span.end()
+        if on_complete is not None:
+            on_complete(text)
+    
+    def stream_qwen_api(self, prompt: str) -> Iterator[str]:
+        """流式调用Qwen API"""
+        return self.stream_with_fallback(self.stream_qwen(prompt), prompt)
+    
+    def stream_doubao_api(self, prompt: str) -> Iterator[str]:
+        """流式调用Doubao API"""
+        return self.stream_with_fallback(self.stream_chat_completions(prompt), prompt)
+    
+    def stream_deepseek_api(self, prompt: str) -> Iterator[str]:
+        """流式调用Deepseek API"""
+        return self.stream_with_fallback(self.stream_chat_completions(prompt), prompt)
+    
+    def call_qwen_api(self, prompt: str) -> str:
+        """调用Qwen API"""
+        return "".join(self.stream_qwen_api(prompt))
+    
+    def call_doubao_api(self, prompt: str) -> str:
+        """调用Doubao API"""
+        return "".join(self.stream_doubao_api(prompt))
+    
+    def call_deepseek_api(self, prompt: str) -> str:
+        """调用Deepseek API"""
+        return "".join(self.stream_deepseek_api(prompt))
+    
+    def cache_key(self, prompt: str) -> str:
+        return make_key(self.api_type, self.model, self.params, prompt)
     
-    def call_api(self, prompt: str) -> str:
-        """统一的API调用接口"""
+    def stream_api(self, prompt: str, use_cache: bool = True) -> Iterator[str]:
+        """
+        统一的流式调用接口，逐段产出增量文本
+        use_cache: 命中缓存时一次性产出完整结果；需要每次重新生成时传 False
+        """
         if not self.api_key:
-            return self.get_fallback_response(prompt)
+            yield self.get_fallback_response(prompt)
+            return
         
-        if self.api_type == "qwen":
-            return self.call_qwen_api(prompt)
-        elif self.api_type == "doubao":
-            return self.call_doubao_api(prompt)
-        elif self.api_type == "deepseek":
-            return self.call_deepseek_api(prompt)
-        else:
-            return self.get_fallback_response(prompt)
+        if use_cache:
+            key = self.cache_key(prompt)
+            cached = get_response_cache().get(key)
+            if cached is not None:
+                tracing.count("llm_cache_hits", provider=self.api_type)
+                yield cached
+                return
+        
+        # 只缓存完整成功的响应
+        on_complete = (lambda text: get_response_cache().set(key, text)) if use_cache else None
+        yield from self.stream_with_fallback(self.stream(prompt), prompt, on_complete)
+    
+    def call_api(self, prompt: str, use_cache: bool = True) -> str:
+        """
+        统一的API调用接口（流式接口的简单封装）
+        use_cache: 相同服务商、模型、参数和提示词直接返回缓存结果；需要每次重新生成时传 False
+        中途断开的回答以 TRUNCATED_NOTICE 结尾，last_truncated 为 True
+        """
+        return "".join(self.stream_api(prompt, use_cache))
     
     def get_fallback_response(self, prompt: str) -> str:
         """备用响应（当API调用失败时）"""
@@ -121,15 +280,26 @@ def init_llm(api_type: str = "qwen", api_key: str = ""):
     global llm_instance
     llm_instance = LLMAPI(api_type, api_key)
 
-def call_llm_api(prompt: str) -> str:
-    """调用LLM API的统一接口"""
+def call_llm_api(prompt: str, use_cache: bool = True) -> str:
+    """调用LLM API的统一接口，use_cache=False 时绕过响应缓存"""
     global llm_instance
     if llm_instance:
-        return llm_instance.call_api(prompt)
+        return llm_instance.call_api(prompt, use_cache)
     else:
         # 如果没有初始化，使用备用响应
         return LLMAPI().get_fallback_response(prompt)
 
+def stream_llm_api(prompt: str, use_cache: bool = True) -> Iterator[str]:
+    """流式调用LLM API，逐段产出增量文本"""
+    global llm_instance
+    if llm_instance:
+        return llm_instance.stream_api(prompt, use_cache)
+    return iter([LLMAPI().get_fallback_response(prompt)])
+
+def llm_cache_stats() -> dict:
+    """响应缓存的命中统计"""
+    return get_response_cache().stats()
+
 # 使用示例
 if __name__ == "__main__":
     # 初始化API（需要替换为真实的API Key）
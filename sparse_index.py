@@ -0,0 +1,158 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+# 英文单词/数字，允许内部的 . - _ 连接（如 f1-score、resnet-50、3.2）
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-][a-z0-9]+)*")
+CJK_RUN_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中英文混合分词：英文按单词（小写），中文连续汉字按二元组切分（单个汉字保留为一元）。
+    不依赖分词词典，专有名词、数据集名和公式编号都能精确匹配。
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = WORD_PATTERN.findall(text)
+    for run in CJK_RUN_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    分块级的 BM25 倒排索引，常驻内存。
+    只持久化分块的 id、文本和元数据，加载时重新分词建索引（几千个分块只需几十毫秒）。
+    extend 追加分块时只为新分块分词、追加倒排和文档长度，流式入库时不必每批重建整份索引；
+    追加与检索由锁保护，入库线程追加时其他线程可以同时检索。
+    """
+
+    def __init__(self, ids: List[str], texts: List[str], metadatas: List[dict], k1: float = 1.5, b: float = 0.75):
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+        self.total_length = 0
+        self._norms: Optional[List[float]] = None
+        self._lock = threading.Lock()
+        self.extend(ids, texts, metadatas)
+
+    def __len__(self):
+        return len(self.texts)
+
+    @property
+    def avg_length(self) -> float:
+        return self.total_length / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def extend(self, ids: List[str], texts: List[str], metadatas: List[dict]):
+        """追加分块：只对新分块分词；平均长度变化后，长度归一化项在下次检索时重算"""
+        tokenized = [Counter(tokenize(text)) for text in texts]
+        with self._lock:
+            for counts in tokenized:
+                doc_index = len(self.doc_lengths)
+                length = sum(counts.values())
+                self.doc_lengths.append(length)
+                self.total_length += length
+                for term, tf in counts.items():
+                    self.postings.setdefault(term, []).append((doc_index, tf))
+            self.ids.extend(ids)
+            self.texts.extend(texts)
+            self.metadatas.extend(metadatas)
+            self._norms = None
+
+    def _idf(self, term: str) -> float:
+        total, matched = len(self.doc_lengths), len(self.postings[term])
+        return math.log(1 + (total - matched + 0.5) / (matched + 0.5))
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """返回得分最高的 k 个 (分块序号, 得分)"""
+        scores: Dict[int, float] = {}
+        terms = set(tokenize(query))
+        with self._lock:
+            if self._norms is None:
+                # 文档长度归一化项与查询无关，追加分块后第一次检索时算好
+                avg_length = self.avg_length or 1.0
+                self._norms = [self.k1 * (1 - self.b + self.b * length / avg_length) for length in self.doc_lengths]
+            k1, norms = self.k1, self._norms
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = self._idf(term)
+                for doc_index, tf in postings:
+                    scores[doc_index] = scores.get(doc_index, 0.0) + idf * tf * (k1 + 1) / (tf + norms[doc_index])
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def document(self, doc_index: int) -> Document:
+        return Document(page_content=self.texts[doc_index], metadata=self.metadatas[doc_index])
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with self._lock:
+            data = {"ids": list(self.ids), "texts": list(self.texts), "metadatas": list(self.metadatas)}
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["ids"], data["texts"], data["metadatas"])
+
+    @classmethod
+    def from_documents(cls, ids: List[str], documents: List[Document]) -> "BM25Index":
+        return cls(list(ids), [doc.page_content for doc in documents], [dict(doc.metadata) for doc in documents])
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """倒数排名融合：各路结果按 1/(k+名次) 累加，不需要统一不同检索方式的分数尺度"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda key: scores[key], reverse=True)
+
+
+_lock = threading.Lock()
+_indexes: Dict[str, BM25Index] = {}
+
+
+def get_sparse_index(path: str) -> Optional[BM25Index]:
+    """加载并缓存稀疏索引，文件不存在时返回 None"""
+    with _lock:
+        index = _indexes.get(path)
+        if index is None and os.path.exists(path):
+            index = BM25Index.load(path)
+            _indexes[path] = index
+        return index
+
+
+def put_sparse_index(path: str, index: BM25Index, persist: bool = True):
+    """保存索引并替换内存中的缓存；persist=False 时只替换内存中的索引（如入库过程中的中间结果）"""
+    if persist:
+        index.save(path)
+    with _lock:
+        _indexes[path] = index
+
+
+def drop_sparse_index(path: str):
+    with _lock:
+        _indexes.pop(path, None)
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import time
+from typing import Iterator, List, Optional
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from async_llm_api import call_llm_api_batch
+from real_llm_api import stream_llm_api
+from text_util import estimate_tokens, split_markdown_sections
+
+# 不超过该token数的文档仍一次性总结，更长的走分段总结（map-reduce）
+SINGLE_PASS_TOKENS = int(os.environ.get("SUMMARY_SINGLE_PASS_TOKENS", 12000))
+# 每个分段的token上限，超长的小节再切开
+SECTION_TOKENS = int(os.environ.get("SUMMARY_SECTION_TOKENS", 4000))
+# 不足该token数的小节与后面的小节合并，避免为很短的小节单独请求
+MIN_SECTION_TOKENS = int(os.environ.get("SUMMARY_MIN_SECTION_TOKENS", 800))
+# 连续合并的短小节平均每这么多个断开一次，避免一长串短小节合成过长的分段
+RUN_ANCHOR = 4
+# 合并阶段输入的token上限，超过时先分组做中间合并
+REDUCE_TOKENS = int(os.environ.get("SUMMARY_REDUCE_TOKENS", 8000))
+
+SECTION_PROMPT = """
+请总结以下学术文献片段，要求：
+1. 保留研究问题、方法、实验设置、结果数据和结论等关键信息
+2. 不要编造片段中没有的内容
+3. 用中文回答，不超过300字
+
+文献片段：
+{text}
+"""
+
+MERGE_PROMPT = """
+以下是同一篇学术文献中连续若干部分的总结，请合并为一份总结，保留关键方法、数据和结论，用中文回答，不超过500字：
+
+{text}
+"""
+
+FINAL_PROMPT = """
+以下是一篇学术文献各部分的总结，请据此对整篇文献进行总结，要求：
+1. 总结核心研究内容和方法
+2. 突出主要创新点
+3. 说明实验结果和贡献
+4. 用中文回答，语言简洁明了
+
+各部分总结：
+{text}
+"""
+
+
+def _header_path(metadata: dict) -> tuple:
+    return tuple((level, metadata[level]) for level in ("h1", "h2", "h3", "h4") if level in metadata)
+
+
+def _run_anchor(path: tuple) -> bool:
+    """连续的短小节约每 RUN_ANCHOR 个断开一次；只由标题决定，与其他小节的长度和正文无关"""
+    digest = hashlib.sha1(repr(path).encode("utf-8")).digest()
+    return digest[0] % RUN_ANCHOR == 0
+
+
+def split_sections(markdown_text: str, max_tokens: int = SECTION_TOKENS,
+                   min_tokens: int = MIN_SECTION_TOKENS) -> List[str]:
+    """
+    按标题小节切分全文：超过 max_tokens 的小节再按段落/句子切开；
+    不足 min_tokens 的小节并入紧随其后的同级小节或自己的下级小节（连续的短小节可能合成略超过 max_tokens 的分段）。
+    小节之后是否断开只由该小节的长度和前后两个小节的标题决定，不随前文的分组累积变化：
+    修改一个小节时，只有包含它的分段（修改前或修改后）会变化，其余分段的提示词不变，缓存仍然命中。
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=max_tokens, chunk_overlap=0, length_function=estimate_tokens)
+    pieces = []  # (文本, token数, 标题路径)
+    for doc in split_markdown_sections(markdown_text):
+        path = _header_path(doc.metadata)
+        texts = [doc.page_content]
+        if estimate_tokens(doc.page_content) > max_tokens:
+            texts = splitter.split_text(doc.page_content)
+        pieces.extend((text, estimate_tokens(text), path) for text in texts)
+
+    sections, current = [], []
+    for i, (text, tokens, path) in enumerate(pieces):
+        # 短小节只并入紧随其后的同级小节或下级小节
+        current.append(text)
+        if i + 1 < len(pieces):
+            next_path = pieces[i + 1][2]
+            related = next_path[:-1] in (path[:-1], path)
+            if tokens < min_tokens and related and not _run_anchor(path):
+                continue
+        sections.append("\n\n".join(current))
+        current = []
+    return sections
+
+
+def summarize_sections(sections: List[str]) -> List[Optional[str]]:
+    """
+    并发总结各分段（并发数和速率由服务商调度器控制），结果与输入顺序一致，总结失败的分段为 None。
+    提示词只取决于分段内容，响应缓存按提示词命中，文档修改后只有变化的分段会重新请求。
+    """
+    return call_llm_api_batch([SECTION_PROMPT.format(text=section) for section in sections])
+
+
+def reduce_summaries(summaries: List[str], max_tokens: int = REDUCE_TOKENS) -> List[str]:
+    """部分总结总长超过 max_tokens 时按顺序分组合并，直到可以放进一次最终总结；合并失败的组保留原来的各条总结"""
+    while len(summaries) > 1 and estimate_tokens("\n\n".join(summaries)) > max_tokens:
+        groups, current, current_tokens = [], [], 0
+        for summary in summaries:
+            tokens = estimate_tokens(summary)
+            if current and current_tokens + tokens > max_tokens:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(summary)
+            current_tokens += tokens
+        groups.append(current)
+        if len(groups) == len(summaries):
+            # 每组只剩一条，无法再合并
+            break
+        merged = call_llm_api_batch([MERGE_PROMPT.format(text="\n\n".join(group)) for group in groups])
+        summaries = [summary if summary is not None else "\n\n".join(group)
+                     for summary, group in zip(merged, groups)]
+    return summaries
+
+
+def summarize_stream(markdown_text: str) -> Iterator[str]:
+    """
+    分段总结（map-reduce）：各分段并发总结，再合并为全文总结，最终合并流式输出。
+    总耗时取决于最长的分段，而不是整篇文档。总结失败的分段跳过，不把错误信息混入总结。
+    """
+    start = time.time()
+    sections = split_sections(markdown_text)
+    summaries = [summary for summary in summarize_sections(sections) if summary is not None]
+    failed = len(sections) - len(summaries)
+    if not summaries:
+        print(f"分段总结: {len(sections)} 段全部失败")
+        yield "api调用失败"
+        return
+    summaries = reduce_summaries(summaries)
+    print(f"分段总结: {len(sections)} 段（失败跳过 {failed} 段）, 耗时 {time.time() - start:.2f}s")
+
+    parts = [f"第{i + 1}部分：\n{summary}" for i, summary in enumerate(summaries)]
+    yield from stream_llm_api(FINAL_PROMPT.format(text="\n\n".join(parts)))
@@ -0,0 +1,287 @@
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional
+
+import fitz
+from PIL import Image
+
+import tracing
+
+# 原生文本层快速通道：文本层可用的页面直接用 PyMuPDF 提取 markdown，只有扫描页和乱码页交给OCR。TEXT_LAYER=0 关闭
+TEXT_LAYER = os.environ.get("TEXT_LAYER", "1") != "0"
+# 逐页判定规则的版本，规则变化时递增，使按旧规则解析的缓存失效
+CLASSIFY_VERSION = 2
+# 非空白字符少于这么多且页面上有插图大小的位图时视为扫描页（文字可能都在图片里）；没有位图的空白页、纯矢量图页用文本层
+MIN_TEXT_CHARS = 30
+# 图片覆盖页面面积的比例超过该值时视为扫描页（即使带有隐藏的OCR文本层，也用本项目的OCR重新识别）
+SCANNED_IMAGE_COVERAGE = 0.8
+# 无法映射的字形（U+FFFD、私有区、控制字符、(cid:N)）占比超过该值时视为乱码页
+MAX_BAD_GLYPH_RATIO = 0.02
+# 插图的最小边长（pt），更小的是图标、公式符号等
+MIN_FIGURE_SIZE = 40
+FIGURE_DPI = 150
+# 参与统计字号的页数
+PROFILE_PAGES = 20
+
+SENTENCE_END = ".!?。！？:：;；\"'”’)）]】"
+NUMBERED_HEADING = re.compile(r"^(\d+(\.\d+)*\.?|[IVX]+\.|[A-Z]\.)\s+\S")
+SECTION_NUMBER = re.compile(r"^(\d+(\.\d+)*\.?|[IVX]+\.|[A-Z]\.)$")
+CID_PATTERN = re.compile(r"\(cid:\d+\)")
+CJK = re.compile(r"[　-〿一-鿿＀-￯]")
+BOLD_FLAG = 16
+# 展开 ﬁ、ﬀ 等连字，不提取图片内容（插图另行按区域渲染）
+TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES
+
+
+def _bad_glyphs(text: str) -> int:
+    bad = len(CID_PATTERN.findall(text)) * 8
+    for char in text:
+        code = ord(char)
+        if char == "�" or 0xE000 <= code <= 0xF8FF or (code < 32 and char not in "\n\t\r"):
+            bad += 1
+    return bad
+
+
+def _has_raster_figure(page) -> bool:
+    page_rect = page.rect
+    for info in page.get_image_info():
+        rect = fitz.Rect(info["bbox"]) & page_rect
+        if not rect.is_empty and rect.width >= MIN_FIGURE_SIZE and rect.height >= MIN_FIGURE_SIZE:
+            return True
+    return False
+
+
+def _image_coverage(page) -> float:
+    page_rect = page.rect
+    area = 0.0
+    for info in page.get_image_info():
+        rect = fitz.Rect(info["bbox"]) & page_rect
+        if not rect.is_empty:
+            area += rect.width * rect.height
+    return min(1.0, area / (page_rect.width * page_rect.height))
+
+
+def classify_page(page) -> Optional[str]:
+    """
+    判断一页能否直接使用文本层：可以时返回 None，否则返回需要OCR的原因（"scanned" / "garbled"）。
+    扫描页：图片几乎覆盖整页，或文本层几乎没有文字而页面上有插图大小的位图（页边距、裁剪过的扫描、两张半页扫描等）；
+    乱码页：文本层中无法映射的字形过多（字体缺少 ToUnicode 等）。
+    """
+    text = page.get_text()
+    chars = sum(1 for char in text if not char.isspace())
+    if _image_coverage(page) >= SCANNED_IMAGE_COVERAGE:
+        return "scanned"
+    if chars < MIN_TEXT_CHARS:
+        # 文字可能都在位图里，交给OCR；只有空白页和纯矢量图页直接用文本层
+        return "scanned" if _has_raster_figure(page) else None
+    if _bad_glyphs(text) / chars > MAX_BAD_GLYPH_RATIO:
+        return "garbled"
+    return None
+
+
+def classify_document(pdf_path: str) -> List[Optional[str]]:
+    with fitz.open(pdf_path) as doc:
+        return [classify_page(page) for page in doc]
+
+
+class FontProfile:
+    """
+    由字号分布推断标题层级：出现最多的字号为正文，明显更大的字号（稍大的字号须加粗）从大到小依次为一、二、三……级标题；
+    与正文同字号、加粗、以章节编号开头的短行作为最低一级标题。
+    """
+
+    MAX_LEVELS = 4
+    LARGE_RATIO = 1.3
+    BOLD_RATIO = 1.1
+
+    def __init__(self, body_size: float, heading_sizes: List[float]):
+        self.body_size = body_size
+        self.levels: Dict[float, int] = {size: level for level, size in enumerate(heading_sizes, 1)}
+        self.numbered_level = min(len(heading_sizes) + 1, self.MAX_LEVELS)
+
+    @classmethod
+    def from_document(cls, doc, pages: int = PROFILE_PAGES) -> "FontProfile":
+        sizes: Counter = Counter()
+        bold_sizes = set()
+        for page in doc.pages(0, min(pages, doc.page_count)):
+            for block in page.get_text("dict", flags=TEXT_FLAGS)["blocks"]:
+                for line in block.get("lines", []):
+                    for span in line["spans"]:
+                        size = round(span["size"], 1)
+                        sizes[size] += len(span["text"].strip())
+                        if span["flags"] & BOLD_FLAG:
+                            bold_sizes.add(size)
+        if not sizes:
+            return cls(0.0, [])
+        body_size = sizes.most_common(1)[0][0]
+        heading_sizes = sorted(
+            (size for size in sizes
+             if size >= body_size * cls.LARGE_RATIO or (size >= body_size * cls.BOLD_RATIO and size in bold_sizes)),
+            reverse=True,
+        )
+        return cls(body_size, heading_sizes[:cls.MAX_LEVELS])
+
+    def heading_level(self, line: dict, text: str) -> Optional[int]:
+        """该行是标题时返回层级；单独成行的章节编号（如 "3.1"）也按标题字号判断，由调用方拼到下一个标题前"""
+        if len(text) > 150:
+            return None
+        spans = [span for span in line["spans"] if span["text"].strip()]
+        size = max(round(span["size"], 1) for span in spans)
+        bold = all(span["flags"] & BOLD_FLAG for span in spans)
+        if size in self.levels and (bold or size >= self.body_size * self.LARGE_RATIO):
+            return self.levels[size]
+        if bold and abs(size - self.body_size) < 0.6 and len(text) <= 80 and NUMBERED_HEADING.match(text):
+            return self.numbered_level
+        return None
+
+
+def _join_line(paragraph: str, text: str) -> str:
+    if not paragraph:
+        return text
+    if paragraph.endswith("-") and text[:1].islower():
+        # 行尾连字符断词
+        return paragraph[:-1] + text
+    if CJK.match(paragraph[-1]) or CJK.match(text[0]):
+        return paragraph + text
+    return paragraph + " " + text
+
+
+def _merge_rects(rects: List[fitz.Rect]) -> List[fitz.Rect]:
+    merged: List[fitz.Rect] = []
+    for rect in sorted(rects, key=lambda r: (r.y0, r.x0)):
+        for i, other in enumerate(merged):
+            if rect.intersects(other):
+                merged[i] = other | rect
+                break
+        else:
+            merged.append(fitz.Rect(rect))
+    return merged
+
+
+def _figure_regions(page, tables: List[fitz.Rect]) -> List[fitz.Rect]:
+    """插图区域：位图的位置加上矢量图（成簇的绘图路径），不含表格"""
+    rects = [fitz.Rect(info["bbox"]) & page.rect for info in page.get_image_info()]
+    drawings = page.get_drawings()
+    if len(drawings) >= 10:
+        rects.extend(page.cluster_drawings(drawings=drawings))
+    regions = []
+    for rect in _merge_rects([rect for rect in rects if not rect.is_empty]):
+        if rect.width < MIN_FIGURE_SIZE or rect.height < MIN_FIGURE_SIZE:
+            continue
+        if any(rect.intersects(table) for table in tables):
+            continue
+        regions.append(rect)
+    return regions
+
+
+def _render(page, rect: fitz.Rect) -> Image.Image:
+    pix = page.get_pixmap(clip=rect, dpi=FIGURE_DPI, alpha=False)
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+
+def _image_tag(key: str, rect: fitz.Rect, page_width: float) -> str:
+    # 与 PPStructureV3 的 markdown 中插图的写法一致
+    width = max(1, round(rect.width / page_width * 100))
+    return f'<div style="text-align: center;"><img src="{key}" alt="Image" width="{width}%" /></div>'
+
+
+def page_markdown(page, profile: FontProfile) -> dict:
+    """
+    用文本层生成一页的 markdown 信息，格式与 PPStructureV3 每页的结果相同：
+    {"markdown_texts", "markdown_images": {路径: PIL图片}, "page_continuation_flags": (本页首段是新段落, 本页末段已结束)}。
+    标题按字号推断为 # 标题，表格转为 markdown 表格，插图（位图和矢量图）按区域渲染为图片，图中文字不计入正文。
+    """
+    with tracing.span("text_layer_page", page=page.number + 1) as span:
+        tables = []
+        if len(page.get_drawings()) >= 4:
+            # 没有绘制线条的页面不会检测出表格，跳过较慢的表格检测
+            try:
+                tables = [table for table in page.find_tables().tables if table.row_count > 1]
+            except Exception as e:
+                print(f"表格检测失败（第{page.number + 1}页）: {e}")
+        table_rects = [fitz.Rect(table.bbox) for table in tables]
+        figures = _figure_regions(page, table_rects)
+
+        inserts = []  # (区域, markdown)：插图和表格
+        images = {}
+        for rect in figures:
+            key = f"imgs/img_in_image_box_{int(rect.x0)}_{int(rect.y0)}_{int(rect.x1)}_{int(rect.y1)}.jpg"
+            images[key] = _render(page, rect)
+            inserts.append((rect, _image_tag(key, rect, page.rect.width)))
+        for table, rect in zip(tables, table_rects):
+            inserts.append((rect, table.to_markdown().strip()))
+
+        margin = page.rect.height * 0.05
+        texts = []  # (文本块区域, markdown)，保持内容流中的顺序（多栏论文按栏排列）
+        heading, level, heading_rect = "", None, None
+        section_number = ""
+
+        def flush_heading():
+            nonlocal heading, level, heading_rect
+            if heading:
+                texts.append((heading_rect, "#" * level + " " + heading))
+            heading, level, heading_rect = "", None, None
+
+        for block in page.get_text("dict", flags=TEXT_FLAGS)["blocks"]:
+            paragraph, paragraph_rect = "", None
+            for line in block.get("lines", []):
+                text = "".join(span["text"] for span in line["spans"]).strip()
+                line_rect = fitz.Rect(line["bbox"])
+                center = (line_rect.tl + line_rect.br) / 2
+                if not text or any(center in rect for rect in figures + table_rects):
+                    continue
+                if text.isdigit() and (line_rect.y1 < margin or line_rect.y0 > page.rect.height - margin):
+                    # 页眉页脚中的页码
+                    continue
+                line_level = profile.heading_level(line, text)
+                if line_level is not None and SECTION_NUMBER.match(text):
+                    # 章节编号与标题文字常被排成两行
+                    section_number = text
+                    continue
+                if line_level is not None:
+                    if paragraph:
+                        texts.append((paragraph_rect, paragraph))
+                        paragraph, paragraph_rect = "", None
+                    if section_number:
+                        text = f"{section_number} {text}"
+                        section_number = ""
+                    if heading and line_level == level and line_rect.y0 - heading_rect.y1 < line_rect.height:
+                        # 跨多行的标题
+                        heading = _join_line(heading, text)
+                        heading_rect |= line_rect
+                        continue
+                    flush_heading()
+                    heading, level, heading_rect = text, line_level, line_rect
+                    continue
+                flush_heading()
+                if section_number:
+                    paragraph = _join_line(paragraph, section_number)
+                    section_number = ""
+                paragraph = _join_line(paragraph, text)
+                paragraph_rect = line_rect if paragraph_rect is None else paragraph_rect | line_rect
+            if paragraph:
+                texts.append((paragraph_rect, paragraph))
+        flush_heading()
+
+        # 插图和表格插到同一栏中位于其下方的第一个文本块之前（图注通常在图的下方）
+        before: Dict[int, List[str]] = {}
+        for rect, markdown in sorted(inserts, key=lambda item: (item[0].y0, item[0].x0)):
+            position = next((i for i, (block_rect, _) in enumerate(texts)
+                             if block_rect.y0 >= rect.y0 and block_rect.x0 < rect.x1 and block_rect.x1 > rect.x0),
+                            len(texts))
+            before.setdefault(position, []).append(markdown)
+        ordered = []
+        for i, (_, text) in enumerate(texts):
+            ordered.extend(before.get(i, []))
+            ordered.append(text)
+        ordered.extend(before.get(len(texts), []))
+        markdown = "\n\n".join(ordered)
+
+        first_text = texts[0][1] if texts else ""
+        last_text = texts[-1][1] if texts else ""
+        start_flag = not first_text[:1].islower()
+        end_flag = not last_text or last_text.startswith("#") or last_text.rstrip()[-1] in SENTENCE_END
+        span.set("figures", len(images))
+        span.set("tables", len(tables))
+    return {"markdown_texts": markdown, "markdown_images": images, "page_continuation_flags": (start_flag, end_flag)}
@@ -4,19 +4,58 @@ from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 import os
+import re
+from markdown_chunker import iter_markdown_chunks
+import tracing
 os.environ['HTTP_PROXY'] = 'http://127.0.0.1:7890'
 os.environ['HTTPS_PROXY'] = 'http://127.0.0.1:7890'
 
-def text_chunking(markdown_text):
-    # 先用markdown拆分器，拆分内容
+EMBEDDING_MODEL_NAME = "shibing624/text2vec-base-multilingual"
+
+CHUNK_SIZE = 200
+CHUNK_OVERLAP = 10
+
+CJK_PATTERN = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估计token数：中日韩字符和全角标点约1个token一个字，其余字符约4个字符一个token。
+    用于切分预算，不需要精确。
+    """
+    cjk_count = len(CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+def split_markdown_sections(markdown_text):
+    """按 h1-h4 标题切分markdown，保留标题行和标题元数据"""
     headers_to_split_on = [("#", "h1"), ("##", "h2"), ("###", "h3"), ("####", "h4")]
     markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on, strip_headers = False)
-    md_header_splits = markdown_splitter.split_text(markdown_text)
+    return markdown_splitter.split_text(markdown_text)
+
+def iter_text_chunks(markdown_text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, by_tokens=False):
+    """
+    单遍流式分块，逐个产出分块（带 h1-h4 元数据），结果与 text_chunking_reference 一致
+    by_tokens: chunk_size / chunk_overlap 按估算的token数计，而不是字符数
+    markdown_text 也可以是按顺序到达的文本片段（如逐页的markdown）
+    """
+    if isinstance(markdown_text, str):
+        markdown_text = [markdown_text]
+    length_function = estimate_tokens if by_tokens else len
+    return iter_markdown_chunks(markdown_text, chunk_size, chunk_overlap, length_function)
+
+@tracing.traced()
+def text_chunking(markdown_text):
+    chunks = list(iter_text_chunks(markdown_text))
+    tracing.current_span().set("chunks", len(chunks))
+    return chunks
+
+def text_chunking_reference(markdown_text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=len):
+    """原来的两段式分块，保留作为流式分块器的对照"""
+    # 先用markdown拆分器，拆分内容
+    md_header_splits = split_markdown_sections(markdown_text)
 
     # 再次对拆分后的内容进行二次拆分
-    chunk_size = 200
-    chunk_overleap = 10
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overleap)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                                   length_function=length_function)
     splits = text_splitter.split_documents(md_header_splits)
 
     return splits
\ No newline at end of file
@@ -0,0 +1,298 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+# 轻量的分段计时（span）与计数器。默认关闭：关闭时 span() 返回共享的空对象，
+# traced 装饰的函数只多一次布尔判断。TRACING=1 开启，TRACE_LOG 指定结构化日志（JSON Lines）路径。
+METRIC_PREFIX = "pdfqa"
+RECENT_SPANS = 2000
+# 耗时直方图的桶（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_enabled = os.environ.get("TRACING", "0") == "1"
+_log_path = os.environ.get("TRACE_LOG", "./traces/spans.jsonl")
+_log_file = None
+_lock = threading.Lock()
+_recent: deque = deque(maxlen=RECENT_SPANS)
+_counters: Dict[Tuple[str, tuple], float] = {}
+_histograms: Dict[str, list] = {}
+_current: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(log_path: Optional[str] = None):
+    global _enabled, _log_path
+    _enabled = True
+    if log_path is not None:
+        _close_log()
+        _log_path = log_path
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    _close_log()
+
+
+def _close_log():
+    global _log_file
+    with _lock:
+        if _log_file is not None:
+            _log_file.close()
+            _log_file = None
+
+
+class Span:
+    """一次计时：名称、起止时间、属性，以及所属调用链（trace_id）和父span"""
+
+    def __init__(self, name: str, attrs: dict, parent: Optional["Span"] = None):
+        self.name = name
+        self.attrs = attrs
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self._token = None
+
+    def set(self, key: str, value):
+        self.attrs[key] = value
+
+    def add(self, key: str, value: float = 1):
+        self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def end(self, error: Optional[BaseException] = None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        if error is not None:
+            self.attrs["error"] = type(error).__name__
+        _record(self)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.end(exc)
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": round(self.start_time, 6),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    """关闭时使用的空span，所有操作都不做任何事"""
+
+    def set(self, key, value):
+        pass
+
+    def add(self, key, value=1):
+        pass
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attrs):
+    """
+    计时上下文：with span("retrieve", k=5) as s: ... s.set("hits", n)
+    嵌套的 span 自动成为子span；关闭时返回空对象
+    """
+    if not _enabled:
+        return NOOP_SPAN
+    return Span(name, attrs, _current.get())
+
+
+def start_span(name: str, **attrs):
+    """
+    不进入上下文的span，需手动 end()；用于跨越 yield 的生成器（如流式回答），
+    避免生成器挂起期间把调用方的后续操作错误地记为子span
+    """
+    if not _enabled:
+        return NOOP_SPAN
+    return Span(name, attrs, _current.get())
+
+
+class _Activation:
+    def __init__(self, target: Span):
+        self.target = target
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current.set(self.target)
+        return self.target
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        return False
+
+
+def activate(target):
+    """临时把已有的span设为当前span（不结束它），如在拉取流式生成器的每一步时"""
+    if not isinstance(target, Span):
+        return NOOP_SPAN
+    return _Activation(target)
+
+
+def current_span():
+    """当前上下文中的span，用于在深层函数中补充属性（如重试次数、发送字节数）"""
+    if not _enabled:
+        return NOOP_SPAN
+    return _current.get() or NOOP_SPAN
+
+
+def traced(name: Optional[str] = None):
+    """把整个函数调用记为一个span"""
+
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(span_name, {}, _current.get()):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, value: float = 1, **labels):
+    """计数器累加，labels 作为 Prometheus 标签"""
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def _record(finished: Span):
+    global _log_file
+    entry = finished.to_dict()
+    with _lock:
+        _recent.append(entry)
+        histogram = _histograms.get(finished.name)
+        if histogram is None:
+            histogram = _histograms[finished.name] = [0] * len(BUCKETS) + [0, 0.0]
+        for i, bound in enumerate(BUCKETS):
+            if finished.duration <= bound:
+                histogram[i] += 1
+        histogram[-2] += 1
+        histogram[-1] += finished.duration
+        if _log_path:
+            if _log_file is None:
+                os.makedirs(os.path.dirname(_log_path) or ".", exist_ok=True)
+                # 行缓冲：每个span一行，进程异常退出也不丢已结束的span
+                _log_file = open(_log_path, "a", encoding="utf-8", buffering=1)
+            _log_file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+
+def recent_traces(limit: int = 5) -> List[List[dict]]:
+    """最近 limit 条调用链，每条按开始时间排列、带 depth（嵌套层级）"""
+    with _lock:
+        spans = list(_recent)
+    traces: Dict[str, List[dict]] = {}
+    for entry in spans:
+        traces.setdefault(entry["trace_id"], []).append(entry)
+    result = []
+    for trace_spans in list(traces.values())[-limit:]:
+        by_id = {entry["span_id"]: entry for entry in trace_spans}
+        ordered = []
+        for entry in sorted(trace_spans, key=lambda e: e["start"]):
+            depth, parent = 0, entry["parent_id"]
+            while parent in by_id:
+                depth += 1
+                parent = by_id[parent]["parent_id"]
+            ordered.append({**entry, "depth": depth})
+        result.append(ordered)
+    return result
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    escaped = [f'{key}="{str(value)}"'.replace("\n", " ") for key, value in pairs]
+    return "{" + ",".join(escaped) + "}"
+
+
+def prometheus_text() -> str:
+    """Prometheus 文本格式：计数器为 <前缀>_<名称>_total，各span耗时为直方图 <前缀>_span_seconds"""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((name, list(values)) for name, values in _histograms.items())
+    declared = set()
+    for (name, labels), value in counters:
+        metric = f"{METRIC_PREFIX}_{name}_total"
+        if metric not in declared:
+            lines.append(f"# TYPE {metric} counter")
+            declared.add(metric)
+        lines.append(f"{metric}{_labels(labels)} {value:g}")
+    if histograms:
+        metric = f"{METRIC_PREFIX}_span_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for name, values in histograms:
+            for bound, bucket_count in zip(BUCKETS, values):
+                lines.append(f'{metric}_bucket{{span="{name}",le="{bound:g}"}} {bucket_count}')
+            lines.append(f'{metric}_bucket{{span="{name}",le="+Inf"}} {values[-2]}')
+            lines.append(f'{metric}_count{{span="{name}"}} {values[-2]}')
+            lines.append(f'{metric}_sum{{span="{name}"}} {values[-1]:.6f}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """在后台线程提供 http://host:port/metrics"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"指标接口: http://{host}:{port}/metrics")
+    return server
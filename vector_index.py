@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, Iterable, List, Optional
+
+from langchain_core.documents import Document
+
+import tracing
+from embedding_registry import get_vectorstore, release_vectorstores
+from sparse_index import BM25Index, drop_sparse_index, get_sparse_index, put_sparse_index, reciprocal_rank_fusion
+
+CHROMA_DIR = "./chroma_db"
+COLLECTION_PREFIX = "doc_"
+# 改为按文档分集合之前，所有文档都写在这个默认集合里
+LEGACY_COLLECTION = "langchain"
+# 稀疏（BM25）索引与集合一一对应，保存在 chroma_db/sparse/<集合名>.json
+SPARSE_DIR = os.path.join(CHROMA_DIR, "sparse")
+# 混合检索时每一路先取的候选数
+CANDIDATES_K = 20
+# 流式入库时每攒够这么多分块就向量化写入一批
+INDEX_BATCH_SIZE = 64
+
+
+def collection_name_for(doc_key: str) -> str:
+    """每份文档一个集合，名称由文档的内容哈希键决定"""
+    return f"{COLLECTION_PREFIX}{doc_key[:48]}"
+
+
+def chunk_ids(doc_key: str, chunks: List[Document], seen: Optional[Dict[str, int]] = None) -> List[str]:
+    """
+    稳定的分块id：文档键 + 分块文本 + 该文本在文档中第几次出现。
+    同一文档重复入库得到相同的id，写入即为覆盖（upsert）而不会重复。
+    分批计算时传入同一个 seen，出现次数跨批累计。
+    """
+    seen = {} if seen is None else seen
+    ids = []
+    for chunk in chunks:
+        text_hash = hashlib.sha1(chunk.page_content.encode("utf-8")).hexdigest()
+        occurrence = seen.get(text_hash, 0)
+        seen[text_hash] = occurrence + 1
+        ids.append(hashlib.sha1(f"{doc_key}:{text_hash}:{occurrence}".encode("utf-8")).hexdigest())
+    return ids
+
+
+def get_document_store(doc_key: str):
+    return get_vectorstore(CHROMA_DIR, collection_name_for(doc_key))
+
+
+def sparse_path_for(collection_name: str) -> str:
+    return os.path.join(SPARSE_DIR, f"{collection_name}.json")
+
+
+class ChunkIndexer:
+    """
+    增量写入一份文档的分块：add 攒批向量化写入，按稳定id覆盖写入，同时把分块追加到BM25索引；finish 时保存BM25索引。
+    publish=True 时第一批写入后就在内存中发布该BM25索引，之后各批追加到同一份索引，入库过程中混合检索即可检索到已写入的分块。
+    """
+
+    def __init__(self, doc_key: str, batch_size: int = INDEX_BATCH_SIZE, publish: bool = False):
+        self.doc_key = doc_key
+        self.batch_size = batch_size
+        self.publish = publish
+        self.vectorstore = get_document_store(doc_key)
+        self.sparse_path = sparse_path_for(collection_name_for(doc_key))
+        self._seen: Dict[str, int] = {}
+        self._sparse = BM25Index([], [], [])
+        self._batch: List[Document] = []
+
+    def __len__(self):
+        return len(self._sparse)
+
+    def add(self, chunk: Document):
+        self._batch.append(chunk)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """把攒下的分块向量化写入（不足一批也写）"""
+        if not self._batch:
+            return
+        ids = chunk_ids(self.doc_key, self._batch, self._seen)
+        with tracing.span("embed_batch", chunks=len(self._batch)):
+            self.vectorstore.add_documents(list(self._batch), ids=ids)
+        with tracing.span("extend_sparse_index", chunks=len(self._batch)):
+            self._sparse.extend(ids, [doc.page_content for doc in self._batch],
+                                [dict(doc.metadata) for doc in self._batch])
+        first = len(self._sparse) == len(ids)
+        self._batch.clear()
+        if self.publish and first:
+            put_sparse_index(self.sparse_path, self._sparse, persist=False)
+
+    def finish(self):
+        self.flush()
+        if len(self._sparse):
+            put_sparse_index(self.sparse_path, self._sparse)
+        return self.vectorstore
+
+
+def index_chunks(doc_key: str, chunks: Iterable[Document], batch_size: int = INDEX_BATCH_SIZE):
+    """
+    把分块写入文档自己的集合，按稳定id覆盖写入，同时建立该文档的BM25索引。
+    chunks 可以是生成器：每攒够 batch_size 个分块就向量化写入，不必等全部分块生成
+    """
+    indexer = ChunkIndexer(doc_key, batch_size)
+    with tracing.span("index_chunks") as span:
+        for chunk in chunks:
+            indexer.add(chunk)
+        vectorstore = indexer.finish()
+        span.set("chunks", len(indexer))
+    return vectorstore
+
+
+def get_document_sparse_index(doc_key: str) -> BM25Index:
+    """文档的BM25索引；在此之前入库、没有稀疏索引的文档从向量集合中读出分块补建一次"""
+    path = sparse_path_for(collection_name_for(doc_key))
+    index = get_sparse_index(path)
+    if index is None:
+        data = get_document_store(doc_key).get(include=["documents", "metadatas"])
+        index = BM25Index(data["ids"], data["documents"], [m or {} for m in data["metadatas"]])
+        put_sparse_index(path, index)
+    return index
+
+
+def hybrid_search(doc_key: str, query: str, k: int = 5, candidates: int = CANDIDATES_K) -> List[Document]:
+    """
+    向量检索与BM25检索各取 candidates 个候选，按倒数排名融合后返回前 k 个。
+    向量检索擅长语义相近的表述，BM25 补上数据集名、指标名、公式编号等需要精确匹配的词。
+    """
+    with tracing.span("dense_search", k=candidates):
+        dense_docs = get_document_store(doc_key).similarity_search(query, k=candidates)
+    with tracing.span("sparse_search", k=candidates):
+        sparse_index = get_document_sparse_index(doc_key)
+        sparse_docs = [sparse_index.document(i) for i, _ in sparse_index.search(query, k=candidates)]
+
+    by_text = {}
+    for doc in dense_docs + sparse_docs:
+        by_text.setdefault(doc.page_content, doc)
+    fused = reciprocal_rank_fusion([[doc.page_content for doc in dense_docs],
+                                    [doc.page_content for doc in sparse_docs]])
+    return [by_text[text] for text in fused[:k]]
+
+
+def is_indexed(doc_key: str) -> bool:
+    name = collection_name_for(doc_key)
+    return name in list_collections() and get_document_store(doc_key)._collection.count() > 0
+
+
+def _client():
+    import chromadb
+    return chromadb.PersistentClient(path=CHROMA_DIR)
+
+
+def list_collections() -> List[str]:
+    # chromadb 0.6 起 list_collections 直接返回名称
+    return [getattr(c, "name", c) for c in _client().list_collections()]
+
+
+def delete_document(doc_key: str):
+    """删除文档的集合（解析缓存淘汰条目时调用）"""
+    name = collection_name_for(doc_key)
+    release_vectorstores(CHROMA_DIR, name)
+    drop_sparse_index(sparse_path_for(name))
+    if name in list_collections():
+        _client().delete_collection(name)
+        print(f"已删除向量集合: {name}")
+
+
+def document_size(doc_key: str, page_size: int = 1000) -> int:
+    """
+    文档在 chroma_db 中占用的磁盘空间估计（字节）：分块数 × 向量维度 × 4（float32向量）
+    + 分块文本和元数据（JSON）的UTF-8字节数 + BM25索引文件。只用Chroma客户端的公开接口，集合不存在时只计BM25索引。
+    """
+    name = collection_name_for(doc_key)
+    total = 0
+    sparse_path = sparse_path_for(name)
+    if os.path.exists(sparse_path):
+        total += os.path.getsize(sparse_path)
+    if name not in list_collections():
+        return total
+    collection = _client().get_collection(name)
+    count = collection.count()
+    if not count:
+        return total
+    sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+    total += count * len(sample[0]) * 4
+    for offset in range(0, count, page_size):
+        page = collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+        for document, metadata in zip(page["documents"], page["metadatas"]):
+            total += len((document or "").encode("utf-8"))
+            total += len(json.dumps(metadata or {}, ensure_ascii=False).encode("utf-8"))
+    return total
+
+
+def gc_collections(live_doc_keys: Iterable[str]) -> List[str]:
+    """删除不再属于任何已缓存文档的集合，以及旧版的全局默认集合，返回被删除的集合名"""
+    live = {collection_name_for(key) for key in live_doc_keys}
+    client = _client()
+    removed = []
+    for name in list_collections():
+        if name == LEGACY_COLLECTION or (name.startswith(COLLECTION_PREFIX) and name not in live):
+            release_vectorstores(CHROMA_DIR, name)
+            drop_sparse_index(sparse_path_for(name))
+            client.delete_collection(name)
+            removed.append(name)
+    # 集合已不存在的稀疏索引文件
+    if os.path.isdir(SPARSE_DIR):
+        for file_name in os.listdir(SPARSE_DIR):
+            name = os.path.splitext(file_name)[0]
+            if file_name.endswith(".json") and name not in live:
+                drop_sparse_index(os.path.join(SPARSE_DIR, file_name))
+    return removed
+
+
+if __name__ == "__main__":
+    # 用法: python vector_index.py gc    清理孤立的向量集合
+    #       python vector_index.py list  列出所有集合
+    from parse_cache import ParseCache
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "gc":
+        removed = gc_collections(ParseCache().keys())
+        print(f"共清理 {len(removed)} 个孤立集合")
+        for name in removed:
+            print(" ", name)
+    elif command == "list":
+        for name in list_collections():
+            print(name)
+    else:
+        print(f"未知命令: {command}")
+        sys.exit(1)